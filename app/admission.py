@@ -0,0 +1,60 @@
+"""
+Admission control for a single worker.
+Past saturation every room on a worker degrades together, so new rooms, games and sockets
+are refused with a fast 503 (or WS close 1013) and a retry-after hint once a limit is hit.
+
+Configuration:
+    MAX_ROOMS            rooms served by this worker (with a running game or open sockets)
+    MAX_CONNECTIONS      open WebSocket connections (players and spectators)
+    MAX_TIMERS           running game timers
+    RETRY_AFTER_SECONDS  hint sent with refusals
+"""
+import os
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+if not os.getenv("DATABASE_URL"):
+    load_dotenv()
+
+MAX_ROOMS = int(os.getenv("MAX_ROOMS", "2000"))
+MAX_CONNECTIONS = int(os.getenv("MAX_CONNECTIONS", "10000"))
+MAX_TIMERS = int(os.getenv("MAX_TIMERS", "2000"))
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", "10"))
+
+def current_load():
+    # Imported here: the game modules import the ConnectionManager, which imports this module
+    from app.game import state, spectators
+    from app.game.websockets import manager
+    from app.game.game_timer import get_active_timers
+    from app.game.meme_timer import get_active_meme_timers
+    from app.game.voting_timer import get_active_voting_timers
+
+    rooms = state.local_room_ids() | set(manager.active_connections.keys())
+    return {
+        "rooms": len(rooms),
+        "connections": manager.connection_count + spectators.spectator_count(),
+        "timers": len(get_active_timers()) + len(get_active_meme_timers()) + len(get_active_voting_timers()),
+    }
+
+LIMITS = {
+    "rooms": MAX_ROOMS,
+    "connections": MAX_CONNECTIONS,
+    "timers": MAX_TIMERS,
+}
+
+def load_score(load: dict = None):
+    """Utilization of the most saturated resource: 0 is idle, 1 or more is full"""
+    load = load or current_load()
+    return max(load[resource] / limit for resource, limit in LIMITS.items())
+
+def check_capacity(*resources: str):
+    """Raise a 503 with Retry-After if any of the given resources is at its limit"""
+    load = current_load()
+    for resource in resources:
+        if load[resource] >= LIMITS[resource]:
+            print(f"[ADMISSION] Refusing request: {resource} at {load[resource]}/{LIMITS[resource]}")
+            raise HTTPException(
+                status_code=503,
+                detail=f"Server is at capacity ({resource}), retry later",
+                headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+            )
@@ -0,0 +1,178 @@
+"""
+Meme image assets.
+At startup every image referenced by memes.json is copied into ASSET_CACHE_DIR under a
+content-hashed name, together with resized WebP and JPEG variants per device class. The hashed
+names never change meaning, so they are served with immutable cache headers; a new image gets a
+new name. Resizing needs Pillow; without it only the hashed originals are served.
+
+Configuration:
+    MEME_IMAGES_DIR   directory with the source images named as in memes.json
+    ASSET_CACHE_DIR   where the hashed files are written (reused across restarts)
+"""
+import hashlib
+import logging
+import os
+import shutil
+
+try:
+    from PIL import Image
+except ImportError:  # resized variants are skipped
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MEME_IMAGES_DIR = os.getenv("MEME_IMAGES_DIR", os.path.join(BASE_DIR, "meme_images"))
+ASSET_CACHE_DIR = os.getenv("ASSET_CACHE_DIR", os.path.join(BASE_DIR, "asset_cache"))
+ASSET_URL_PREFIX = "/assets/memes/"
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# device class -> longest side in pixels
+DEVICE_CLASSES = {
+    "low": 480,
+    "mid": 960,
+    "high": 1600,
+}
+DEFAULT_DEVICE_CLASS = "mid"
+# Client hints device_class_for reads; browsers only send them to servers that ask with Accept-CH
+CLIENT_HINTS = ("Sec-CH-Viewport-Width", "Sec-CH-DPR", "Viewport-Width", "DPR")
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+MEDIA_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".gif": "image/gif",
+}
+
+# meme id -> {"original": name, "<class>.webp": name, "<class>.jpg": name}
+_manifest = {}
+# hashed file name -> (path, os.stat_result, media type)
+_files = {}
+
+def _content_hash(path: str) -> str:
+    h = hashlib.blake2b(digest_size=8)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _register(name: str):
+    path = os.path.join(ASSET_CACHE_DIR, name)
+    ext = os.path.splitext(name)[1].lower()
+    _files[name] = (path, os.stat(path), MEDIA_TYPES.get(ext, "application/octet-stream"))
+
+def _resize(source: str, target: str, longest_side: int, fmt: str):
+    with Image.open(source) as image:
+        image = image.convert("RGB")
+        image.thumbnail((longest_side, longest_side))
+        tmp = target + ".tmp"
+        if fmt == "WEBP":
+            image.save(tmp, "WEBP", quality=WEBP_QUALITY, method=4)
+        else:
+            image.save(tmp, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+        os.replace(tmp, target)
+
+def _build_meme(meme: dict):
+    source = os.path.join(MEME_IMAGES_DIR, meme["filename"])
+    if not os.path.exists(source):
+        return None
+    digest = _content_hash(source)
+    stem = f"{meme['id']}.{digest}"
+    names = {"original": f"{stem}{os.path.splitext(meme['filename'])[1].lower()}"}
+    if Image is not None:
+        for device_class in DEVICE_CLASSES:
+            names[f"{device_class}.webp"] = f"{stem}.{device_class}.webp"
+            names[f"{device_class}.jpg"] = f"{stem}.{device_class}.jpg"
+
+    for variant, name in names.items():
+        target = os.path.join(ASSET_CACHE_DIR, name)
+        # Hashed names: an existing file is already the right one
+        if not os.path.exists(target):
+            if variant == "original":
+                shutil.copyfile(source, target)
+            else:
+                device_class, ext = variant.split(".")
+                _resize(source, target, DEVICE_CLASSES[device_class], "WEBP" if ext == "webp" else "JPEG")
+        _register(name)
+    return names
+
+def build_assets(memes: list):
+    """Hash and resize every meme image; blocking, run it in a thread"""
+    os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+    built, missing = 0, 0
+    for meme in memes:
+        try:
+            names = _build_meme(meme)
+        except Exception as e:
+            logger.error(f"[ASSETS] Failed to build {meme.get('filename')}: {e}")
+            continue
+        if names is None:
+            missing += 1
+            continue
+        _manifest[meme["id"]] = names
+        built += 1
+    logger.info(f"[ASSETS] {built} meme images ready, {missing} missing, resizing {'on' if Image else 'off (no Pillow)'}")
+
+def asset_file(name: str):
+    """(path, stat_result, media type) of a hashed asset, or None"""
+    return _files.get(name)
+
+def source_path(meme: dict):
+    """Local file to render a meme from: the high variant if resized, else the original"""
+    names = _manifest.get(meme["id"])
+    if not names:
+        return None
+    return os.path.join(ASSET_CACHE_DIR, names.get("high.jpg", names["original"]))
+
+def device_class_for(request, requested: str = None) -> str:
+    """Pick a device class from ?device=, Save-Data or the viewport / DPR client hints"""
+    if requested in DEVICE_CLASSES:
+        return requested
+    headers = request.headers
+    if headers.get("save-data", "").lower() == "on":
+        return "low"
+    try:
+        width = float(headers.get("sec-ch-viewport-width") or headers.get("viewport-width") or 0)
+        dpr = float(headers.get("sec-ch-dpr") or headers.get("dpr") or 1)
+    except ValueError:
+        return DEFAULT_DEVICE_CLASS
+    if not width:
+        return DEFAULT_DEVICE_CLASS
+    pixels = width * dpr
+    for device_class, size in sorted(DEVICE_CLASSES.items(), key=lambda item: item[1]):
+        if pixels <= size:
+            return device_class
+    return "high"
+
+def variant_headers() -> dict:
+    """
+    Headers of a response that depends on device_class_for and the Accept header, so shared
+    caches key it on them and browsers start sending the client hints
+    """
+    return {
+        "Accept-CH": ", ".join(CLIENT_HINTS),
+        "Vary": ", ".join(("Accept", "Save-Data", *CLIENT_HINTS)),
+    }
+
+def image_urls(meme_id: str, device_class: str, webp: bool):
+    """{"image_url", "original_url", "variants"} for a meme, or None if its image isn't available"""
+    names = _manifest.get(meme_id)
+    if not names:
+        return None
+    ext = "webp" if webp else "jpg"
+    chosen = names.get(f"{device_class}.{ext}", names["original"])
+    return {
+        "image_url": ASSET_URL_PREFIX + chosen,
+        "original_url": ASSET_URL_PREFIX + names["original"],
+        "variants": {
+            device_class: ASSET_URL_PREFIX + names[f"{device_class}.{ext}"]
+            for device_class in DEVICE_CLASSES
+            if f"{device_class}.{ext}" in names
+        },
+    }
+
+def get_asset_stats():
+    return {"memes": len(_manifest), "files": len(_files), "resizing": Image is not None}
@@ -0,0 +1,520 @@
+"""
+Micro-benchmarks of the worker's hot paths.
+They reproduce the numbers quoted when these paths were optimized.
+
+    python -m app.bench frames --frames 100000
+    python -m app.bench flood --rooms 50 --players 4 --seconds 10 --flood too_large
+    python -m app.bench create-rooms --rooms 2000 --batch 50 [--baseline]
+    python -m app.bench spectators --viewers 1000 --changes 50
+    python -m app.bench restore --rooms 10000 --changed 0.01
+
+frames        cost of accepting and of rejecting WebSocket input frames (ratelimit.receive_message),
+              by rejection reason, and how a burst of get_status frames on one socket is let through
+flood         --rooms healthy rooms on a real server (uvicorn, in-process), each with --players
+              sockets getting a broadcast every 100 ms and sending a time_sync every 500 ms, first
+              alone, then while a client in another process floods the server with frames that
+              are too large (--flood too_large) or too fast (--flood too_fast): p50 / p99 latency
+              of the healthy rooms' broadcasts and time_sync round trips in both runs
+create-rooms  POST /create_room throughput through the whole app (httpx ASGITransport, lifespan
+              tasks running), with concurrent batches of requests, on DATABASE_URL; --baseline
+              creates them the way /create_room did before write-behind inserts instead (one
+              INSERT + refresh per request for an autoincrement id, in the threadpool)
+spectators    one CAH room watched by --viewers in-process sockets, first as spectators, then as
+              players: time from start_game to the last socket seeing it, and what a burst of
+              --changes state changes within one second costs (sends per socket, CPU time)
+restore       --rooms CAH games checkpointed on DATABASE_URL, then restored as on startup
+              (restore_games), followed by incremental checkpoint passes with nothing and with
+              a --changed fraction of the rooms changed
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+
+# The benchmarks that need a database get a throwaway SQLite file, and the app's startup
+# writes its image cache there too
+if not os.getenv("DATABASE_URL"):
+    import tempfile
+    _scratch = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_scratch, 'bench.db')}"
+    os.environ.setdefault("ASSET_CACHE_DIR", os.path.join(_scratch, "asset_cache"))
+if not os.getenv("SESSION_SECRET"):
+    # Tokens issued by the benchmarks are thrown away with their rooms
+    import secrets
+    os.environ["SESSION_SECRET"] = secrets.token_hex(16)
+
+class _FrameSource:
+    """Stands in for a WebSocket: hands out the queued frames, swallows rejection notices"""
+    def __init__(self, frames: list, before_last=None):
+        self.frames = frames
+        self.position = 0
+        self.before_last = before_last
+        self.scope = {"path": "/ws/bench"}
+
+    async def receive_text(self):
+        if self.position == len(self.frames) - 1 and self.before_last:
+            self.before_last()
+        frame = self.frames[self.position]
+        self.position += 1
+        return frame
+
+    async def send_json(self, message: dict):
+        pass
+
+async def _frames(count: int, burst: int):
+    from app.game import ratelimit
+    from app.game.ratelimit import TokenBucket, receive_message
+
+    accepted_frame = json.dumps({"type": "get_status"})
+    # Cost of the checks alone, without the pause that follows a rejected frame
+    pause, ratelimit.WS_REJECT_PAUSE = ratelimit.WS_REJECT_PAUSE, 0
+    unlimited = TokenBucket(1e12, 1e12)
+    room_id = 0
+    result = {}
+    for reason in ("too_large", "client_rate", "room_rate", "invalid"):
+        client, room = TokenBucket(1e12, 1e12), TokenBucket(1e12, 1e12)
+        frame = accepted_frame
+        if reason == "too_large":
+            frame = "x" * (ratelimit.WS_MAX_MESSAGE_BYTES + 1)
+        elif reason == "invalid":
+            frame = "{not json"
+        else:
+            empty = client if reason == "client_rate" else room
+            empty.tokens = empty.burst = empty.rate = 0
+
+        def refill(client=client, room=room):
+            for bucket in (client, room):
+                bucket.tokens = bucket.burst = bucket.rate = 1e12
+
+        ratelimit._room_buckets[room_id] = room
+        # The rejected frames, then one that gets through so receive_message returns
+        source = _FrameSource([frame] * count + [accepted_frame], refill)
+        started = time.perf_counter()
+        await receive_message(source, room_id, client)
+        result[f"{reason}_ns_per_frame"] = round((time.perf_counter() - started) / count * 1e9)
+
+    ratelimit._room_buckets[room_id] = unlimited
+    source = _FrameSource([accepted_frame] * count)
+    started = time.perf_counter()
+    for _ in range(count):
+        await receive_message(source, room_id, unlimited)
+    result["accepted_ns_per_frame"] = round((time.perf_counter() - started) / count * 1e9)
+
+    # What a maximal frame would cost if it reached json.loads
+    large = json.dumps(["x" * 60] * 1000)
+    started = time.perf_counter()
+    for _ in range(100):
+        json.loads(large)
+    result["json_loads_64k_ns"] = round((time.perf_counter() - started) / 100 * 1e9)
+
+    # A client flooding get_status on one socket, with the default buckets and pause
+    ratelimit.WS_REJECT_PAUSE = pause
+    ratelimit._room_buckets.pop(room_id, None)
+    before = dict(ratelimit.stats)
+    source = _FrameSource([accepted_frame] * burst)
+    bucket = ratelimit.client_bucket()
+    accepted = 0
+    try:
+        while True:
+            await receive_message(source, room_id, bucket)
+            accepted += 1
+    except IndexError:
+        pass
+    result["burst"] = {
+        "frames": burst,
+        "accepted": accepted,
+        "dropped": {
+            reason: total - before.get(reason, 0)
+            for reason, total in ratelimit.stats.items()
+            if reason != "accepted" and total != before.get(reason, 0)
+        },
+    }
+    return result
+
+def bench_frames(count: int = 100_000, burst: int = 40) -> dict:
+    return asyncio.run(_frames(count, burst))
+
+def _free_port() -> int:
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _percentiles(samples: list) -> dict:
+    if not samples:
+        return {"samples": 0}
+    samples = sorted(samples)
+    def at(q):
+        return round(samples[min(len(samples) - 1, int(len(samples) * q))] * 1000, 2)
+    return {"samples": len(samples), "p50_ms": at(0.5), "p99_ms": at(0.99), "max_ms": round(samples[-1] * 1000, 2)}
+
+def _flooder(url: str, kind: str, stop, sent):
+    """Runs in its own process: one socket sending frames as fast as the server reads them"""
+    import websockets
+
+    async def flood():
+        frame = "x" * 60_000 if kind == "too_large" else json.dumps({"type": "get_status"})
+        async with websockets.connect(url, max_size=None, compression=None) as ws:
+            async def drain():
+                async for _ in ws:
+                    pass
+            drainer = asyncio.create_task(drain())
+            while not stop.is_set():
+                await ws.send(frame)
+                # Stays put once the server stops reading
+                sent.value += 1
+            drainer.cancel()
+
+    asyncio.run(flood())
+
+async def _healthy_client(url: str, broadcast_latency: list, sync_latency: list, stop: asyncio.Event):
+    import websockets
+
+    async with websockets.connect(url) as ws:
+        async def sync():
+            while not stop.is_set():
+                await ws.send(json.dumps({"type": "time_sync", "client_time": time.perf_counter()}))
+                await asyncio.sleep(0.5)
+
+        syncer = asyncio.create_task(sync())
+        try:
+            while not stop.is_set():
+                try:
+                    message = json.loads(await asyncio.wait_for(ws.recv(), 0.5))
+                except asyncio.TimeoutError:
+                    continue
+                now = time.perf_counter()
+                if message.get("type") == "bench":
+                    broadcast_latency.append(now - message["sent"])
+                elif message.get("type") == "time_sync" and isinstance(message.get("client_time"), float):
+                    sync_latency.append(now - message["client_time"])
+        finally:
+            syncer.cancel()
+
+async def _broadcaster(room_ids: list, stop: asyncio.Event):
+    from app.game.websockets import manager
+
+    while not stop.is_set():
+        for room_id in room_ids:
+            await manager.broadcast(room_id, {"type": "bench", "sent": time.perf_counter()})
+        await asyncio.sleep(0.1)
+
+async def _flood(rooms: int, players: int, seconds: float, kind: str):
+    import multiprocessing
+    import uvicorn
+    from app.main import app
+    from app.game import ratelimit
+
+    port = _free_port()
+    # Same WebSocket settings as the Procfile
+    server = uvicorn.Server(uvicorn.Config(
+        app, host="127.0.0.1", port=port, log_level="warning",
+        ws_max_size=65536, ws_ping_interval=20, ws_ping_timeout=20,
+    ))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    base = f"ws://127.0.0.1:{port}/ws"
+    room_ids = list(range(1, rooms + 1))
+    # The flooding process competes with the server for CPU when there are few cores
+    result = {"rooms": rooms, "players": players, "seconds": seconds, "flood": kind, "cpus": os.cpu_count()}
+    try:
+        for run in ("alone", "flooded"):
+            broadcast_latency, sync_latency = [], []
+            stop = asyncio.Event()
+            clients = [
+                asyncio.create_task(_healthy_client(f"{base}/{room_id}?client_id=bench-{room_id}-{i}", broadcast_latency, sync_latency, stop))
+                for room_id in room_ids for i in range(players)
+            ]
+            # Connected and past the initial state
+            await asyncio.sleep(1)
+            flooder = None
+            if run == "flooded":
+                context = multiprocessing.get_context("spawn")
+                flood_stop, sent = context.Event(), context.Value("q", 0)
+                flooder = context.Process(target=_flooder, args=(f"{base}/{rooms + 1}?client_id=flooder", kind, flood_stop, sent))
+                flooder.start()
+                await asyncio.sleep(1)
+            before = dict(ratelimit.stats)
+            broadcast_latency.clear()
+            sync_latency.clear()
+            broadcaster = asyncio.create_task(_broadcaster(room_ids, stop))
+            await asyncio.sleep(seconds)
+            stop.set()
+            await asyncio.gather(broadcaster, *clients, return_exceptions=True)
+            result[run] = {
+                "broadcast": _percentiles(broadcast_latency),
+                "time_sync_round_trip": _percentiles(sync_latency),
+                "frames_dropped": {
+                    reason: total - before.get(reason, 0)
+                    for reason, total in ratelimit.stats.items()
+                    if reason != "accepted" and total != before.get(reason, 0)
+                },
+            }
+            if flooder is not None:
+                result[run]["flood_frames_sent"] = sent.value
+                flood_stop.set()
+                await asyncio.to_thread(flooder.join, 2)
+                # Blocked in a send the server isn't reading
+                flooder.terminate()
+    finally:
+        server.should_exit = True
+        await serving
+    return result
+
+def bench_flood(rooms: int = 50, players: int = 4, seconds: float = 10, kind: str = "too_large") -> dict:
+    # Every connection and broadcast prints a line
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return asyncio.run(_flood(rooms, players, seconds, kind))
+
+def _create_room_baseline(response, x_client_id, db):
+    """POST /create_room before write-behind inserts, with today's token and cookies"""
+    from app.models import Room
+    from app.routes.room import set_session_cookies
+    from app.session import issue_token, ROLE_CREATOR
+
+    room = Room(status="waiting", creator=x_client_id)
+    db.add(room)
+    db.commit()
+    db.refresh(room)
+    token = issue_token(room.id, x_client_id, ROLE_CREATOR)
+    set_session_cookies(response, room.id, token)
+    return {"room_id": room.id, "token": token}
+
+async def _create_rooms(count: int, batch: int, baseline: bool):
+    import httpx
+    from fastapi import Depends, Header, Response
+    from app.db import get_db
+    from app.main import app
+    from app.rooms import flush_rooms
+
+    path = "/create_room"
+    if baseline:
+        path = "/bench/create_room_baseline"
+
+        def create_room_baseline(response: Response, x_client_id: str = Header(None), db=Depends(get_db)):
+            return _create_room_baseline(response, x_client_id, db)
+
+        app.add_api_route(path, create_room_baseline, methods=["POST"])
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            started = time.perf_counter()
+            created = 0
+            for first in range(0, count, batch):
+                responses = await asyncio.gather(*(
+                    client.post(path, headers={"x-client-id": f"bench-{n}"})
+                    for n in range(first, min(first + batch, count))
+                ))
+                created += sum(1 for r in responses if r.status_code == 200 and "room_id" in r.json())
+            answered = time.perf_counter() - started
+            # Rows still queued by the write-behind task
+            await flush_rooms()
+            persisted = time.perf_counter() - started
+    return {
+        "rooms": created,
+        "baseline": baseline,
+        "batch": batch,
+        "seconds": round(answered, 2),
+        "rooms_per_second": round(created / answered),
+        "seconds_until_persisted": round(persisted, 2),
+    }
+
+def bench_create_rooms(count: int = 2000, batch: int = 50, baseline: bool = False) -> dict:
+    # Every request prints a line or two
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return asyncio.run(_create_rooms(count, batch, baseline))
+
+class _Viewer:
+    """Stands in for a watching WebSocket: only records when it is sent something"""
+    def __init__(self):
+        self.received = 0
+        self.first = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.received += 1
+        if self.first is None:
+            self.first = time.perf_counter()
+
+    def reset(self):
+        self.received = 0
+        self.first = None
+
+async def _until_all_received(viewers: list, timeout: float = 10):
+    deadline = time.perf_counter() + timeout
+    while any(v.first is None for v in viewers) and time.perf_counter() < deadline:
+        await asyncio.sleep(0.001)
+
+def _bump_score(game: dict):
+    game["scores"][game["players"][1]] += 1
+    game["version"] += 1
+
+async def _spectators(count: int, changes: int):
+    from app.game import actor, cah, clock, spectators, state
+    from app.game.websockets import manager
+
+    room_id = 1
+    roster = {f"bench-{i}": f"player{i}" for i in range(4)}
+    result = {"viewers": count}
+    for mode in ("spectators", "players"):
+        viewers = [_Viewer() for _ in range(count)]
+        for viewer in viewers:
+            if mode == "spectators":
+                await spectators.join(room_id, viewer)
+            else:
+                await manager.connect(room_id, viewer)
+        await asyncio.sleep(0.1)
+        for viewer in viewers:
+            viewer.reset()
+
+        # Same as POST /cah/start_game
+        started = time.perf_counter()
+        await actor.run(room_id, cah.start_cah_game, room_id, list(roster.values()), "bench-0", roster)
+        game = cah.games[room_id]
+        await manager.broadcast(room_id, {
+            "type": "game_update",
+            "status": "playing",
+            "players": game["players"],
+            "current_question": game["current_question"],
+            "card_czar": game["card_czar"],
+            "scores": game["scores"],
+            "round": game["round"],
+            **clock.timing(game),
+        })
+        await _until_all_received(viewers)
+        start_game_ms = (max(v.first for v in viewers) - started) * 1000
+
+        await asyncio.sleep(1)
+        for viewer in viewers:
+            viewer.reset()
+        cpu = time.process_time()
+        for _ in range(changes):
+            await actor.run(room_id, _bump_score, game)
+            await manager.broadcast(room_id, {"type": "game_update", "scores": game["scores"]})
+            await asyncio.sleep(1 / changes)
+        # Let the last coalesced view go out
+        await asyncio.sleep(1)
+        result[mode] = {
+            "start_game_to_last_socket_ms": round(start_game_ms, 1),
+            "burst_sends_per_socket": round(sum(v.received for v in viewers) / count, 1),
+            "burst_cpu_ms": round((time.process_time() - cpu) * 1000, 1),
+        }
+
+        for viewer in viewers:
+            if mode == "spectators":
+                spectators.leave(room_id, viewer)
+            else:
+                manager.disconnect(room_id, viewer)
+        await actor.run(room_id, state.drop_room, room_id)
+    return result
+
+def bench_spectators(count: int = 1000, changes: int = 50) -> dict:
+    # Broadcasts print a line each
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return asyncio.run(_spectators(count, changes))
+
+def _bump_scores(room_ids):
+    from app.game import cah
+
+    for room_id in room_ids:
+        _bump_score(cah.games[room_id])
+
+async def _restore(count: int, changed: float):
+    from sqlalchemy import insert
+    from app.db import SessionLocal, init_db
+    from app.models import Room
+    from app.game import cah, state
+    from app.tasks import checkpoint
+
+    init_db()
+    first = 1
+    room_ids = list(range(first, first + count))
+    with SessionLocal() as db:
+        db.execute(insert(Room), [{"id": room_id, "status": "playing", "creator": "bench-0"} for room_id in room_ids])
+        db.commit()
+    for room_id in room_ids:
+        roster = {f"bench-{room_id}-{i}": f"player{i}" for i in range(6)}
+        cah.start_cah_game(room_id, list(roster.values()), next(iter(roster)), roster)
+
+    result = {"rooms": count}
+    started = time.perf_counter()
+    await checkpoint.checkpoint_games()
+    result["first_checkpoint_seconds"] = round(time.perf_counter() - started, 2)
+
+    # A restarted worker: nothing in memory
+    for room_id in room_ids:
+        state.drop_room(room_id)
+    checkpoint._written.clear()
+    started = time.perf_counter()
+    restored = checkpoint.restore_games()
+    result["restored"] = restored
+    result["restore_seconds"] = round(time.perf_counter() - started, 2)
+
+    # Let the restored rooms' timers start, they would slow down the first pass otherwise
+    await asyncio.sleep(1)
+    started = time.perf_counter()
+    await checkpoint.checkpoint_games()
+    result["unchanged_pass_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    touched = room_ids[:max(1, int(count * changed))]
+    _bump_scores(touched)
+    started = time.perf_counter()
+    await checkpoint.checkpoint_games()
+    result["changed_rooms"] = len(touched)
+    result["changed_pass_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    for room_id in room_ids:
+        state.drop_room(room_id)
+    return result
+
+def bench_restore(count: int = 10_000, changed: float = 0.01) -> dict:
+    # Every started game prints a line
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return asyncio.run(_restore(count, changed))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    frames = commands.add_parser("frames", help="WebSocket input limits")
+    frames.add_argument("--frames", type=int, default=100_000)
+    frames.add_argument("--burst", type=int, default=40)
+    flood = commands.add_parser("flood", help="healthy rooms' latency while one client floods the server")
+    flood.add_argument("--rooms", type=int, default=50)
+    flood.add_argument("--players", type=int, default=4)
+    flood.add_argument("--seconds", type=float, default=10)
+    flood.add_argument("--flood", choices=("too_large", "too_fast"), default="too_large")
+    create_rooms = commands.add_parser("create-rooms", help="room creation throughput")
+    create_rooms.add_argument("--rooms", type=int, default=2000)
+    create_rooms.add_argument("--batch", type=int, default=50)
+    create_rooms.add_argument("--baseline", action="store_true", help="one INSERT per request, as before write-behind")
+    spectators = commands.add_parser("spectators", help="spectator fan-out against player broadcasts")
+    spectators.add_argument("--viewers", type=int, default=1000)
+    spectators.add_argument("--changes", type=int, default=50)
+    restore = commands.add_parser("restore", help="checkpoint restore and incremental checkpoint passes")
+    restore.add_argument("--rooms", type=int, default=10_000)
+    restore.add_argument("--changed", type=float, default=0.01)
+    args = parser.parse_args(argv)
+
+    if args.command == "frames":
+        result = bench_frames(args.frames, args.burst)
+    elif args.command == "flood":
+        result = bench_flood(args.rooms, args.players, args.seconds, args.flood)
+    elif args.command == "create-rooms":
+        result = bench_create_rooms(args.rooms, args.batch, args.baseline)
+    elif args.command == "spectators":
+        result = bench_spectators(args.viewers, args.changes)
+    elif args.command == "restore":
+        result = bench_restore(args.rooms, args.changed)
+    print(json.dumps(result, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""
+Per-room actors.
+Every mutation of a room's game state goes through the room's actor: a single task consuming an
+inbox queue, so commands coming from WS handlers, REST routes and timers are applied one at a
+time and in order, even when they await in the middle. Broadcasts issued while the actor works
+through its inbox are held back and sent together once the inbox is drained.
+"""
+import asyncio
+import inspect
+import logging
+from app.game.websockets import manager
+from app import profiling
+
+logger = logging.getLogger(__name__)
+
+# Seconds without commands before an actor task exits (a new one is created on demand)
+ACTOR_IDLE_TIMEOUT = 60
+
+_actors = {}
+
+class RoomActor:
+    def __init__(self, room_id: int):
+        self.room_id = room_id
+        self.inbox = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            while True:
+                try:
+                    command = await asyncio.wait_for(self.inbox.get(), ACTOR_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    if self.inbox.empty():
+                        break
+                    continue
+
+                manager.hold(self.room_id)
+                try:
+                    await self._apply(command)
+                    while not self.inbox.empty():
+                        await self._apply(self.inbox.get_nowait())
+                finally:
+                    await manager.release(self.room_id)
+        finally:
+            if _actors.get(self.room_id) is self:
+                del _actors[self.room_id]
+            # Fail whatever is still queued (only happens on cancellation)
+            while not self.inbox.empty():
+                _, _, future, _ = self.inbox.get_nowait()
+                if not future.done():
+                    future.set_exception(RuntimeError(f"Actor for room {self.room_id} stopped"))
+
+    async def _apply(self, command):
+        fn, args, future, label = command
+        # Profiled time of the command counts for the handler that issued it
+        token = profiling.begin(label, timed=False) if label is not None and profiling.active else None
+        try:
+            result = await _call(fn, args)
+        except Exception as e:
+            logger.error(f"[ACTOR] Room {self.room_id}: command {getattr(fn, '__name__', fn)} failed: {e}")
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+        finally:
+            if token is not None:
+                profiling.end(token)
+
+async def _call(fn, args):
+    result = fn(*args)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+async def run(room_id: int, fn, *args):
+    """Apply fn(*args) (sync or async) inside the room's actor and return its result"""
+    actor = _actors.get(room_id)
+    # Commands issued from inside the actor run inline, otherwise they would wait on themselves
+    if actor and asyncio.current_task() is actor.task:
+        return await _call(fn, args)
+    if actor is None:
+        actor = _actors[room_id] = RoomActor(room_id)
+    future = asyncio.get_running_loop().create_future()
+    label = profiling.current_label() if profiling.active else None
+    actor.inbox.put_nowait((fn, args, future, label))
+    return await future
+
+def get_active_actors():
+    """Get list of room IDs with a running actor (for debugging)"""
+    return list(_actors.keys())
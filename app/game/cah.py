@@ -1,11 +1,12 @@
-import json, random, time
-from app.models import Player, Room
-from datetime import datetime, timezone
+import json
+from app.models import Player
 from app.game.websockets import manager
 from app.game.game_timer import start_game_timer, stop_game_timer
-from app.db import get_db
-import asyncio
-import logging
+from app.game.tally import new_tally, add_vote, remove_vote, sole_leader
+from app.game.status_cache import shared_status
+from app.game.utils import touch_player
+from app.game import decks, clock
+from app import history
 
 # Load cards and questions
 with open("cah_cards.json") as f:
@@ -16,16 +17,14 @@ with open("cah_questions.json") as f:
 
 games = {}
 
-def start_cah_game(room_id: int, players: list[str], creator_id: str):
+def start_cah_game(room_id: int, players: list[str], creator_id: str, roster: dict = None, deck_ids: list = None):
     """Initialize a new Cards Against Humanity game"""
-    # Shuffle question pool
-    question_pool = QUESTION_POOL.copy()
-    random.shuffle(question_pool)
+    # Draw piles over the (shared) merged view of the chosen decks, shuffled lazily
+    question_pool = decks.question_pile(deck_ids)
     
     # Deal cards to each player (7 cards to start)
     player_hands = {}
-    card_pool = CARD_POOL.copy()
-    random.shuffle(card_pool)
+    card_pool = decks.card_pile(deck_ids)
     
     for player in players:
         player_hands[player] = []
@@ -35,94 +34,64 @@ def start_cah_game(room_id: int, players: list[str], creator_id: str):
     
     games[room_id] = {
         "players": players,
+        # client_id -> username; in-game names stay fixed since hands and scores are keyed by them
+        "roster": dict(roster or {}),
         "creator": creator_id,
+        "decks": list(deck_ids or []),
         "question_pool": question_pool,
         "card_pool": card_pool,
         "current_question": question_pool.pop() if question_pool else None,
         "player_hands": player_hands,
         "submissions": {},  # {player_id: [card1, card2]}
         "votes": {},  # {voter_id: player_id}
+        "vote_tally": new_tally(),  # counts and leaders, updated as votes arrive
         "phase": "playing",  # playing -> voting -> results
-        "start_time": time.time(),
+        "start_time": clock.now(),
         "duration": 60,  # 60 seconds to play cards
         "scores": {player: 0 for player in players},
         "round": 1,
         "card_czar": players[0],  # First player is czar, rotates each round
-        "czar_index": 0
+        "czar_index": 0,
+        "submission_order": [],  # shuffled once per round when voting starts
+        "version": 0  # bumped on every state change, keys the shared status cache
     }
     
     # Start background timer to handle phase transitions
     start_game_timer(room_id, games)
 
-async def get_game_status_logic(room_id, client_id, db):
-    """Get current game status for a player (NO PHASE TRANSITIONS - handled by timer)"""
-    player = db.query(Player).filter_by(user_id=client_id, room_id=room_id).first()
-    room = db.query(Room).filter_by(id=room_id).first()
-    room_creator = room.creator if room else None
-
-    if player:
-        player.last_seen = datetime.now(timezone.utc)
-        db.commit()
-
+def update_roster(room_id, client_id, username):
+    """Let a player who joins mid-game be recognized (existing players keep their in-game name)"""
     game = games.get(room_id)
-    if not game:
-        return {"status": "no_game"}
+    if game and client_id not in game["roster"]:
+        game["roster"][client_id] = username
 
-    now = time.time()
-    remaining = int(game["duration"] - (now - game["start_time"]))
-    
-    # Get player's username
-    player_username = player.username if player else client_id
-    
-    # Prepare response based on phase
+def _shared_status(game):
+    """Status fields that are the same for every player"""
     response = {
         "status": game["phase"],
-        "remaining": max(0, remaining),
         "current_question": game["current_question"],
         "scores": game["scores"],
         "round": game["round"],
         "card_czar": game["card_czar"],
-        "is_czar": player_username == game["card_czar"],
-        "player_hand": game["player_hands"].get(player_username, []),
-        "has_submitted": player_username in game["submissions"]
     }
-    
+
     # Add phase-specific data
     if game["phase"] == "voting":
-        # Resolve usernames for submissions
-        players_in_room = db.query(Player).filter_by(room_id=room_id).all()
-        player_id_to_username = {p.user_id: p.username for p in players_in_room}
-        
-        # Shuffle submissions to anonymize
-        submission_list = [
+        # Submissions in the anonymized order drawn when voting started
+        response["submissions"] = [
             {
                 "player": player_name,
-                "cards": cards,
+                "cards": game["submissions"][player_name],
                 "username": player_name  # Already using username
             }
-            for player_name, cards in game["submissions"].items()
-            if player_name != game["card_czar"]  # Don't show czar's submission if any
+            for player_name in game["submission_order"]
         ]
-        random.shuffle(submission_list)
-        
-        response["submissions"] = submission_list
-        response["has_voted"] = player_username in game["votes"]
-        
+
     elif game["phase"] == "results":
-        # Count votes
-        vote_counts = {}
-        for voted_for in game["votes"].values():
-            vote_counts[voted_for] = vote_counts.get(voted_for, 0) + 1
-        
-        # Find winner of round
-        round_winner = None
-        if vote_counts:
-            max_votes = max(vote_counts.values())
-            winners = [p for p, v in vote_counts.items() if v == max_votes]
-            round_winner = winners[0] if len(winners) == 1 else None
-        
+        vote_counts = game["vote_tally"]["counts"]
+
         response["vote_counts"] = vote_counts
-        response["round_winner"] = round_winner
+        response["round_winner"] = sole_leader(game["vote_tally"])
         response["submissions"] = [
             {
                 "player": player_name,
@@ -132,6 +101,29 @@ async def get_game_status_logic(room_id, client_id, db):
             for player_name, cards in game["submissions"].items()
             if player_name != game["card_czar"]
         ]
+    return response
+
+async def get_game_status_logic(room_id, client_id, db):
+    """Get current game status for a player (NO PHASE TRANSITIONS - handled by timer)"""
+    touch_player(db, room_id, client_id)
+
+    game = games.get(room_id)
+    if not game:
+        return {"status": "no_game"}
+
+    # Get player's username
+    player_username = game["roster"].get(client_id, client_id)
+    
+    # Shared part is cached per state version, only the per-player overlay is built here
+    response = {
+        **shared_status("cah", room_id, game, _shared_status),
+        **clock.timing(game),
+        "is_czar": player_username == game["card_czar"],
+        "player_hand": game["player_hands"].get(player_username, []),
+        "has_submitted": player_username in game["submissions"]
+    }
+    if game["phase"] == "voting":
+        response["has_voted"] = player_username in game["votes"]
     
     # NOTE: Phase transitions are handled by the background game_timer, not here
     # This prevents race conditions where different players see different states
@@ -140,15 +132,13 @@ async def get_game_status_logic(room_id, client_id, db):
 
 async def submit_cards_logic(room_id, client_id, selected_cards, db):
     """Handle a player submitting their cards"""
-    player = db.query(Player).filter_by(user_id=client_id, room_id=room_id).first()
-    if not player:
-        return {"error": "Player not found"}
-    
     game = games.get(room_id)
     if not game or game["phase"] != "playing":
         return {"error": "Cannot submit cards now"}
+    if client_id not in game["roster"]:
+        return {"error": "Player not found"}
     
-    player_username = player.username
+    player_username = game["roster"][client_id]
     
     # Don't allow card czar to submit
     if player_username == game["card_czar"]:
@@ -178,6 +168,7 @@ async def submit_cards_logic(room_id, client_id, selected_cards, db):
         player_hand.append(game["card_pool"].pop())
     
     game["submissions"][player_username] = selected_cards
+    game["version"] += 1
     
     # Send individual status updates to each player (don't broadcast full status which includes hands)
     # Just notify that a player submitted
@@ -191,15 +182,13 @@ async def submit_cards_logic(room_id, client_id, selected_cards, db):
 
 async def submit_vote_logic(room_id, client_id, voted_for, db):
     """Handle card czar voting for winner"""
-    player = db.query(Player).filter_by(user_id=client_id, room_id=room_id).first()
-    if not player:
-        return {"error": "Player not found"}
-    
     game = games.get(room_id)
     if not game or game["phase"] != "voting":
         return {"error": "Cannot vote now"}
+    if client_id not in game["roster"]:
+        return {"error": "Player not found"}
     
-    player_username = player.username
+    player_username = game["roster"][client_id]
     
     # Only card czar can vote
     if player_username != game["card_czar"]:
@@ -209,7 +198,12 @@ async def submit_vote_logic(room_id, client_id, voted_for, db):
     if voted_for not in game["submissions"]:
         return {"error": "Invalid vote"}
     
+    previous = game["votes"].get(player_username)
+    if previous is not None:
+        remove_vote(game["vote_tally"], previous)
     game["votes"][player_username] = voted_for
+    add_vote(game["vote_tally"], voted_for)
+    game["version"] += 1
     
     return {"success": True}
 
@@ -225,6 +219,15 @@ async def next_round_logic(room_id, db):
         winners = [p for p, s in game["scores"].items() if s == max_score]
         # Stop the timer when game ends
         stop_game_timer(room_id)
+        if not game.get("recorded"):
+            game["recorded"] = True
+            player_ids = {username: client_id for client_id, username in game["roster"].items()}
+            history.record_game(
+                room_id, "cah", game["round"],
+                winners=[player_ids.get(p, p) for p in winners],
+                scores={player_ids.get(p, p): s for p, s in game["scores"].items()},
+                usernames={player_ids.get(p, p): p for p in game["scores"]},
+            )
         await manager.broadcast(room_id, {
             "type": "game_over",
             "winners": winners,
@@ -238,17 +241,22 @@ async def next_round_logic(room_id, db):
     
     # Get next question
     if not game["question_pool"]:
-        # Reshuffle if we run out
-        game["question_pool"] = QUESTION_POOL.copy()
-        random.shuffle(game["question_pool"])
+        # Reshuffle if we run out, from the decks the game started with
+        game["question_pool"] = decks.refill_questions(game["question_pool"], game.get("decks"))
+        if not game["question_pool"]:
+            # Custom decks not available on this worker (e.g. an older checkpoint)
+            game["question_pool"] = decks.question_pile()
     
     game["current_question"] = game["question_pool"].pop()
     game["submissions"] = {}
     game["votes"] = {}
+    game["vote_tally"] = new_tally()
     game["phase"] = "playing"
-    game["start_time"] = time.time()
+    game["start_time"] = clock.now()
     game["duration"] = 60
     game["round"] += 1
+    game["submission_order"] = []
+    game["version"] += 1
     
     # Broadcast new round
     await manager.broadcast(room_id, {
@@ -258,7 +266,7 @@ async def next_round_logic(room_id, db):
         "card_czar": game["card_czar"],
         "round": game["round"],
         "scores": game["scores"],
-        "remaining": game["duration"]
+        **clock.timing(game),
     })
     
     return {"success": True}
@@ -0,0 +1,93 @@
+"""
+Game clock.
+Phase start times and deadlines are kept on time.monotonic(), which NTP steps and suspends don't
+move. Clients are sent absolute deadlines in milliseconds on the server clock ("deadline") along
+with the current "server_time", and can refine their offset to the server with time_sync
+messages, so a countdown runs locally without any status traffic during a phase.
+
+The server clock shown to clients is the monotonic clock anchored to the wall clock once, at
+startup. Snapshots (checkpoints, handoffs, hibernation) store wall-clock start times, since
+monotonic readings mean nothing to another process.
+
+Game and timer code reads time only through now(), so the simulation harness (app/sim.py) can
+run them on a virtual clock with set_source(). Timers sleep until their phase deadline instead of
+polling; every room broadcast (a submission, a vote, a new round) wakes them early through
+notify(), since it may end a phase before its deadline or start a new one.
+"""
+import asyncio
+import os
+import time
+
+# Upper bound on a timer's sleep, in case a state change reaches it without a broadcast
+TIMER_MAX_SLEEP = float(os.getenv("TIMER_MAX_SLEEP", "5"))
+
+_source = time.monotonic
+# Wall-clock time at _source() == 0, fixed when the source is set
+_offset = time.time() - _source()
+
+def set_source(source=None):
+    """Read time from source() (seconds, never going back) instead of time.monotonic()"""
+    global _source, _offset
+    _source = source or time.monotonic
+    _offset = time.time() - _source()
+
+def now() -> float:
+    """Seconds on the monotonic clock"""
+    return _source()
+
+def to_wall(t: float) -> float:
+    return t + _offset
+
+def from_wall(t: float) -> float:
+    return t - _offset
+
+def server_time_ms(t: float = None) -> int:
+    return int(to_wall(now() if t is None else t) * 1000)
+
+def remaining(game: dict, t: float = None) -> float:
+    """Seconds left in the current phase (negative once it is overdue)"""
+    return game["start_time"] + game["duration"] - (now() if t is None else t)
+
+def timing(game: dict) -> dict:
+    """Countdown fields of a status or game_update message"""
+    t = now()
+    return {
+        "remaining": max(0, int(remaining(game, t))),
+        "deadline": server_time_ms(game["start_time"] + game["duration"]),
+        "server_time": server_time_ms(t),
+    }
+
+# room_id -> events of the timers running for the room
+_watchers = {}
+
+def watch(room_id: int) -> asyncio.Event:
+    """Event set by every notify(room_id), for one timer"""
+    event = asyncio.Event()
+    _watchers.setdefault(room_id, set()).add(event)
+    return event
+
+def unwatch(room_id: int, event: asyncio.Event):
+    events = _watchers.get(room_id)
+    if events:
+        events.discard(event)
+        if not events:
+            del _watchers[room_id]
+
+def notify(room_id: int):
+    for event in _watchers.get(room_id, ()):
+        event.set()
+
+async def sleep_until(event: asyncio.Event, deadline: float = None):
+    """Until the deadline (None: no deadline) or until event is set, at most TIMER_MAX_SLEEP"""
+    timeout = TIMER_MAX_SLEEP if deadline is None else min(TIMER_MAX_SLEEP, max(0.0, deadline - now()))
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+def sync_reply(message: dict) -> dict:
+    """
+    Answer to {"type": "time_sync", "client_time": t0}. The client receives it at t1 and takes
+    offset = server_time - (t0 + t1) / 2 from the sample with the smallest round trip t1 - t0.
+    """
+    return {"type": "time_sync", "client_time": message.get("client_time"), "server_time": server_time_ms()}
@@ -0,0 +1,286 @@
+"""
+Custom CAH decks.
+Uploaded decks are stored content-addressed: the deck id is a hash of the normalized content, so
+uploading the same deck twice yields the same id and one stored copy. A deck is only loaded into
+memory once a room selects it, and unloaded again when no room uses it anymore. Card texts and
+questions are interned across the loaded decks, and the merged card / question sequence of a deck
+combination is built once and shared by every room playing it. Games draw from that shared
+sequence through a DrawPile (a lazy shuffle) instead of copying and shuffling the whole pool per
+room.
+
+The in-memory caches are only changed from the event loop.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import weakref
+import zlib
+from app.models import CustomDeck
+
+DEFAULT_DECK = "default"
+MAX_DECK_CARDS = 5000
+MAX_DECK_QUESTIONS = 2000
+MAX_TEXT_LENGTH = 200
+MAX_ROOM_DECKS = 10
+
+_BLANK_RE = re.compile(r"_{3,}")
+
+# Interned card texts and question dicts, shared by every deck that contains them
+_cards = {}
+_questions = {}
+# deck id -> {"cards": tuple, "questions": tuple}, for the decks rooms use
+_decks = {}
+# room_id -> deck ids chosen by the creator for the next game
+room_decks = {}
+
+def _intern_card(text: str) -> str:
+    return _cards.setdefault(text, text)
+
+def _intern_question(text: str, blanks: int) -> dict:
+    key = (text, blanks)
+    question = _questions.get(key)
+    if question is None:
+        question_id = "q-" + hashlib.blake2b(f"{blanks}:{text}".encode(), digest_size=5).hexdigest()
+        question = _questions[key] = {"id": question_id, "text": text, "blanks": blanks}
+    return question
+
+def _clean(text) -> str:
+    if not isinstance(text, str):
+        raise ValueError("Cards and questions must be text")
+    text = " ".join(text.split())
+    if not text or len(text) > MAX_TEXT_LENGTH:
+        raise ValueError(f"Texts must be 1 to {MAX_TEXT_LENGTH} characters")
+    return text
+
+def normalize_deck(cards: list, questions: list) -> dict:
+    """Validated, de-duplicated, canonically ordered deck content"""
+    if len(cards) > MAX_DECK_CARDS or len(questions) > MAX_DECK_QUESTIONS:
+        raise ValueError(f"Decks hold at most {MAX_DECK_CARDS} cards and {MAX_DECK_QUESTIONS} questions")
+    normalized_questions = set()
+    for question in questions:
+        text = _clean(question["text"] if isinstance(question, dict) else question)
+        blanks = question.get("blanks") if isinstance(question, dict) else None
+        normalized_questions.add((text, int(blanks) if blanks else max(1, len(_BLANK_RE.findall(text)))))
+    return {
+        "cards": sorted({_clean(card) for card in cards}),
+        "questions": [{"text": text, "blanks": blanks} for text, blanks in sorted(normalized_questions)],
+    }
+
+def _deck_id(content: dict) -> str:
+    canonical = json.dumps(content, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    return hashlib.blake2b(canonical.encode(), digest_size=12).hexdigest()
+
+def _install(deck_id: str, content: dict):
+    _decks[deck_id] = {
+        "cards": tuple(_intern_card(card) for card in content["cards"]),
+        "questions": tuple(_intern_question(q["text"], q["blanks"]) for q in content["questions"]),
+    }
+    return _decks[deck_id]
+
+def store_deck(db, cards: list, questions: list):
+    """
+    Save a deck (or find the identical one already stored) without loading it;
+    returns (deck id, created, normalized content)
+    """
+    content = normalize_deck(cards, questions)
+    deck_id = _deck_id(content)
+    created = False
+    if deck_id not in _decks and db.get(CustomDeck, deck_id) is None:
+        data = zlib.compress(json.dumps(content, ensure_ascii=False).encode())
+        db.add(CustomDeck(id=deck_id, data=data))
+        db.commit()
+        created = True
+    return deck_id, created, content
+
+def read_deck(db, deck_id: str):
+    """Content of a stored deck, without loading it; None if unknown"""
+    deck = _decks.get(deck_id)
+    if deck is not None:
+        return deck
+    row = db.get(CustomDeck, deck_id)
+    return json.loads(zlib.decompress(row.data)) if row is not None else None
+
+async def load_decks(db, deck_ids: list) -> list:
+    """Load the decks a room selected (reading the database in a thread); returns the unknown ids"""
+    missing = []
+    for deck_id in deck_ids or ():
+        if deck_id == DEFAULT_DECK or deck_id in _decks:
+            continue
+        content = await asyncio.to_thread(read_deck, db, deck_id)
+        if content is None:
+            missing.append(deck_id)
+        elif deck_id not in _decks:
+            _install(deck_id, content)
+    return missing
+
+def evict_unused(keep=()):
+    """Unload the decks no room has selected or is playing with (plus keep); returns how many"""
+    from app.game.cah import games
+
+    in_use = set(keep)
+    for deck_ids in room_decks.values():
+        in_use.update(deck_ids)
+    for game in games.values():
+        in_use.update(game.get("decks") or ())
+    unused = [deck_id for deck_id in _decks if deck_id not in in_use]
+    if not unused:
+        return 0
+    for deck_id in unused:
+        del _decks[deck_id]
+    # Interned texts of the remaining decks only; running games keep their own references
+    cards = {card: card for deck in _decks.values() for card in deck["cards"]}
+    questions = {(q["text"], q["blanks"]): q for deck in _decks.values() for q in deck["questions"]}
+    _cards.clear()
+    _cards.update(cards)
+    _questions.clear()
+    _questions.update(questions)
+    return len(unused)
+
+class DeckView:
+    """Read-only concatenation of several sequences, indexed without copying them"""
+    def __init__(self, parts: list):
+        self.parts = [part for part in parts if part]
+        self.offsets = []
+        total = 0
+        for part in self.parts:
+            self.offsets.append(total)
+            total += len(part)
+        self.length = total
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index: int):
+        for offset, part in zip(reversed(self.offsets), reversed(self.parts)):
+            if index >= offset:
+                return part[index - offset]
+        raise IndexError(index)
+
+# deck ids -> (cards view, questions view); views live as long as a game still draws from them
+_views = weakref.WeakValueDictionary()
+
+def _merged(deck_ids: tuple, kind: str) -> DeckView:
+    key = (deck_ids, kind)
+    view = _views.get(key)
+    if view is not None:
+        return view
+    from app.game.cah import CARD_POOL, QUESTION_POOL
+
+    default = CARD_POOL if kind == "cards" else QUESTION_POOL
+    parts, seen = [], set()
+    if DEFAULT_DECK in deck_ids or not deck_ids:
+        parts.append(default)
+        seen.update(default if kind == "cards" else (q["text"] for q in default))
+    for deck_id in deck_ids:
+        # Custom decks are loaded by load_decks before a game starts, never from here
+        deck = _decks.get(deck_id) if deck_id != DEFAULT_DECK else None
+        if deck is None:
+            continue
+        # Only what the earlier decks don't already have, so nothing is dealt twice
+        extra = []
+        for item in deck[kind]:
+            key_text = item if kind == "cards" else item["text"]
+            if key_text not in seen:
+                seen.add(key_text)
+                extra.append(item)
+        parts.append(tuple(extra))
+    view = DeckView(parts)
+    _views[key] = view
+    return view
+
+class DrawPile:
+    """
+    A shuffled draw pile over a shared sequence, shuffled lazily (Fisher-Yates, one step per draw),
+    so a room only stores the positions it has swapped. Supports the list operations the games use.
+    """
+    def __init__(self, source, deck_ids: tuple = (), kind: str = None):
+        self.source = source
+        self.deck_ids = deck_ids
+        self.kind = kind
+        self.remaining = len(source)
+        self._swaps = {}
+
+    def __len__(self):
+        return self.remaining
+
+    def __bool__(self):
+        return self.remaining > 0
+
+    def pop(self):
+        if not self.remaining:
+            raise IndexError("pop from empty draw pile")
+        last = self.remaining - 1
+        pick = random.randint(0, last)
+        chosen = self._swaps.get(pick, pick)
+        self._swaps[pick] = self._swaps.pop(last, last)
+        if pick == last:
+            self._swaps.pop(pick, None)
+        self.remaining = last
+        return self.source[chosen]
+
+    def __iter__(self):
+        # Remaining cards, used when a game is exported for a checkpoint or handoff
+        for position in range(self.remaining):
+            yield self.source[self._swaps.get(position, position)]
+
+def card_pile(deck_ids: list = None) -> DrawPile:
+    deck_ids = tuple(deck_ids or ())
+    return DrawPile(_merged(deck_ids, "cards"), deck_ids, "cards")
+
+def question_pile(deck_ids: list = None) -> DrawPile:
+    deck_ids = tuple(deck_ids or ())
+    return DrawPile(_merged(deck_ids, "questions"), deck_ids, "questions")
+
+def refill_questions(pile, deck_ids: list = None) -> DrawPile:
+    """A full question pile again once a game used it up, over the same decks and without the database"""
+    if isinstance(pile, DrawPile) and len(pile.source):
+        return DrawPile(pile.source, pile.deck_ids, pile.kind)
+    # Plain list from an older snapshot: the decks loaded on this worker
+    return question_pile(deck_ids)
+
+def pack_pile(pile: DrawPile):
+    """
+    Compact form of a pile: only the positions swapped so far. Piles over custom decks carry
+    the decks' cards or questions along, another worker may not have them loaded.
+    """
+    if pile.kind is None:
+        return None
+    packed = {
+        "pile": pile.kind,
+        "decks": list(pile.deck_ids),
+        "remaining": pile.remaining,
+        "swaps": [[position, item] for position, item in pile._swaps.items()],
+    }
+    if not set(pile.deck_ids) <= {DEFAULT_DECK}:
+        parts = pile.source.parts[1:] if DEFAULT_DECK in pile.deck_ids else pile.source.parts
+        packed["custom"] = [item for part in parts for item in part]
+    return packed
+
+def unpack_pile(packed: dict) -> DrawPile:
+    deck_ids = tuple(packed["decks"])
+    kind = packed["pile"]
+    if "custom" in packed:
+        from app.game.cah import CARD_POOL, QUESTION_POOL
+
+        if kind == "cards":
+            custom = tuple(_intern_card(card) for card in packed["custom"])
+        else:
+            custom = tuple(_intern_question(q["text"], q["blanks"]) for q in packed["custom"])
+        default = CARD_POOL if kind == "cards" else QUESTION_POOL
+        source = DeckView(([default] if DEFAULT_DECK in deck_ids else []) + [custom])
+    else:
+        source = _merged(deck_ids, kind)
+    pile = DrawPile(source, deck_ids, kind)
+    pile.remaining = packed["remaining"]
+    pile._swaps = {position: item for position, item in packed["swaps"]}
+    return pile
+
+def get_deck_stats():
+    return {
+        "decks": len(_decks),
+        "interned_cards": len(_cards),
+        "interned_questions": len(_questions),
+        "shared_views": len(_views),
+    }
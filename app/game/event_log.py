@@ -0,0 +1,184 @@
+"""
+Per-room append-only event log.
+Every message broadcast to a room (joins, submissions, votes, phase changes, scores) gets the next
+sequence number of that room and is kept, already JSON-encoded, in a bounded in-memory log.
+Clients can catch up from the log instead of rebuilding the full status, and it doubles as an
+audit trail of what a room's clients were told.
+
+Sequence numbers restart at 1 whenever a room's log is recreated (hibernation, handoff, restart),
+so every log also has a random epoch, sent with each event: a sequence number only means
+something together with the epoch it was issued in.
+
+Set EVENT_LOG_DIR to also append the events to mmap-backed files (two rotating segments per room,
+so disk use per room stays bounded as well).
+"""
+import json
+import logging
+import mmap
+import os
+import secrets
+import struct
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOG_SIZE = int(os.getenv("EVENT_LOG_SIZE", "256"))
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR")
+EVENT_LOG_SEGMENT_BYTES = int(os.getenv("EVENT_LOG_SEGMENT_BYTES", str(1 << 20)))
+
+_HEADER = struct.Struct("<Q")   # write offset of the segment
+_RECORD = struct.Struct("<I")   # length of one encoded event
+
+def encode(message: dict) -> str:
+    # Same encoding as WebSocket.send_json, so the text can be sent as is
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+class _Segment:
+    """A fixed-size file of length-prefixed records, written through mmap"""
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "a+b") as f:
+            if os.fstat(f.fileno()).st_size < EVENT_LOG_SEGMENT_BYTES:
+                f.truncate(EVENT_LOG_SEGMENT_BYTES)
+            self.map = mmap.mmap(f.fileno(), EVENT_LOG_SEGMENT_BYTES)
+        self.offset = _HEADER.unpack_from(self.map, 0)[0] or _HEADER.size
+
+    def append(self, data: bytes) -> bool:
+        end = self.offset + _RECORD.size + len(data)
+        if end > EVENT_LOG_SEGMENT_BYTES:
+            return False
+        _RECORD.pack_into(self.map, self.offset, len(data))
+        self.map[self.offset + _RECORD.size:end] = data
+        self.offset = end
+        _HEADER.pack_into(self.map, 0, self.offset)
+        return True
+
+    def records(self):
+        offset = _HEADER.size
+        while offset < self.offset:
+            (length,) = _RECORD.unpack_from(self.map, offset)
+            offset += _RECORD.size
+            yield bytes(self.map[offset:offset + length])
+            offset += length
+
+    def close(self):
+        self.map.close()
+
+class _RoomFile:
+    """Current and previous segment of a room's on-disk log"""
+    def __init__(self, room_id: int):
+        os.makedirs(EVENT_LOG_DIR, exist_ok=True)
+        self.base = os.path.join(EVENT_LOG_DIR, f"room-{room_id}")
+        self.current = _Segment(self.base + ".log")
+
+    def append(self, data: bytes):
+        if self.current.append(data):
+            return
+        # Segment full: the previous segment is dropped and the current one becomes previous
+        self.current.close()
+        os.replace(self.base + ".log", self.base + ".old")
+        self.current = _Segment(self.base + ".log")
+        self.current.append(data)
+
+    def read(self):
+        if os.path.exists(self.base + ".old"):
+            old = _Segment(self.base + ".old")
+            yield from old.records()
+            old.close()
+        yield from self.current.records()
+
+    def close(self, remove: bool = False):
+        self.current.close()
+        if remove:
+            for suffix in (".log", ".old"):
+                if os.path.exists(self.base + suffix):
+                    os.remove(self.base + suffix)
+
+class RoomLog:
+    def __init__(self, room_id: int):
+        self.room_id = room_id
+        self.seq = 0
+        self.epoch = secrets.token_hex(4)
+        # (seq, unix time, encoded message)
+        self.events = deque(maxlen=EVENT_LOG_SIZE)
+        self.file = _RoomFile(room_id) if EVENT_LOG_DIR else None
+
+    def append(self, message: dict) -> tuple:
+        self.seq += 1
+        encoded = encode({**message, "seq": self.seq, "epoch": self.epoch})
+        event = (self.seq, time.time(), encoded)
+        self.events.append(event)
+        if self.file:
+            try:
+                self.file.append(encoded.encode())
+            except OSError as e:
+                logger.error(f"[EVENT_LOG] Room {self.room_id}: disabling file log: {e}")
+                self.file = None
+        return event
+
+    def since(self, seq: int, epoch: str):
+        """Encoded events after seq, or None if some of them already fell out of the log"""
+        if epoch != self.epoch or seq > self.seq:
+            # Sequence of an earlier log of the room
+            return None
+        if seq == self.seq:
+            return []
+        if not self.events or self.events[0][0] > seq + 1:
+            return None
+        return [encoded for s, _, encoded in self.events if s > seq]
+
+_logs = {}
+
+def _log(room_id: int) -> RoomLog:
+    log = _logs.get(room_id)
+    if log is None:
+        log = _logs[room_id] = RoomLog(room_id)
+    return log
+
+def record(room_id: int, message: dict) -> tuple:
+    """Append a room-wide message; returns (seq, time, encoded message with "seq" and "epoch")"""
+    return _log(room_id).append(message)
+
+def position(room_id: int) -> tuple:
+    """(epoch, last seq) of the room's log, starting a new log if there is none"""
+    log = _log(room_id)
+    return log.epoch, log.seq
+
+def last_seq(room_id: int) -> int:
+    log = _logs.get(room_id)
+    return log.seq if log else 0
+
+def since(room_id: int, seq: int, epoch: str):
+    """Encoded events of the room after seq of epoch, or None when they can't be replayed"""
+    log = _logs.get(room_id)
+    if log is None:
+        return None
+    return log.since(seq, epoch)
+
+def recent(room_id: int, limit: int = EVENT_LOG_SIZE):
+    """The newest events of the room as dicts (for auditing / debugging)"""
+    log = _logs.get(room_id)
+    if log is None:
+        return []
+    events = list(log.events)[-limit:]
+    return [{"seq": s, "time": t, "event": json.loads(encoded)} for s, t, encoded in events]
+
+def read_file(room_id: int):
+    """Every event still in the room's on-disk log, oldest first"""
+    log = _logs.get(room_id)
+    if log is None or log.file is None:
+        return []
+    return [json.loads(data) for data in log.file.read()]
+
+def drop(room_id: int):
+    log = _logs.pop(room_id, None)
+    if log and log.file:
+        log.file.close(remove=True)
+
+def get_event_log_stats():
+    return {
+        "rooms": len(_logs),
+        "events": sum(len(log.events) for log in _logs.values()),
+        "file_backed": bool(EVENT_LOG_DIR),
+    }
@@ -3,107 +3,139 @@ Centralized game timer manager to prevent desync issues.
 Handles phase transitions in the background instead of during individual player status requests.
 """
 import asyncio
-import time
 import logging
 import random
 from app.game.websockets import manager
+from app.game import actor, clock
+from app.game.tally import sole_leader
+from app import history
 
 logger = logging.getLogger(__name__)
 
 # Active game timers
 _active_timers = {}
 
+def _record_round(room_id: int, game: dict, round_winner):
+    """Queue the round for the match history (CAH keys players by name, history by client id)"""
+    player_ids = {username: client_id for client_id, username in game.get("roster", {}).items()}
+    submissions = {p: cards for p, cards in game["submissions"].items() if p != game["card_czar"]}
+    question = game.get("current_question") or {}
+    history.record_round(
+        room_id, "cah", game["round"], question.get("id"),
+        winners=[player_ids.get(round_winner, round_winner)] if round_winner is not None else [],
+        winning_entry=submissions.get(round_winner),
+        points={player_ids.get(p, p): int(p == round_winner) for p in game["scores"]},
+        usernames={player_ids.get(p, p): p for p in game["scores"]},
+        played=[card for cards in submissions.values() for card in cards],
+    )
+
+async def finish_round(room_id: int, game: dict):
+    """Move a CAH round from 'voting' to 'results', award the point and broadcast the results"""
+    if game["phase"] != "voting":
+        return
+    logger.info(f"[TIMER] Room {room_id}: Transitioning from 'voting' to 'results'")
+    game["phase"] = "results"
+    game["version"] += 1
+
+    # Award the point to the single leader, if any (ties score nothing)
+    vote_counts = game["vote_tally"]["counts"]
+    round_winner = sole_leader(game["vote_tally"])
+    if round_winner is not None:
+        game["scores"][round_winner] += 1
+    _record_round(room_id, game, round_winner)
+
+    # Broadcast results
+    await manager.broadcast(room_id, {
+        "type": "game_update",
+        "status": "results",
+        "round_winner": round_winner,
+        "scores": game["scores"],
+        "vote_counts": vote_counts,
+        "submissions": [
+            {
+                "player": player_name,
+                "cards": cards,
+                "votes": vote_counts.get(player_name, 0)
+            }
+            for player_name, cards in game["submissions"].items()
+            if player_name != game["card_czar"]
+        ]
+    })
+
+async def _tick(room_id: int, games_dict: dict):
+    """Check one room for due phase transitions (runs inside the room's actor)"""
+    game = games_dict.get(room_id)
+    if not game:
+        return
+    now = clock.now()
+    remaining = clock.remaining(game, now)
+
+    # Check for phase transitions
+    if game["phase"] == "playing":
+        # Check if all non-czar players have submitted
+        non_czar_players = [p for p in game["players"] if p != game["card_czar"]]
+        all_submitted = all(p in game["submissions"] for p in non_czar_players)
+
+        if all_submitted or remaining <= 0:
+            logger.info(f"[TIMER] Room {room_id}: Transitioning from 'playing' to 'voting'")
+            # Transition to voting phase
+            game["phase"] = "voting"
+            game["start_time"] = now
+            game["duration"] = 30  # 30 seconds to vote
+
+            # Shuffle submissions once per round, status calls reuse this order
+            order = [p for p in game["submissions"] if p != game["card_czar"]]
+            random.shuffle(order)
+            game["submission_order"] = order
+            game["version"] += 1
+
+            # Prepare submissions for voting
+            submission_list = [
+                {
+                    "player": player_name,
+                    "cards": game["submissions"][player_name],
+                    "username": player_name
+                }
+                for player_name in order
+            ]
+
+            # Broadcast to all players
+            await manager.broadcast(room_id, {
+                "type": "game_update",
+                "status": "voting",
+                "submissions": submission_list,
+                **clock.timing(game),
+                "current_question": game["current_question"],
+                "card_czar": game["card_czar"],
+                "scores": game["scores"],
+                "round": game["round"]
+            })
+
+    elif game["phase"] == "voting":
+        if remaining <= 0:
+            await finish_round(room_id, game)
+
+def _deadline(game):
+    """Deadline of the current phase; results wait for the next round"""
+    if game and game["phase"] in ("playing", "voting"):
+        return game["start_time"] + game["duration"]
+    return None
+
 async def game_timer_loop(room_id: int, games_dict: dict, db_factory):
     """
     Background task that monitors game state and triggers phase transitions.
     This runs independently of player requests to ensure all players see the same state.
+    Transitions are applied through the room's actor so they never interleave with player actions.
     """
     logger.info(f"[TIMER] Starting game timer for room {room_id}")
-    
+
+    changed = clock.watch(room_id)
     try:
         while room_id in games_dict:
-            game = games_dict[room_id]
-            now = time.time()
-            elapsed = now - game["start_time"]
-            remaining = int(game["duration"] - elapsed)
-            
-            # Check for phase transitions
-            if game["phase"] == "playing":
-                # Check if all non-czar players have submitted
-                non_czar_players = [p for p in game["players"] if p != game["card_czar"]]
-                all_submitted = all(p in game["submissions"] for p in non_czar_players)
-                
-                if all_submitted or remaining <= 0:
-                    logger.info(f"[TIMER] Room {room_id}: Transitioning from 'playing' to 'voting'")
-                    # Transition to voting phase
-                    game["phase"] = "voting"
-                    game["start_time"] = now
-                    game["duration"] = 30  # 30 seconds to vote
-                    
-                    # Prepare submissions for voting
-                    submission_list = [
-                        {
-                            "player": player_name,
-                            "cards": cards,
-                            "username": player_name
-                        }
-                        for player_name, cards in game["submissions"].items()
-                        if player_name != game["card_czar"]
-                    ]
-                    random.shuffle(submission_list)
-                    
-                    # Broadcast to all players
-                    await manager.broadcast(room_id, {
-                        "type": "game_update",
-                        "status": "voting",
-                        "submissions": submission_list,
-                        "remaining": game["duration"],
-                        "current_question": game["current_question"],
-                        "card_czar": game["card_czar"],
-                        "scores": game["scores"],
-                        "round": game["round"]
-                    })
-                    
-            elif game["phase"] == "voting":
-                if remaining <= 0:
-                    logger.info(f"[TIMER] Room {room_id}: Transitioning from 'voting' to 'results'")
-                    # Transition to results phase
-                    game["phase"] = "results"
-                    
-                    # Count votes and award points
-                    vote_counts = {}
-                    for voted_for in game["votes"].values():
-                        vote_counts[voted_for] = vote_counts.get(voted_for, 0) + 1
-                    
-                    # Find winner and award point
-                    round_winner = None
-                    if vote_counts:
-                        max_votes = max(vote_counts.values())
-                        winners = [p for p, v in vote_counts.items() if v == max_votes]
-                        if len(winners) == 1:
-                            game["scores"][winners[0]] += 1
-                            round_winner = winners[0]
-                    
-                    # Broadcast results
-                    await manager.broadcast(room_id, {
-                        "type": "game_update",
-                        "status": "results",
-                        "round_winner": round_winner,
-                        "scores": game["scores"],
-                        "vote_counts": vote_counts,
-                        "submissions": [
-                            {
-                                "player": player_name,
-                                "cards": cards,
-                                "votes": vote_counts.get(player_name, 0)
-                            }
-                            for player_name, cards in game["submissions"].items()
-                            if player_name != game["card_czar"]
-                        ]
-                    })
-            
-            # Sleep for 1 second before next check
-            await asyncio.sleep(1)
+            # Cleared before the tick: anything that happens from here on wakes us again
+            changed.clear()
+            await actor.run(room_id, _tick, room_id, games_dict)
+            await clock.sleep_until(changed, _deadline(games_dict.get(room_id)))
             
     except asyncio.CancelledError:
         logger.info(f"[TIMER] Game timer cancelled for room {room_id}")
@@ -112,8 +144,10 @@ async def game_timer_loop(room_id: int, games_dict: dict, db_factory):
         logger.error(f"[TIMER] Error in game timer for room {room_id}: {e}", exc_info=True)
     finally:
         logger.info(f"[TIMER] Game timer stopped for room {room_id}")
-        if room_id in _active_timers:
+        # Only unregister ourselves, not a newer timer started for the same room
+        if _active_timers.get(room_id) is asyncio.current_task():
             del _active_timers[room_id]
+        clock.unwatch(room_id, changed)
 
 def start_game_timer(room_id: int, games_dict: dict, db_factory=None):
     """Start a background timer task for a game room"""
@@ -1,32 +1,37 @@
-import json, random, time
-from app.models import Player, Room
-from datetime import datetime, timezone
+import json, random
 from app.game.websockets import manager
-from app.game.meme_timer import start_meme_timer, stop_meme_timer
-from app.db import get_db
-import asyncio
-import logging
+from app.game.meme_timer import start_meme_timer
+from app.game.tally import new_tally, add_vote
+from app.game.status_cache import shared_status
+from app.game.utils import touch_player
+from app.game import clock
+from app import history
 
 with open("memes.json") as f:
     MEME_POOL = json.load(f)
 
 games = {}
 
-def start_meme_game(room_id: int, players: list[str], creator_id: str):
+def start_meme_game(room_id: int, players: list[str], creator_id: str, roster: dict = None):
     meme_pool = MEME_POOL.copy()
     random.shuffle(meme_pool)
     games[room_id] = {
         "players": players,
+        "roster": dict(roster or {}),  # client_id -> username, kept up to date on join/rename
         "creator": creator_id,
         "meme_pool": meme_pool,
         "current_meme": meme_pool.pop(),
         "captions": {},
         "votes": {},
         "phase": "captioning",
-        "start_time": time.time(),
+        "start_time": clock.now(),
         "duration": 60,
-        "points":{},
-        "submissions": {}
+        "vote_tally": new_tally(),
+        "points_tally": new_tally(),  # player_points, with leaders kept up to date
+        "submissions": {},
+        "round": 1,
+        "total_points": {},  # player_id -> points over the whole game, for the match history
+        "version": 0  # bumped on every state change, keys the shared status cache
     }
     
     # Start background timer to handle phase transitions
@@ -34,62 +39,33 @@ def start_meme_game(room_id: int, players: list[str], creator_id: str):
 
 # app/game/meme.py
 
-async def get_game_status_logic(room_id, client_id, db):
-    player = db.query(Player).filter_by(user_id=client_id, room_id=room_id).first()
-    room = db.query(Room).filter_by(id=room_id).first()
-    room_creator = room.creator
-
-    if player:
-        player.last_seen = datetime.now(timezone.utc)
-        db.commit()
+def round_winners(game):
+    """Winners are decided by POINTS; vote count is the fallback when no points were given"""
+    if game["points_tally"]["counts"]:
+        return game["points_tally"]["leaders"]
+    return game["vote_tally"]["leaders"]
 
+def update_roster(room_id, client_id, username):
+    """Record a player joining or renaming during a running game"""
     game = games.get(room_id)
-    if not game:
-        return {"status": "no_game"}
-
-    now = time.time()
-    remaining = int(game["duration"] - (now - game["start_time"]))
-
-    # Prepare vote counts & winners - only if in voting or results
-    vote_counts = {}
-    winners = []
-    if game["phase"] in ("voting", "results"):
-        # Count votes for display purposes
-        for v in game.get("votes", {}).values():
-            vote_counts[v] = vote_counts.get(v, 0) + 1
-        
-        # Calculate winners based on POINTS, not vote count
-        player_points = game.get("player_points", {})
-        if player_points:
-            max_points = max(player_points.values(), default=0)
-            winners = [p for p, pts in player_points.items() if pts == max_points]
-        else:
-            # Fallback to vote count if no points system
-            max_votes = max(vote_counts.values(), default=0)
-            winners = [p for p, c in vote_counts.items() if c == max_votes]
-    
-    # NOTE: Phase transitions are handled by the background meme_timer, not here
-    # This prevents race conditions where different players see different states
-
-    # === Phase responses ===
-    if "submissions" not in game:
-        game["submissions"] = {}
-
+    if not game or game["roster"].get(client_id) == username:
+        return
+    game["roster"][client_id] = username
+    game["players"] = list(game["roster"].values())
+    game["version"] += 1
+
+def _shared_status(game):
+    """Status fields that are the same for every player"""
     if game["phase"] == "captioning":
         return {
             "status": "captioning",
             "current_meme": game["current_meme"],
-            "captions_submitted": len(game.get("captions", {})),
+            "captions_submitted": len(game["captions"]),
             "players": game.get("players", []),
-            "remaining": remaining,
-            "is_creator": client_id == room_creator,
         }
 
     if game["phase"] == "voting":
-        # Resolve usernames from database
-        players_in_room = db.query(Player).filter_by(room_id=room_id).all()
-        player_id_to_username = {p.user_id: p.username for p in players_in_room}
-        
+        roster = game["roster"]
         return {
             "status": "voting",
             "submissions": [
@@ -97,56 +73,116 @@ async def get_game_status_logic(room_id, client_id, db):
                     "user_id": player_id,
                     "meme": sub["meme"],
                     "captions": sub["captions"],
-                    "username": player_id_to_username.get(player_id, player_id)
+                    "username": roster.get(player_id, player_id)
                 }
                 for player_id, sub in game["submissions"].items()
             ],
-            "remaining": remaining,
-            "is_creator": client_id == room_creator,
         }
 
     if game["phase"] == "results":
         # Use the player_points that were accumulated during voting
-        player_points = game.get("player_points", {})
-        
-        # Resolve usernames from database
-        players_in_room = db.query(Player).filter_by(room_id=room_id).all()
-        player_id_to_username = {p.user_id: p.username for p in players_in_room}
+        player_points = game["points_tally"]["counts"]
         
+        roster = game["roster"]
+
         # Add usernames to submissions for results display
         submissions_with_usernames = {
             player_id: {
                 **sub,
-                "username": player_id_to_username.get(player_id, player_id)
+                "username": roster.get(player_id, player_id)
             }
-            for player_id, sub in game.get("submissions", {}).items()
+            for player_id, sub in game["submissions"].items()
         }
 
         return {
             "status": "results",
-            "winners": winners,
-            "votes": game.get("votes", {}),
-            "captions": game.get("captions", {}),
+            "winners": round_winners(game),
+            "votes": game["votes"],
+            "captions": game["captions"],
             "submissions": submissions_with_usernames,
             "player_points": player_points,
-            "can_proceed": player and client_id == room_creator,
-            "is_creator": client_id == room_creator,
         }
 
     return {"status": "unknown"}
 
+async def get_game_status_logic(room_id, client_id, db):
+    touch_player(db, room_id, client_id)
 
+    game = games.get(room_id)
+    if not game:
+        return {"status": "no_game"}
 
-def next_meme_logic(room_id, client_id, db):
-    player = db.query(Player).filter_by(user_id=client_id, room_id=room_id).first()
-    room = db.query(Room).filter_by(id=room_id).first()
-    room_creator = room.creator
+    # NOTE: Phase transitions are handled by the background meme_timer, not here
+    # This prevents race conditions where different players see different states
 
+    # Shared part is cached per state version, only the per-player overlay is built here
+    shared = shared_status("meme", room_id, game, _shared_status)
+    is_creator = client_id == game["creator"]
+
+    if game["phase"] in ("captioning", "voting"):
+        return {**shared, **clock.timing(game), "is_creator": is_creator}
+
+    if game["phase"] == "results":
+        return {**shared, "can_proceed": is_creator, "is_creator": is_creator}
+
+    return shared
+
+
+
+async def submit_caption_logic(room_id, client_id, captions, db):
+    """Store a player's captions and push the new status to the room"""
+    game = games.get(room_id)
+    if not game or game["phase"] != "captioning":
+        return {"error": "Not in captioning phase"}
+
+    if not captions or len(captions) != len(game["current_meme"]["caption_slots"]):
+        return {"error": "Invalid caption count"}
+
+    game["captions"][client_id] = captions
+
+    if client_id not in game["submissions"]:
+        game["submissions"][client_id] = {
+            "meme": game["current_meme"],
+            "captions": captions,
+        }
+    else:
+        game["submissions"][client_id]["captions"] = captions
+    game["version"] += 1
+
+    status = await get_game_status_logic(room_id, client_id, db)
+    await manager.broadcast(room_id, {"type": "game_update", **status})
+    return {"success": True}
+
+async def submit_vote_logic(room_id, client_id, vote_for, points, db):
+    """Register a vote with its points and push the new status to the room"""
+    game = games.get(room_id)
+    if not game or game["phase"] != "voting":
+        return {"error": "Voting is not active"}
+
+    # Check if already voted FIRST
+    if client_id in game["votes"]:
+        return {"error": "You already voted"}
+
+    if client_id == vote_for:
+        return {"error": "You can't vote for yourself!"}
+
+    # Register the vote and apply points
+    game["votes"][client_id] = vote_for
+    add_vote(game["vote_tally"], vote_for)
+    add_vote(game["points_tally"], vote_for, points)
+    game["version"] += 1
+
+    status = await get_game_status_logic(room_id, client_id, db)
+    await manager.broadcast(room_id, {"type": "game_update", **status})
+    return {"success": True}
+
+def next_meme_logic(room_id, client_id, db):
     game = games.get(room_id)
     if not game or game["phase"] != "results":
         return {"status": "cannot_advance"}
 
-    if not player or client_id != room_creator:
+    # Callers have verified the creator's capability token; this just guards against stale games
+    if client_id != game["creator"]:
         return {"status": "unauthorized"}
 
     if game["meme_pool"]:
@@ -156,12 +192,25 @@ def next_meme_logic(room_id, client_id, db):
             "captions": {},
             "votes": {},
             "phase": "captioning",
-            "start_time": time.time(),
+            "start_time": clock.now(),
             "submissions": {},
-            "player_points": {},  # Reset points for new round
+            "vote_tally": new_tally(),
+            "points_tally": new_tally(),  # Reset points for new round
             "duration": 60,
+            "round": game.get("round", 1) + 1,
+            "version": game["version"] + 1,
         })
         return {"status": "next_meme", "current_meme": next_meme}
 
+    if not game.get("recorded"):
+        game["recorded"] = True
+        totals = game.get("total_points", {})
+        best = max(totals.values(), default=0)
+        history.record_game(
+            room_id, "meme", game.get("round", 1),
+            winners=[player_id for player_id, points in totals.items() if points == best and best > 0],
+            scores=totals,
+            usernames=game["roster"],
+        )
     return {"status": "game_over", "message": "No more memes"}
    
@@ -3,87 +3,107 @@ Centralized meme game timer manager to prevent desync issues.
 Handles phase transitions in the background instead of during individual player status requests.
 """
 import asyncio
-import time
 import logging
 from app.game.websockets import manager
+from app.game import actor, clock
+from app import history
 
 logger = logging.getLogger(__name__)
 
 # Active meme game timers
 _active_meme_timers = {}
 
+def _record_round(room_id: int, game: dict, winners: list):
+    """Add the round's points to the game totals and queue it for the match history"""
+    points = {player_id: 0 for player_id in game["submissions"]}
+    points.update(game["points_tally"]["counts"])
+    totals = game.setdefault("total_points", {})
+    for player_id, value in points.items():
+        totals[player_id] = totals.get(player_id, 0) + value
+    meme_id = game["current_meme"]["id"]
+    history.record_round(
+        room_id, "meme", game.get("round", 1), meme_id,
+        winners=winners,
+        winning_entry={player_id: game["captions"].get(player_id) for player_id in winners},
+        points=points,
+        usernames=game["roster"],
+        played=[meme_id],
+    )
+
+async def _tick(room_id: int, games_dict: dict):
+    """Check one room for due phase transitions (runs inside the room's actor)"""
+    from app.game.meme import round_winners
+
+    game = games_dict.get(room_id)
+    if not game:
+        return
+    now = clock.now()
+    remaining = clock.remaining(game, now)
+
+    # Check for phase transitions
+    if game["phase"] == "captioning" and remaining <= 0:
+        logger.info(f"[MEME_TIMER] Room {room_id}: Transitioning from 'captioning' to 'voting'")
+        game["phase"] = "voting"
+        game["start_time"] = now
+        game["duration"] = 60
+        game["version"] += 1
+
+        # Prepare submissions for voting, usernames come from the game's roster
+        submissions = [
+            {
+                "user_id": player_id,
+                "meme": sub["meme"],
+                "captions": sub["captions"],
+                "username": game["roster"].get(player_id, player_id)
+            }
+            for player_id, sub in game["submissions"].items()
+        ]
+
+        # Broadcast to all players
+        await manager.broadcast(room_id, {
+            "type": "game_update",
+            "status": "voting",
+            "submissions": submissions,
+            **clock.timing(game),
+        })
+
+    elif game["phase"] == "voting" and remaining <= 0:
+        logger.info(f"[MEME_TIMER] Room {room_id}: Transitioning from 'voting' to 'results'")
+        game["phase"] = "results"
+        game["version"] += 1
+        _record_round(room_id, game, round_winners(game))
+
+        # Broadcast results, read straight from the tallies kept up to date by each vote
+        await manager.broadcast(room_id, {
+            "type": "game_update",
+            "status": "results",
+            "winners": round_winners(game),
+            "votes": game["votes"],
+            "player_points": game["points_tally"]["counts"],
+            "vote_counts": game["vote_tally"]["counts"]
+        })
+
+def _deadline(game):
+    """Deadline of the current phase; results wait for the next meme"""
+    if game and game["phase"] in ("captioning", "voting"):
+        return game["start_time"] + game["duration"]
+    return None
+
 async def meme_timer_loop(room_id: int, games_dict: dict, db_factory):
     """
     Background task that monitors meme game state and triggers phase transitions.
     This runs independently of player requests to ensure all players see the same state.
+    Transitions are applied through the room's actor so they never interleave with player actions.
     """
     logger.info(f"[MEME_TIMER] Starting meme game timer for room {room_id}")
     
+    changed = clock.watch(room_id)
     try:
         while room_id in games_dict:
-            game = games_dict[room_id]
-            now = time.time()
-            elapsed = now - game["start_time"]
-            remaining = int(game["duration"] - elapsed)
-            
-            # Check for phase transitions
-            if game["phase"] == "captioning" and remaining <= 0:
-                logger.info(f"[MEME_TIMER] Room {room_id}: Transitioning from 'captioning' to 'voting'")
-                game["phase"] = "voting"
-                game["start_time"] = now
-                game["duration"] = 60
-                
-                # Prepare submissions for voting (need db to resolve usernames)
-                # For now, use player IDs as fallback
-                submissions = [
-                    {
-                        "user_id": player_id,
-                        "meme": sub["meme"],
-                        "captions": sub["captions"],
-                        "username": player_id  # Will be resolved on client side or via polling
-                    }
-                    for player_id, sub in game["submissions"].items()
-                ]
-                
-                # Broadcast to all players
-                await manager.broadcast(room_id, {
-                    "type": "game_update",
-                    "status": "voting",
-                    "submissions": submissions,
-                    "remaining": game["duration"],
-                })
-                
-            elif game["phase"] == "voting" and remaining <= 0:
-                logger.info(f"[MEME_TIMER] Room {room_id}: Transitioning from 'voting' to 'results'")
-                game["phase"] = "results"
-                
-                # Calculate winners based on points
-                player_points = game.get("player_points", {})
-                vote_counts = {}
-                for voted_for in game.get("votes", {}).values():
-                    vote_counts[voted_for] = vote_counts.get(voted_for, 0) + 1
-                
-                winners = []
-                if player_points:
-                    max_points = max(player_points.values(), default=0)
-                    winners = [p for p, pts in player_points.items() if pts == max_points]
-                else:
-                    # Fallback to vote count
-                    max_votes = max(vote_counts.values(), default=0)
-                    winners = [p for p, c in vote_counts.items() if c == max_votes]
-                
-                # Broadcast results
-                await manager.broadcast(room_id, {
-                    "type": "game_update",
-                    "status": "results",
-                    "winners": winners,
-                    "votes": game.get("votes", {}),
-                    "player_points": player_points,
-                    "vote_counts": vote_counts
-                })
-            
-            # Sleep for 1 second before next check
-            await asyncio.sleep(1)
+            # Cleared before the tick: anything that happens from here on wakes us again
+            changed.clear()
+            await actor.run(room_id, _tick, room_id, games_dict)
+            await clock.sleep_until(changed, _deadline(games_dict.get(room_id)))
             
     except asyncio.CancelledError:
         logger.info(f"[MEME_TIMER] Meme game timer cancelled for room {room_id}")
@@ -92,8 +112,10 @@ async def meme_timer_loop(room_id: int, games_dict: dict, db_factory):
         logger.error(f"[MEME_TIMER] Error in meme game timer for room {room_id}: {e}", exc_info=True)
     finally:
         logger.info(f"[MEME_TIMER] Meme game timer stopped for room {room_id}")
-        if room_id in _active_meme_timers:
+        # Only unregister ourselves, not a newer timer started for the same room
+        if _active_meme_timers.get(room_id) is asyncio.current_task():
             del _active_meme_timers[room_id]
+        clock.unwatch(room_id, changed)
 
 def start_meme_timer(room_id: int, games_dict: dict, db_factory=None):
     """Start a background timer task for a meme game room"""
@@ -0,0 +1,103 @@
+"""
+Input limits for WebSocket messages.
+Each connection and each room gets a token bucket; frames that are too large or arrive faster
+than the buckets allow are dropped before json.loads, so one client flooding get_status or
+submit_caption can't starve the other rooms on the worker. After a dropped frame the socket isn't
+read for WS_REJECT_PAUSE_MS: the frames of a flooding client then wait in its TCP connection
+(backpressure) instead of costing the worker a read each.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from app import profiling
+
+WS_MAX_MESSAGE_BYTES = int(os.getenv("WS_MAX_MESSAGE_BYTES", "4096"))
+WS_CLIENT_RATE = float(os.getenv("WS_CLIENT_RATE", "5"))     # messages per second
+WS_CLIENT_BURST = float(os.getenv("WS_CLIENT_BURST", "20"))
+WS_ROOM_RATE = float(os.getenv("WS_ROOM_RATE", "50"))
+WS_ROOM_BURST = float(os.getenv("WS_ROOM_BURST", "100"))
+WS_REJECT_PAUSE = float(os.getenv("WS_REJECT_PAUSE_MS", "200")) / 1000
+
+# accepted / too_large / client_rate / room_rate / invalid
+stats = Counter()
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float = None) -> bool:
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+_room_buckets = {}
+
+def _room_bucket(room_id: int, now: float):
+    bucket = _room_buckets.get(room_id)
+    if bucket is None:
+        if len(_room_buckets) > 10000:
+            # Forget rooms that have been quiet long enough to have a full bucket again
+            for stale in [r for r, b in _room_buckets.items() if now - b.updated > WS_ROOM_BURST / WS_ROOM_RATE]:
+                del _room_buckets[stale]
+        bucket = _room_buckets[room_id] = TokenBucket(WS_ROOM_RATE, WS_ROOM_BURST)
+    return bucket
+
+def client_bucket():
+    """Bucket for a new connection"""
+    return TokenBucket(WS_CLIENT_RATE, WS_CLIENT_BURST)
+
+def check_frame(room_id: int, bucket: TokenBucket, data: str):
+    """Return None if the frame may be processed, otherwise the reason it was dropped"""
+    if len(data) > WS_MAX_MESSAGE_BYTES:
+        reason = "too_large"
+    else:
+        now = time.monotonic()
+        if not bucket.take(now):
+            reason = "client_rate"
+        elif not _room_bucket(room_id, now).take(now):
+            reason = "room_rate"
+        else:
+            return None
+    stats[reason] += 1
+    return reason
+
+async def receive_message(websocket, room_id: int, bucket: TokenBucket):
+    """Wait for the next acceptable JSON object from the socket, dropping the rest"""
+    if profiling.active:
+        profiling.message_done()
+    last_error = 0
+    while True:
+        data = await websocket.receive_text()
+        reason = check_frame(room_id, bucket, data)
+        if reason is None:
+            try:
+                message = json.loads(data)
+            except ValueError:
+                message = None
+            if isinstance(message, dict):
+                stats["accepted"] += 1
+                if profiling.active:
+                    profiling.message_received(websocket, message)
+                return message
+            stats["invalid"] += 1
+            reason = "invalid"
+
+        # Tell the client, but at most once per second so the replies can't become a flood too
+        now = time.monotonic()
+        if now - last_error >= 1:
+            last_error = now
+            await websocket.send_json({"error": "Message rejected", "reason": reason})
+        if WS_REJECT_PAUSE:
+            await asyncio.sleep(WS_REJECT_PAUSE)
+
+def get_ratelimit_stats():
+    return dict(stats)
@@ -0,0 +1,56 @@
+"""
+Resume-on-reconnect for the game WebSockets.
+Every room broadcast carries the room's event sequence number (see event_log). A client that
+reconnects with ?resume=<resume_token>&last_seq=<seq> is sent only the broadcasts it missed,
+straight from the event log, without rebuilding its status. The token is bound to the epoch of
+the room's log; when the log was recreated since (hibernation, handoff, restart), the gap has
+already fallen out of it or the token doesn't check out, the client gets the usual full status
+snapshot instead.
+"""
+from app.game import event_log, clock
+from app.game.websockets import manager
+from app.session import issue_resume_token, verify_resume_token
+
+def _resume_point(websocket, room_id: int, client_id: str):
+    """(epoch, sequence number) the client last saw, or None if it isn't resuming"""
+    params = websocket.query_params
+    last_seq = params.get("last_seq")
+    if last_seq is None or not last_seq.isdigit():
+        return None
+    epoch = verify_resume_token(params.get("resume"), room_id, client_id)
+    if epoch is None:
+        return None
+    return epoch, int(last_seq)
+
+async def send_initial_state(websocket, room_id: int, client_id: str, snapshot):
+    """
+    Replay missed broadcasts or send the snapshot() status, then go live.
+    The socket must have been connected with manager.connect(..., catch_up=True).
+    """
+    try:
+        resume_point = _resume_point(websocket, room_id, client_id)
+        missed = None
+        if resume_point is not None:
+            last_epoch, last_seq = resume_point
+            missed = event_log.since(room_id, last_seq, last_epoch)
+        # Starts the room's log if needed, so the token is bound to the epoch the client sees next
+        epoch, seq = event_log.position(room_id)
+        token = issue_resume_token(room_id, client_id, epoch)
+        if missed is not None:
+            for message in missed:
+                await websocket.send_text(message)
+            await websocket.send_json({
+                "type": "resumed",
+                "replayed": len(missed),
+                "seq": seq,
+                "epoch": epoch,
+                "resume_token": token,
+                "server_time": clock.server_time_ms(),
+            })
+            return "resumed"
+
+        status = await snapshot()
+        await websocket.send_json({"type": "game_update", **status, "seq": seq, "epoch": epoch, "resume_token": token})
+        return status.get("status", "unknown")
+    finally:
+        await manager.finish_catch_up(websocket)
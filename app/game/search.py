@@ -0,0 +1,78 @@
+"""
+Search over cards, questions and memes for the deck builder.
+Each pool gets an inverted index from normalized words to entry positions, plus a sorted
+vocabulary so every query word also matches as a prefix (search as you type). Normalization
+folds case and accents, so "ete" finds "Été". Results come back in pool order and are paginated
+with an opaque cursor (the position of the last entry returned).
+"""
+import bisect
+import re
+import unicodedata
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+def normalize(text: str) -> str:
+    """Lowercase, accent-free form of a text ("L'Été" -> "l'ete")"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+def words(text: str) -> list:
+    return _WORD_RE.findall(normalize(text))
+
+class SearchIndex:
+    def __init__(self, entries: list, text=None):
+        """entries: the pool, in the order results are returned; text(entry) gives the searchable text"""
+        self.entries = entries
+        self._postings = {}
+        for position, entry in enumerate(entries):
+            for word in set(words(text(entry) if text else entry)):
+                self._postings.setdefault(word, []).append(position)
+        self._vocabulary = sorted(self._postings)
+
+    def _matching(self, prefix: str) -> set:
+        """Positions of entries containing a word that starts with prefix"""
+        positions = set()
+        i = bisect.bisect_left(self._vocabulary, prefix)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(prefix):
+            positions.update(self._postings[self._vocabulary[i]])
+            i += 1
+        return positions
+
+    def search(self, query: str = "", where=None, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE):
+        """One page of entries matching every word of query (and where(entry), if given)"""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        query_words = words(query or "")
+        if query_words:
+            # Rarest word first keeps the intersections small
+            candidates = sorted((self._matching(w) for w in query_words), key=len)
+            matches = sorted(set.intersection(*candidates))
+        else:
+            matches = range(len(self.entries))
+
+        start = 0
+        if cursor is not None and cursor.isdigit():
+            start = bisect.bisect_right(matches, int(cursor))
+
+        items, last = [], None
+        for position in matches[start:]:
+            entry = self.entries[position]
+            if where is not None and not where(entry):
+                continue
+            if len(items) == limit:
+                # At least one more match exists after this page
+                return {"items": items, "next_cursor": str(last)}
+            items.append(entry)
+            last = position
+        return {"items": items, "next_cursor": None}
+
+_indexes = {}
+
+def index_for(name: str, entries: list, text=None) -> SearchIndex:
+    """Index of a static pool, built on first use"""
+    index = _indexes.get(name)
+    if index is None or index.entries is not entries:
+        index = _indexes[name] = SearchIndex(entries, text)
+    return index
@@ -0,0 +1,164 @@
+"""
+Read-only spectators.
+Spectators have no Player row and never touch the database. They are kept out of the
+ConnectionManager so player broadcasts stay as fast as before; instead one fan-out task per watched
+room sends them a public view of the room's games (no hands, no captions before voting), encoded
+once per update and sent at most SPECTATOR_RATE times per second however busy the room is.
+"""
+import asyncio
+import logging
+import os
+from app.game import event_log, clock
+from app.game.status_cache import shared_status
+
+logger = logging.getLogger(__name__)
+
+SPECTATOR_RATE = float(os.getenv("SPECTATOR_RATE", "2"))           # updates per second per room
+SPECTATOR_REFRESH = float(os.getenv("SPECTATOR_REFRESH", "5"))     # re-check the view without a broadcast
+SPECTATOR_BATCH_SIZE = int(os.getenv("SPECTATOR_BATCH_SIZE", "500"))
+SPECTATOR_SEND_TIMEOUT = float(os.getenv("SPECTATOR_SEND_TIMEOUT", "2"))
+MAX_SPECTATORS_PER_ROOM = int(os.getenv("MAX_SPECTATORS_PER_ROOM", "2000"))
+
+# Close code of a spectator dropped for not keeping up; the client reconnects for a fresh view
+SLOW_SPECTATOR_CODE = 4408
+
+class _Audience:
+    def __init__(self):
+        self.sockets = set()
+        self.changed = asyncio.Event()
+        self.last_payload = None
+        self.task = None
+
+# room_id -> _Audience
+_audiences = {}
+
+def watchable(room_id: int) -> bool:
+    """Whether the room has a game on this worker"""
+    from app.game import meme, cah, voting
+
+    return any(room_id in module.games for module in (meme, cah, voting))
+
+def _public_view(room_id: int) -> dict:
+    # Imported here: the game modules import the ConnectionManager, which notifies us
+    from app.game import meme, cah, voting
+
+    view = {}
+    for kind, module in (("meme", meme), ("cah", cah)):
+        game = module.games.get(room_id)
+        if game:
+            view[kind] = {
+                **shared_status(kind, room_id, game, module._shared_status),
+                # Absolute deadline so the view doesn't change every second
+                "deadline": clock.server_time_ms(game["start_time"] + game["duration"]),
+            }
+    game = voting.games.get(room_id)
+    if game:
+        if game["finished"]:
+            view["voting"] = {
+                "status": "finished",
+                "winners": game.get("winners", []),
+                "vote_counts": game.get("vote_counts", {}),
+            }
+        else:
+            view["voting"] = {
+                "status": "voting",
+                "question": game["question"],
+                "players": game["players"],
+                "votes_count": len(game["votes"]),
+                "deadline": clock.server_time_ms(game["start_time"] + game["duration"]),
+            }
+    return view
+
+def watching(room_id: int) -> bool:
+    audience = _audiences.get(room_id)
+    return bool(audience and audience.sockets)
+
+def notify(room_id: int):
+    """Called for every room broadcast; the fan-out task picks the change up at its own pace"""
+    audience = _audiences.get(room_id)
+    if audience:
+        audience.changed.set()
+
+async def _send(websocket, payload: str) -> bool:
+    try:
+        await asyncio.wait_for(websocket.send_text(payload), SPECTATOR_SEND_TIMEOUT)
+        return True
+    except Exception:
+        return False
+
+async def _drop(audience: _Audience, websocket):
+    """Remove a spectator that didn't take an update in time and close its socket"""
+    audience.sockets.discard(websocket)
+    try:
+        await asyncio.wait_for(websocket.close(code=SLOW_SPECTATOR_CODE, reason="too-slow"), SPECTATOR_SEND_TIMEOUT)
+    except Exception:
+        pass
+
+async def _fan_out(room_id: int, audience: _Audience):
+    try:
+        while audience.sockets:
+            try:
+                await asyncio.wait_for(audience.changed.wait(), SPECTATOR_REFRESH)
+            except asyncio.TimeoutError:
+                pass
+            audience.changed.clear()
+            if not audience.sockets:
+                break
+
+            # Compared encoded: the view shares dicts with the live game state
+            payload = event_log.encode({"type": "spectator_view", "games": _public_view(room_id)})
+            if payload != audience.last_payload:
+                audience.last_payload = payload
+                sockets = list(audience.sockets)
+                for i in range(0, len(sockets), SPECTATOR_BATCH_SIZE):
+                    batch = sockets[i:i + SPECTATOR_BATCH_SIZE]
+                    results = await asyncio.gather(*(_send(ws, payload) for ws in batch))
+                    # Slow or dead spectators are dropped rather than holding up the others
+                    slow = [websocket for websocket, ok in zip(batch, results) if not ok]
+                    if slow:
+                        await asyncio.gather(*(_drop(audience, ws) for ws in slow))
+            await asyncio.sleep(1 / SPECTATOR_RATE)
+    finally:
+        if _audiences.get(room_id) is audience and not audience.sockets:
+            del _audiences[room_id]
+
+async def join(room_id: int, websocket) -> bool:
+    """Register an accepted socket as spectator and send the current view; False if the room is full"""
+    audience = _audiences.get(room_id)
+    if audience is None:
+        audience = _audiences[room_id] = _Audience()
+    if len(audience.sockets) >= MAX_SPECTATORS_PER_ROOM:
+        return False
+    audience.sockets.add(websocket)
+    sent = await _send(websocket, event_log.encode({
+        "type": "spectator_view",
+        "games": _public_view(room_id),
+        # Reference for the deadlines, later views are only sent when something changes
+        "server_time": clock.server_time_ms(),
+    }))
+    if not sent:
+        await _drop(audience, websocket)
+        return True
+    if audience.task is None or audience.task.done():
+        audience.task = asyncio.create_task(_fan_out(room_id, audience))
+    return True
+
+def leave(room_id: int, websocket):
+    audience = _audiences.get(room_id)
+    if audience:
+        audience.sockets.discard(websocket)
+        # Wake the fan-out task so it notices an empty room and exits
+        audience.changed.set()
+
+def connections():
+    """(room_id, websocket) of every spectator, for the heartbeat"""
+    return [(room_id, websocket) for room_id, audience in list(_audiences.items()) for websocket in list(audience.sockets)]
+
+def spectator_count() -> int:
+    return sum(len(a.sockets) for a in _audiences.values())
+
+def get_spectator_stats():
+    return {
+        "rooms": len(_audiences),
+        "spectators": spectator_count(),
+    }
@@ -0,0 +1,149 @@
+"""
+Export / import of a room's in-memory game state.
+Used to hand a live room over to another worker and to checkpoint games across restarts.
+"""
+import asyncio
+import copy
+import json
+import logging
+import zlib
+from app.game import status_cache, event_log, decks, clock
+from app.game import meme, cah, voting
+from app.game.meme_timer import start_meme_timer, stop_meme_timer
+from app.game.game_timer import start_game_timer, stop_game_timer
+from app.game.voting_timer import start_voting_timer, stop_voting_timer
+
+logger = logging.getLogger(__name__)
+
+# kind -> (games dict, start timer, stop timer)
+GAME_MODULES = {
+    "meme": (meme.games, start_meme_timer, stop_meme_timer),
+    "cah": (cah.games, start_game_timer, stop_game_timer),
+    "voting": (voting.games, start_voting_timer, stop_voting_timer),
+}
+
+class _Pool:
+    """Packs items of a static pool (cards, questions, memes) as their index in that pool"""
+    def __init__(self, pool: list, key=None):
+        self.pool = pool
+        self.key = key or (lambda item: item)
+        self.index = {self.key(item): i for i, item in enumerate(pool)}
+
+    def pack(self, item):
+        i = self.index.get(self.key(item))
+        # Items that are not in the pool are kept as is
+        return i if i is not None and self.pool[i] == item else item
+
+    def unpack(self, item):
+        return self.pool[item] if isinstance(item, int) else item
+
+_cards = _Pool(cah.CARD_POOL)
+_cah_questions = _Pool(cah.QUESTION_POOL, key=lambda q: q["id"])
+_memes = _Pool(meme.MEME_POOL, key=lambda m: m["id"])
+_voting_questions = _Pool(voting.QUESTION_POOL)
+
+# kind -> {field: (pool, shape)}; shuffled deck copies dominate a snapshot's size
+PACKED_FIELDS = {
+    "cah": {
+        "card_pool": (_cards, "list"),
+        "player_hands": (_cards, "hands"),
+        "question_pool": (_cah_questions, "list"),
+        "current_question": (_cah_questions, "item"),
+    },
+    "meme": {
+        "meme_pool": (_memes, "list"),
+        "current_meme": (_memes, "item"),
+    },
+    "voting": {
+        "questions": (_voting_questions, "list"),
+    },
+}
+
+def _convert(value, pool: _Pool, shape: str, convert):
+    if value is None:
+        return None
+    if shape == "item":
+        return convert(value)
+    if shape == "list":
+        if isinstance(value, dict):
+            return decks.unpack_pile(value)
+        if isinstance(value, decks.DrawPile):
+            packed = decks.pack_pile(value)
+            if packed is not None:
+                return packed
+        return [convert(item) for item in value]
+    return {player: [convert(item) for item in hand] for player, hand in value.items()}
+
+def _pack_game(kind: str, game: dict) -> dict:
+    packed = dict(game)
+    if "start_time" in packed:
+        # Monotonic readings are meaningless in another process
+        packed["start_time"] = clock.to_wall(packed["start_time"])
+    for field, (pool, shape) in PACKED_FIELDS.get(kind, {}).items():
+        if field in packed:
+            packed[field] = _convert(packed[field], pool, shape, pool.pack)
+    return packed
+
+def _unpack_game(kind: str, game: dict) -> dict:
+    if "start_time" in game:
+        game["start_time"] = clock.from_wall(game["start_time"])
+    for field, (pool, shape) in PACKED_FIELDS.get(kind, {}).items():
+        if field in game:
+            game[field] = _convert(game[field], pool, shape, pool.unpack)
+    return game
+
+def local_room_ids():
+    """All room ids with a game running on this worker"""
+    room_ids = set()
+    for games_dict, _, _ in GAME_MODULES.values():
+        room_ids.update(games_dict.keys())
+    return room_ids
+
+def export_room(room_id: int, copy_state: bool = True):
+    """
+    Return a JSON-serializable snapshot of every game running in the room, or None.
+    Pass copy_state=False when the snapshot is serialized right away, before any await.
+    """
+    snapshot = {}
+    for kind, (games_dict, _, _) in GAME_MODULES.items():
+        if room_id in games_dict:
+            game = _pack_game(kind, games_dict[room_id])
+            snapshot[kind] = copy.deepcopy(game) if copy_state else game
+    return snapshot or None
+
+def import_room(room_id: int, snapshot: dict):
+    """Install a snapshot produced by export_room and re-arm its timers; call from the event loop"""
+    # Timers are tasks: fail before installing anything rather than leave games without one
+    asyncio.get_running_loop()
+    games = {}
+    for kind, game in snapshot.items():
+        if kind not in GAME_MODULES:
+            logger.warning(f"[STATE] Room {room_id}: ignoring unknown game kind '{kind}'")
+            continue
+        games[kind] = _unpack_game(kind, game)
+    for kind, game in games.items():
+        games_dict, start_timer, _ = GAME_MODULES[kind]
+        # A timer already running for the room simply picks up the new dict
+        games_dict[room_id] = game
+        if start_timer:
+            start_timer(room_id, games_dict)
+    # A timer already running sleeps until the old deadline otherwise
+    clock.notify(room_id)
+    logger.info(f"[STATE] Room {room_id}: imported {list(snapshot.keys())}")
+
+def drop_room(room_id: int):
+    """Stop timers and forget every game of the room on this worker"""
+    for games_dict, _, stop_timer in GAME_MODULES.values():
+        if stop_timer:
+            stop_timer(room_id)
+        games_dict.pop(room_id, None)
+    status_cache.invalidate(room_id)
+    event_log.drop(room_id)
+    decks.room_decks.pop(room_id, None)
+
+def dump_snapshot(snapshot: dict) -> bytes:
+    return json.dumps(snapshot, separators=(",", ":")).encode()
+
+def compress_dump(dump: bytes) -> bytes:
+    """Compact binary form of a dumped snapshot"""
+    return zlib.compress(dump, 6)
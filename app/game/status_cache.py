@@ -0,0 +1,23 @@
+"""
+Cache of the shared part of game status responses.
+Every game dict carries a "version" that is bumped on each state change. The part of the status
+that is identical for all players is built once per (room, version) and each request only adds
+its small per-player overlay (is_creator, is_czar, player_hand, ...).
+"""
+
+# (kind, room_id) -> (game, version, payload)
+_cache = {}
+
+def shared_status(kind: str, room_id: int, game: dict, build):
+    """Return build(game), rebuilt only when the game or its version changed"""
+    key = (kind, room_id)
+    entry = _cache.get(key)
+    if entry and entry[0] is game and entry[1] == game["version"]:
+        return entry[2]
+    payload = build(game)
+    _cache[key] = (game, game["version"], payload)
+    return payload
+
+def invalidate(room_id: int):
+    for key in [key for key in _cache if key[1] == room_id]:
+        del _cache[key]
@@ -0,0 +1,44 @@
+"""
+Incrementally maintained vote tallies.
+A tally is a plain dict (so game state stays JSON-serializable for checkpoints and handoffs):
+    {"counts": {candidate: total}, "leaders": [candidates with the top total], "top": top total}
+Counts and leaders are updated as each vote arrives, so status calls and result broadcasts read
+them directly instead of re-counting every vote.
+"""
+
+def new_tally():
+    return {"counts": {}, "leaders": [], "top": None}
+
+def add_vote(tally: dict, candidate: str, amount: int = 1):
+    counts = tally["counts"]
+    total = counts.get(candidate, 0) + amount
+    counts[candidate] = total
+    if tally["top"] is None or total > tally["top"]:
+        tally["top"] = total
+        tally["leaders"] = [candidate]
+    elif total == tally["top"]:
+        if candidate not in tally["leaders"]:
+            tally["leaders"].append(candidate)
+    elif candidate in tally["leaders"]:
+        # Only reachable with negative amounts
+        _recompute_leaders(tally)
+
+def remove_vote(tally: dict, candidate: str, amount: int = 1):
+    """Take back a vote (e.g. a player changing their vote)"""
+    counts = tally["counts"]
+    if candidate not in counts:
+        return
+    counts[candidate] -= amount
+    if counts[candidate] == 0:
+        del counts[candidate]
+    if candidate in tally["leaders"]:
+        _recompute_leaders(tally)
+
+def _recompute_leaders(tally: dict):
+    counts = tally["counts"]
+    tally["top"] = max(counts.values(), default=None)
+    tally["leaders"] = [c for c, total in counts.items() if total == tally["top"]]
+
+def sole_leader(tally: dict):
+    """The single leading candidate, or None if nobody leads or there is a tie"""
+    return tally["leaders"][0] if len(tally["leaders"]) == 1 else None
@@ -0,0 +1,28 @@
+from datetime import datetime, timezone
+from app.models import Player
+from app.game import clock
+
+# Minimum seconds between two last_seen writes for the same player
+LAST_SEEN_INTERVAL = 60
+
+_last_touched = {}
+
+def touch_player(db, room_id: int, client_id: str):
+    """
+    Refresh a player's last_seen, at most once per LAST_SEEN_INTERVAL.
+    last_seen only feeds the 120 minute room cleanup, so polls don't each need a write.
+    """
+    if not client_id:
+        return
+    key = (room_id, client_id)
+    now = clock.now()
+    if now - _last_touched.get(key, float("-inf")) < LAST_SEEN_INTERVAL:
+        return
+    if len(_last_touched) > 10000:
+        for stale in [k for k, t in _last_touched.items() if now - t >= LAST_SEEN_INTERVAL]:
+            del _last_touched[stale]
+    _last_touched[key] = now
+    db.query(Player).filter_by(user_id=client_id, room_id=room_id).update(
+        {"last_seen": datetime.now(timezone.utc)}, synchronize_session=False
+    )
+    db.commit()
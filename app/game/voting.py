@@ -1,69 +1,96 @@
-import time, json, random
-from app.models import Player, Room
-from datetime import datetime, timezone
+import json, random
+from app.game import clock
+from app.models import Player
+from app.game.websockets import manager
+from app.game.voting_timer import start_voting_timer, stop_voting_timer
+from app.game.utils import touch_player
+from app.game.tally import new_tally, add_vote, remove_vote
 
 with open("questions.json", encoding="utf-8") as f:
     QUESTION_POOL = json.load(f)
 
 games = {}
 
-def start_voting_game(room_id: int, players: list[str]):
+def start_voting_game(room_id: int, players: list[str], creator_id: str = None):
     questions = QUESTION_POOL.copy()
     random.shuffle(questions)
     games[room_id] = {
         "players": players,
+        "creator": creator_id,
         "questions": questions,
         "question": questions.pop(),
         "votes": {},
-        "start_time": time.time(),
+        "vote_tally": new_tally(),
+        "start_time": clock.now(),
         "duration": 20,
         "finished": False
     }
 
-def game_status_logic(room_id, request, db):
-    client_id = request.headers.get("x-client-id")
-    player = db.query(Player).filter_by(user_id=client_id, room_id=room_id).first()
-    room = db.query(Room).filter_by(id=room_id).first()
-    room_creator = room.creator
-    if player:
-        player.last_seen = datetime.now(timezone.utc)
-        db.commit()
+    # Start background timer to end each question on time and push results
+    start_voting_timer(room_id, games)
+
+def finish_question(game):
+    """Close the current question and freeze its winners (called by the timer)"""
+    game["finished"] = True
+    game["winners"] = list(game["vote_tally"]["leaders"])
+    game["vote_counts"] = dict(game["vote_tally"]["counts"])
 
+def get_status(room_id, client_id):
+    """Current game status for a player, built from memory only"""
     game = games.get(room_id)
     if not game:
         return {"status": "no_game"}
 
-    now = time.time()
-    if not game["finished"] and now - game["start_time"] < game["duration"]:
+    if not game["finished"]:
         return {
             "status": "voting",
             "question": game["question"],
             "players": game["players"],
             "votes_count": len(game["votes"]),
             "voters": list(game["votes"].keys()),
-            "remaining": int(game["duration"] - (now - game["start_time"]))
+            **clock.timing(game),
         }
 
-    if not game["finished"]:
-        vote_counts = {}
-        for v in game["votes"].values():
-            vote_counts[v] = vote_counts.get(v, 0) + 1
-        max_votes = max(vote_counts.values(), default=0)
-        winners = [p for p, c in vote_counts.items() if c == max_votes]
-        game["finished"] = True
-        game["winners"] = winners
-        game["vote_counts"] = vote_counts
-
+    # NOTE: the question is closed by the background voting timer, not here
     return {
         "status": "finished",
         "winners": game.get("winners", []),
         "vote_counts": game.get("vote_counts", {}),
-        "can_proceed": player and client_id == room_creator,
+        "can_proceed": client_id is not None and client_id == game.get("creator"),
     }
 
-def next_question_logic(room_id, request, db):
+def game_status_logic(room_id, request, db):
     client_id = request.headers.get("x-client-id")
-    player = db.query(Player).filter_by(user_id=client_id, room_id=room_id).first()
+    touch_player(db, room_id, client_id)
+    return get_status(room_id, client_id)
+
+async def submit_vote_logic(room_id, voter_id, vote_for, db):
+    """Register a vote and let the room know how many votes are in"""
+    game = games.get(room_id)
+    if not game or game["finished"]:
+        return {"error": "Voting is not active"}
+
+    if not voter_id or not db.query(Player).filter_by(user_id=voter_id, room_id=room_id).first():
+        return {"error": "Player not found"}
+
+    if vote_for not in game["players"]:
+        return {"error": "Invalid vote"}
+
+    previous = game["votes"].get(voter_id)
+    if previous is not None:
+        remove_vote(game["vote_tally"], previous)
+    game["votes"][voter_id] = vote_for
+    add_vote(game["vote_tally"], vote_for)
+
+    await manager.broadcast(room_id, {
+        "type": "player_voted",
+        "votes_count": len(game["votes"]),
+        "voters": list(game["votes"].keys()),
+    })
+
+    return {"success": True}
+
+async def next_question_logic(room_id, db=None):
     game = games.get(room_id)
     if not game or not game["finished"]:
         return {"status": "cannot_advance"}
@@ -72,8 +99,21 @@ def next_question_logic(room_id, request, db):
         game.update({
             "question": question,
             "votes": {},
-            "start_time": time.time(),
+            "vote_tally": new_tally(),
+            "start_time": clock.now(),
             "finished": False
         })
+        await manager.broadcast(room_id, {
+            "type": "game_update",
+            "status": "voting",
+            "question": question,
+            "players": game["players"],
+            "votes_count": 0,
+            "voters": [],
+            **clock.timing(game),
+        })
         return {"status": "voting", "question": question}
+
+    stop_voting_timer(room_id)
+    await manager.broadcast(room_id, {"type": "game_over"})
     return {"status": "game_over", "message": "No more questions"}
@@ -0,0 +1,89 @@
+"""
+Voting game timer.
+Closes each question when its time is up (or once everybody voted) and pushes the results,
+so clients no longer have to poll game_status to find out.
+"""
+import asyncio
+import logging
+from app.game.websockets import manager
+from app.game import actor, clock
+
+logger = logging.getLogger(__name__)
+
+# Active voting game timers
+_active_voting_timers = {}
+
+async def _tick(room_id: int, games_dict: dict):
+    """Close the current question if it is due (runs inside the room's actor)"""
+    from app.game.voting import finish_question
+
+    game = games_dict.get(room_id)
+    if not game or game["finished"]:
+        return
+    remaining = clock.remaining(game)
+    everyone_voted = len(game["votes"]) >= len(game["players"])
+
+    if remaining <= 0 or everyone_voted:
+        logger.info(f"[VOTING_TIMER] Room {room_id}: Closing question")
+        finish_question(game)
+
+        await manager.broadcast(room_id, {
+            "type": "game_update",
+            "status": "finished",
+            "winners": game["winners"],
+            "vote_counts": game["vote_counts"],
+        })
+
+def _deadline(game):
+    """Deadline of the current question; a finished one waits for the next question"""
+    if game and not game["finished"]:
+        return game["start_time"] + game["duration"]
+    return None
+
+async def voting_timer_loop(room_id: int, games_dict: dict):
+    """
+    Background task that closes questions for a voting game room.
+    """
+    logger.info(f"[VOTING_TIMER] Starting voting game timer for room {room_id}")
+
+    changed = clock.watch(room_id)
+    try:
+        while room_id in games_dict:
+            # Cleared before the tick: anything that happens from here on wakes us again
+            changed.clear()
+            await actor.run(room_id, _tick, room_id, games_dict)
+            await clock.sleep_until(changed, _deadline(games_dict.get(room_id)))
+
+    except asyncio.CancelledError:
+        logger.info(f"[VOTING_TIMER] Voting game timer cancelled for room {room_id}")
+        raise
+    except Exception as e:
+        logger.error(f"[VOTING_TIMER] Error in voting game timer for room {room_id}: {e}", exc_info=True)
+    finally:
+        logger.info(f"[VOTING_TIMER] Voting game timer stopped for room {room_id}")
+        # Only unregister ourselves, not a newer timer started for the same room
+        if _active_voting_timers.get(room_id) is asyncio.current_task():
+            del _active_voting_timers[room_id]
+        clock.unwatch(room_id, changed)
+
+def start_voting_timer(room_id: int, games_dict: dict, db_factory=None):
+    """Start a background timer task for a voting game room"""
+    if room_id in _active_voting_timers:
+        logger.warning(f"[VOTING_TIMER] Timer already running for room {room_id}")
+        return
+
+    task = asyncio.create_task(voting_timer_loop(room_id, games_dict))
+    _active_voting_timers[room_id] = task
+    logger.info(f"[VOTING_TIMER] Started timer task for room {room_id}")
+
+def stop_voting_timer(room_id: int):
+    """Stop the background timer task for a voting game room"""
+    if room_id in _active_voting_timers:
+        task = _active_voting_timers[room_id]
+        task.cancel()
+        del _active_voting_timers[room_id]
+        logger.info(f"[VOTING_TIMER] Stopped timer task for room {room_id}")
+
+def get_active_voting_timers():
+    """Get list of room IDs with active voting timers (for debugging)"""
+    return list(_active_voting_timers.keys())
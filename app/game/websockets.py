@@ -1,31 +1,95 @@
 # app/websockets.py
 
+import asyncio
 from fastapi import WebSocket
 from typing import Dict, List
+from app.admission import MAX_CONNECTIONS, RETRY_AFTER_SECONDS
+from app.game import event_log, spectators, clock
 
 class ConnectionManager:
     def __init__(self):
         self.active_connections: Dict[int, List[WebSocket]] = {}
+        # room_id -> (holding task, queued messages), see hold()/release()
+        self._held: Dict[int, tuple] = {}
+        # websocket -> broadcasts queued while the socket is catching up, see finish_catch_up()
+        self._catching_up: Dict[WebSocket, list] = {}
+        self.connection_count = 0
 
-    async def connect(self, room_id: int, websocket: WebSocket):
+    async def connect(self, room_id: int, websocket: WebSocket, catch_up: bool = False) -> bool:
+        """
+        Accept and register the socket; returns False if it was refused for lack of capacity.
+        With catch_up=True broadcasts are queued for the socket until finish_catch_up(), so the
+        initial state can be sent first without live messages overtaking it.
+        """
         await websocket.accept()
+        if self.connection_count >= MAX_CONNECTIONS:
+            print(f"[ADMISSION] Refusing WebSocket for room {room_id}: {self.connection_count} connections")
+            # 1013 = Try Again Later
+            await websocket.close(code=1013, reason=f"retry-after={RETRY_AFTER_SECONDS}")
+            return False
+        self.connection_count += 1
         if room_id not in self.active_connections:
             self.active_connections[room_id] = []
         self.active_connections[room_id].append(websocket)
+        if catch_up:
+            self._catching_up[websocket] = []
+        return True
+
+    async def finish_catch_up(self, websocket: WebSocket):
+        """Send the broadcasts queued since connect() and switch the socket to live delivery"""
+        while websocket in self._catching_up:
+            queued = self._catching_up[websocket]
+            if not queued:
+                del self._catching_up[websocket]
+                return
+            self._catching_up[websocket] = []
+            for message in queued:
+                await websocket.send_text(message)
 
     def disconnect(self, room_id: int, websocket: WebSocket):
+        self._catching_up.pop(websocket, None)
         if room_id in self.active_connections:
-            self.active_connections[room_id].remove(websocket)
+            # May already have been dropped by the heartbeat task
+            if websocket in self.active_connections[room_id]:
+                self.active_connections[room_id].remove(websocket)
+                self.connection_count -= 1
             if not self.active_connections[room_id]:
                 del self.active_connections[room_id]
 
+    def hold(self, room_id: int):
+        """Queue broadcasts made by the current task for this room until release()"""
+        self._held[room_id] = (asyncio.current_task(), [])
+
+    async def release(self, room_id: int):
+        """Send every broadcast queued since hold(), in order, in one pass over the connections"""
+        _, messages = self._held.pop(room_id, (None, []))
+        if messages:
+            await self._send(room_id, messages)
+
     async def broadcast(self, room_id: int, message: dict):
-        connections = self.active_connections.get(room_id, [])
-        print(f"[BROADCAST] Sending to {len(connections)} connections in room {room_id}: {message.get('type', 'unknown')}")
+        # Every room-wide message is sequenced in the room's event log and encoded only once
+        _, _, encoded = event_log.record(room_id, message)
+        spectators.notify(room_id)
+        clock.notify(room_id)
+        held = self._held.get(room_id)
+        if held and held[0] is asyncio.current_task():
+            held[1].append(encoded)
+            return
+        await self._send(room_id, [encoded])
+
+    async def _send(self, room_id: int, messages: list):
+        connections = list(self.active_connections.get(room_id, []))
+        print(f"[BROADCAST] Sending {len(messages)} messages to {len(connections)} connections in room {room_id}")
         for connection in connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"[BROADCAST] Failed to send to connection: {e}")
+            queued = self._catching_up.get(connection)
+            if queued is not None:
+                queued.extend(messages)
+                continue
+            for message in messages:
+                try:
+                    await connection.send_text(message)
+                except Exception as e:
+                    print(f"[BROADCAST] Failed to send to connection: {e}")
+                    break
 
 manager = ConnectionManager()
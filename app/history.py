@@ -0,0 +1,207 @@
+"""
+Match history and leaderboards.
+Finished rounds and games are queued in memory and written by a write-behind task in batches, so
+ending a round never waits on the database. Each batch also increments the aggregate tables
+(player_weekly_stats, entry_stats) with deltas summed in Python first, one upsert per touched row;
+leaderboard queries read those precomputed rows and never scan match_rounds.
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, insert
+from app.db import SessionLocal, engine
+from app.models import MatchRound, MatchResult, PlayerWeeklyStats, EntryStats
+
+logger = logging.getLogger(__name__)
+
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "2"))
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "500"))     # flush early past this many records
+HISTORY_MAX_PENDING = int(os.getenv("HISTORY_MAX_PENDING", "50000"))  # kept for retry after a failed write
+
+_rounds = []               # MatchRound rows waiting to be written
+_results = []              # MatchResult rows waiting to be written
+_wake = None               # created by history_writer_task on the running loop
+
+def week_of(moment: datetime):
+    """Monday (UTC) of the week a moment falls in; leaderboards are kept per week"""
+    day = moment.astimezone(timezone.utc).date()
+    return day - timedelta(days=day.weekday())
+
+def _queue(rows: list, row: dict):
+    rows.append(row)
+    if _wake is not None and len(_rounds) + len(_results) >= HISTORY_BATCH_SIZE:
+        _wake.set()
+
+def record_round(room_id: int, game: str, round_no: int, item_id, winners: list, winning_entry,
+                 points: dict, usernames: dict, played: list = ()):
+    """
+    Queue a finished round. winners and points are keyed by player id (client id where known),
+    usernames maps player ids to display names, played lists the entries (cards or meme) in play.
+    """
+    _queue(_rounds, {
+        "room_id": room_id,
+        "game": game,
+        "round": round_no,
+        "item_id": item_id,
+        "winners": list(winners),
+        "winning_entry": winning_entry,
+        "scores": dict(points),
+        "usernames": {player_id: usernames[player_id] for player_id in points if player_id in usernames},
+        "played": list(played),
+        "finished_at": datetime.now(timezone.utc),
+    })
+
+def record_game(room_id: int, game: str, rounds: int, winners: list, scores: dict, usernames: dict):
+    """Queue a finished game; scores are the final scores by player id"""
+    _queue(_results, {
+        "room_id": room_id,
+        "game": game,
+        "rounds": rounds,
+        "winners": list(winners),
+        "scores": dict(scores),
+        "usernames": {player_id: usernames[player_id] for player_id in scores if player_id in usernames},
+        "finished_at": datetime.now(timezone.utc),
+    })
+
+def _aggregate(rounds: list, results: list):
+    """Sum the batch into one delta per aggregate row"""
+    players, entries = {}, {}
+
+    def player(row, player_id):
+        key = (week_of(row["finished_at"]), row["game"], player_id)
+        delta = players.get(key)
+        if delta is None:
+            delta = players[key] = {
+                "username": None, "points": 0, "round_wins": 0, "games_played": 0, "games_won": 0,
+            }
+        delta["username"] = row["usernames"].get(player_id, delta["username"])
+        return delta
+
+    def entry(game, name):
+        key = (game, str(name))
+        if key not in entries:
+            entries[key] = {"plays": 0, "wins": 0}
+        return entries[key]
+
+    for row in rounds:
+        for player_id, points in row["scores"].items():
+            player(row, player_id)["points"] += points
+        for player_id in row["winners"]:
+            player(row, player_id)["round_wins"] += 1
+        for name in row["played"]:
+            entry(row["game"], name)["plays"] += 1
+        if row["winners"]:
+            winning = row["winning_entry"] if row["game"] == "cah" else [row["item_id"]]
+            for name in set(winning or ()):
+                entry(row["game"], name)["wins"] += 1
+    for row in results:
+        for player_id in row["scores"]:
+            player(row, player_id)["games_played"] += 1
+        for player_id in row["winners"]:
+            player(row, player_id)["games_won"] += 1
+    return players, entries
+
+def _upsert(db, model, rows: list, keys: list, counters: list, replaced: list = ()):
+    """Insert rows; on conflict add the counters to the existing row and update the replaced columns if given"""
+    if not rows:
+        return
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    stmt = dialect_insert(model)
+    update = {column: getattr(model, column) + getattr(stmt.excluded, column) for column in counters}
+    update.update({
+        column: func.coalesce(getattr(stmt.excluded, column), getattr(model, column)) for column in replaced
+    })
+    db.execute(stmt.on_conflict_do_update(index_elements=keys, set_=update), rows)
+
+def _write(rounds: list, results: list):
+    players, entries = _aggregate(rounds, results)
+    with SessionLocal() as db:
+        if rounds:
+            db.execute(insert(MatchRound), [
+                {
+                    "room_id": row["room_id"],
+                    "game": row["game"],
+                    "round": row["round"],
+                    "item_id": None if row["item_id"] is None else str(row["item_id"]),
+                    "winners": json.dumps(row["winners"]),
+                    "winning_entry": json.dumps(row["winning_entry"], ensure_ascii=False),
+                    "scores": json.dumps(row["scores"]),
+                    "finished_at": row["finished_at"],
+                }
+                for row in rounds
+            ])
+        if results:
+            db.execute(insert(MatchResult), [
+                {
+                    "room_id": row["room_id"],
+                    "game": row["game"],
+                    "rounds": row["rounds"],
+                    "winners": json.dumps(row["winners"]),
+                    "scores": json.dumps(row["scores"]),
+                    "finished_at": row["finished_at"],
+                }
+                for row in results
+            ])
+        _upsert(db, PlayerWeeklyStats, [
+            {"week": week, "game": game, "player_id": player_id, **delta}
+            for (week, game, player_id), delta in players.items()
+        ], ["week", "game", "player_id"], ["points", "round_wins", "games_played", "games_won"], ["username"])
+        _upsert(db, EntryStats, [
+            {"game": game, "entry": name, **delta}
+            for (game, name), delta in entries.items()
+        ], ["game", "entry"], ["plays", "wins"])
+        db.commit()
+
+async def flush_history():
+    """Write everything queued so far in one transaction"""
+    global _rounds, _results
+    rounds, results = _rounds, _results
+    if not rounds and not results:
+        return
+    _rounds, _results = [], []
+    try:
+        await asyncio.to_thread(_write, rounds, results)
+    except Exception as e:
+        logger.error(f"[HISTORY] Failed to write {len(rounds)} rounds and {len(results)} games: {e}")
+        # Retry with the next batch, dropping the oldest records if the database stays away
+        _rounds[:0] = rounds[-HISTORY_MAX_PENDING:]
+        _results[:0] = results[-HISTORY_MAX_PENDING:]
+        del _rounds[:-HISTORY_MAX_PENDING]
+        del _results[:-HISTORY_MAX_PENDING]
+
+async def history_writer_task():
+    global _wake
+    _wake = asyncio.Event()
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), HISTORY_FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+        await asyncio.shield(flush_history())
+
+def top_players(db, game: str, week, limit: int = 20):
+    return (
+        db.query(PlayerWeeklyStats)
+        .filter(PlayerWeeklyStats.week == week, PlayerWeeklyStats.game == game)
+        .order_by(PlayerWeeklyStats.points.desc())
+        .limit(limit)
+        .all()
+    )
+
+def top_entries(db, game: str, limit: int = 20):
+    return (
+        db.query(EntryStats)
+        .filter(EntryStats.game == game, EntryStats.wins > 0)
+        .order_by(EntryStats.wins.desc())
+        .limit(limit)
+        .all()
+    )
+
+def get_history_stats():
+    return {"pending_rounds": len(_rounds), "pending_games": len(_results)}
@@ -5,6 +5,17 @@ from .db import init_db
 from contextlib import asynccontextmanager
 from .routes import general, room, voting, meme, websockets, cah
 from .tasks.cleanup import cleanup_empty_rooms_task
+from .tasks.heartbeat import heartbeat_task
+from .tasks.checkpoint import checkpoint_task, checkpoint_games, restore_games
+from .tasks.hibernation import hibernation_task
+from .routes import internal, assets, leaderboard
+from .sharding import room_affinity_middleware
+from .profiling import ProfilingMiddleware
+from .rooms import room_writer_task, flush_rooms, release_codes
+from .history import history_writer_task, flush_history
+from .assets import build_assets
+from . import render, watchdog
+from .game.meme import MEME_POOL
 import asyncio
 import os
 from dotenv import load_dotenv
@@ -20,15 +31,39 @@ if not os.getenv("DATABASE_URL"):
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
+    # Logs (and keeps) the stack whenever something blocks the event loop
+    watchdog.start()
+    # Resume games that were running before the restart; clients resync on reconnect
+    restore_games()
     cleanup_task = asyncio.create_task(cleanup_empty_rooms_task())
+    # Single heartbeat sweep for every WebSocket instead of one keepalive task per socket
+    heartbeat = asyncio.create_task(heartbeat_task())
+    checkpoint = asyncio.create_task(checkpoint_task())
+    # Serialize rooms nobody is connected to, they wake up on the next request
+    hibernate = asyncio.create_task(hibernation_task())
+    # Write-behind inserts for rooms created in memory by /create_room
+    room_writer = asyncio.create_task(room_writer_task())
+    # Batched writes of finished rounds and games, and the leaderboard aggregates
+    history_writer = asyncio.create_task(history_writer_task())
+    # Hash and resize meme images in the background; templates get image URLs once it's done
+    asyncio.create_task(asyncio.to_thread(build_assets, MEME_POOL))
     yield
         # 🧹 On shutdown
-    for task in (cleanup_task):
+    for task in (cleanup_task, heartbeat, checkpoint, hibernate, room_writer, history_writer):
         task.cancel()
         try:
             await task
         except asyncio.CancelledError:
             pass
+    render.shutdown()
+    # Rooms still queued must exist before their games are checkpointed
+    await flush_rooms()
+    # The next worker picks up the room codes this one didn't hand out
+    await release_codes()
+    await flush_history()
+    # Final checkpoint so a deploy loses nothing since the last periodic one
+    await checkpoint_games()
+    watchdog.stop()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -51,6 +86,12 @@ print(f"🌐 CORS allowed origins: {allowed_origins}")
 print(f"🧩 CORS origin regex: {origin_regex}")
 print(f"🔐 Environment: {'Production' if os.getenv('DATABASE_URL') else 'Development'}")
 
+# Innermost, so sampled requests run in the same task as their route
+app.add_middleware(ProfilingMiddleware)
+
+# Registered before CORS so that redirects to another worker still carry CORS headers
+app.middleware("http")(room_affinity_middleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
@@ -72,3 +113,6 @@ app.include_router(voting.router, prefix="/voting")
 app.include_router(meme.router, prefix ="/meme")
 app.include_router(cah.router, prefix="/cah")
 app.include_router(websockets.router)
+app.include_router(internal.router, prefix="/internal")
+app.include_router(assets.router, prefix="/assets")
+app.include_router(leaderboard.router, prefix="/leaderboard")
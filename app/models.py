@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, create_engine, ForeignKey
+from sqlalchemy import Column, Integer, String, create_engine, ForeignKey, LargeBinary, Text, Date, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy import DateTime
@@ -23,3 +23,71 @@ class Player(Base):
 
     room = relationship("Room", back_populates="players")
 
+class RoomCodeBlock(Base):
+    """A block of room codes reserved by one worker, see app/rooms.py"""
+    __tablename__ = "room_code_blocks"
+    block = Column(Integer, primary_key=True, autoincrement=False)
+    # NULL while a worker holds the block (or used it up); next unused code once released
+    position = Column(Integer, nullable=True)
+    reserved_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+class CustomDeck(Base):
+    """Uploaded CAH deck, keyed by the hash of its content (see app/game/decks.py)"""
+    __tablename__ = "custom_decks"
+    id = Column(String, primary_key=True)
+    data = Column(LargeBinary, nullable=False)  # zlib-compressed JSON {"cards", "questions"}
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+class GameCheckpoint(Base):
+    __tablename__ = "game_checkpoints"
+    room_id = Column(Integer, ForeignKey("rooms.id", ondelete="CASCADE"), primary_key=True)
+    data = Column(LargeBinary)  # zlib-compressed JSON snapshot of the room's games
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+
+class MatchRound(Base):
+    """One finished round (raw history, written in batches by app/history.py)"""
+    __tablename__ = "match_rounds"
+    id = Column(Integer, primary_key=True)
+    room_id = Column(Integer, index=True)
+    game = Column(String)  # "cah" or "meme"
+    round = Column(Integer)
+    item_id = Column(String)  # CAH question id or meme id
+    winners = Column(Text)  # JSON list of player ids
+    winning_entry = Column(Text)  # JSON: winning cards or captions
+    scores = Column(Text)  # JSON {player id: points}
+    finished_at = Column(DateTime(timezone=True), index=True)
+
+class MatchResult(Base):
+    """One finished game"""
+    __tablename__ = "match_results"
+    id = Column(Integer, primary_key=True)
+    room_id = Column(Integer, index=True)
+    game = Column(String)
+    rounds = Column(Integer)
+    winners = Column(Text)  # JSON list of player ids
+    scores = Column(Text)  # JSON {player id: final points}
+    finished_at = Column(DateTime(timezone=True), index=True)
+
+class PlayerWeeklyStats(Base):
+    """Leaderboard aggregate, incremented with every batch of history"""
+    __tablename__ = "player_weekly_stats"
+    week = Column(Date, primary_key=True)  # Monday of the ISO week (UTC)
+    game = Column(String, primary_key=True)
+    player_id = Column(String, primary_key=True)
+    username = Column(String)
+    points = Column(Integer, default=0)
+    round_wins = Column(Integer, default=0)
+    games_played = Column(Integer, default=0)
+    games_won = Column(Integer, default=0)
+    # "top players this week": top rows of one week and game read straight off the index
+    __table_args__ = (Index("ix_player_weekly_stats_ranking", "week", "game", "points"),)
+
+class EntryStats(Base):
+    """How often a card (CAH) or meme was played and won a round, incremented with every batch of history"""
+    __tablename__ = "entry_stats"
+    game = Column(String, primary_key=True)
+    entry = Column(String, primary_key=True)
+    plays = Column(Integer, default=0)
+    wins = Column(Integer, default=0)
+    # "funniest card": top rows of one game read straight off the index
+    __table_args__ = (Index("ix_entry_stats_game_wins", "game", "wins"),)
@@ -0,0 +1,191 @@
+"""
+On-demand profiling of HTTP requests and WebSocket message dispatches (admin only, off by default).
+While enabled, a fraction of requests and WS messages is sampled. Their wall time is recorded per
+handler, and a sampler thread snapshots the event-loop thread's stack every interval. Snapshots
+taken while a sampled handler's task is running (including the room actor commands it issued)
+count as that handler's time on the loop, the time during which every other room on the worker
+waits, and are aggregated as folded stacks ("handler;module:function;... count") that
+flamegraph.pl and speedscope read as is.
+
+Plain `def` routes run in the threadpool, so they only contribute their wall time. When profiling
+is off, every hook costs one global check.
+"""
+import asyncio
+import os
+import random
+import re
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_MAX_STACKS = int(os.getenv("PROFILE_MAX_STACKS", "20000"))
+
+# Samples of tasks that aren't running a sampled handler (timers, writers, unsampled handlers)
+OTHER = "(other)"
+
+active = False
+_rate = 0.0
+_interval = PROFILE_INTERVAL
+_loop = None
+_loop_thread = None
+_stop = None
+_started_at = None
+
+# task -> label of the sampled handler it is running
+_task_labels = weakref.WeakKeyDictionary()
+# task -> begin() token of the WS message it is dispatching
+_dispatching = weakref.WeakKeyDictionary()
+# folded stack -> samples
+_stacks = Counter()
+# label -> {"calls", "wall", "wall_max", "samples"}
+_handlers = {}
+_samples = 0
+
+_ID_RE = re.compile(r"/\d+(?=/|$)")
+
+def _template(path: str) -> str:
+    return _ID_RE.sub("/{id}", path)
+
+def _handler(label: str) -> dict:
+    handler = _handlers.get(label)
+    if handler is None:
+        handler = _handlers[label] = {"calls": 0, "wall": 0.0, "wall_max": 0.0, "samples": 0}
+    return handler
+
+def _frame_name(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_qualname}"
+
+def _sample_loop(stop: threading.Event, interval: float):
+    global _samples
+    while not stop.wait(interval):
+        task = asyncio.current_task(_loop)
+        frame = sys._current_frames().get(_loop_thread)
+        if task is None or frame is None:
+            # Idle, or running a plain callback
+            continue
+        label = _task_labels.get(task, OTHER)
+        stack = []
+        while frame is not None:
+            name = _frame_name(frame)
+            if not name.startswith("asyncio."):
+                stack.append(name)
+            frame = frame.f_back
+        key = ";".join([label, *reversed(stack)])
+        if key not in _stacks and len(_stacks) >= PROFILE_MAX_STACKS:
+            key = f"{label};(more stacks)"
+        _stacks[key] += 1
+        _handler(label)["samples"] += 1
+        _samples += 1
+
+def start(rate: float, interval: float = None):
+    """Sample rate (0-1) of requests and messages; call from the event loop"""
+    global active, _rate, _interval, _loop, _loop_thread, _stop, _started_at
+    stop()
+    _rate = max(0.0, min(rate, 1.0))
+    _interval = interval or PROFILE_INTERVAL
+    if not _rate:
+        return
+    _loop = asyncio.get_running_loop()
+    _loop_thread = threading.get_ident()
+    _stop = threading.Event()
+    threading.Thread(target=_sample_loop, args=(_stop, _interval), name="profiler", daemon=True).start()
+    _started_at = time.time()
+    active = True
+
+def stop():
+    global active
+    active = False
+    if _stop is not None:
+        _stop.set()
+    _dispatching.clear()
+    _task_labels.clear()
+
+def reset():
+    global _samples
+    _stacks.clear()
+    _handlers.clear()
+    _samples = 0
+
+def sampled() -> bool:
+    return random.random() < _rate
+
+def begin(label: str, timed: bool = True):
+    """Attribute the current task's work to label until end(token)"""
+    task = asyncio.current_task()
+    previous = _task_labels.get(task)
+    _task_labels[task] = label
+    return task, previous, label if timed else None, time.perf_counter()
+
+def end(token):
+    task, previous, label, started = token
+    if previous is None:
+        _task_labels.pop(task, None)
+    else:
+        _task_labels[task] = previous
+    if label is not None:
+        wall = time.perf_counter() - started
+        handler = _handler(label)
+        handler["calls"] += 1
+        handler["wall"] += wall
+        handler["wall_max"] = max(handler["wall_max"], wall)
+
+def current_label():
+    """Label of the sampled handler the current task runs (None if it isn't), for the room actor"""
+    return _task_labels.get(asyncio.current_task())
+
+def label_of(task):
+    """Label of the sampled handler a task runs, None if it isn't running one"""
+    return _task_labels.get(task)
+
+def message_received(websocket, message: dict):
+    """A WS message is about to be dispatched; the dispatch lasts until the next receive"""
+    message_done()
+    if sampled():
+        label = f"WS {_template(websocket.scope.get('path', ''))} {message.get('type')}"
+        _dispatching[asyncio.current_task()] = begin(label)
+
+def message_done():
+    if _dispatching:
+        token = _dispatching.pop(asyncio.current_task(), None)
+        if token is not None:
+            end(token)
+
+class ProfilingMiddleware:
+    """ASGI middleware sampling HTTP requests; register it innermost so routes run in its task"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not active or scope["type"] != "http" or not sampled():
+            return await self.app(scope, receive, send)
+        token = begin(f"{scope['method']} {_template(scope['path'])}")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            end(token)
+
+def folded() -> str:
+    """Collected stacks in the folded format of flamegraph.pl"""
+    return "".join(f"{stack} {count}\n" for stack, count in _stacks.most_common())
+
+def get_profile_summary():
+    handlers = {
+        label: {
+            "calls": h["calls"],
+            "wall_ms_avg": round(h["wall"] / h["calls"] * 1000, 2) if h["calls"] else None,
+            "wall_ms_max": round(h["wall_max"] * 1000, 2),
+            "on_loop_ms": round(h["samples"] * _interval * 1000, 1),
+        }
+        for label, h in sorted(_handlers.items(), key=lambda item: -item[1]["samples"])
+    }
+    return {
+        "active": active,
+        "rate": _rate,
+        "interval_ms": _interval * 1000,
+        "started_at": _started_at,
+        "samples": _samples,
+        "handlers": handlers,
+    }
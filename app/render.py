@@ -0,0 +1,135 @@
+"""
+Server-side rendering of captioned memes.
+Low-end phones struggle to draw the captions of 10+ submissions themselves, so a submission can be
+fetched as a single compressed image. Rendering runs in a process pool, never on the event loop,
+and the results are kept in a size-bounded LRU keyed by (meme id, captions hash). Concurrent
+requests for the same composite share one render.
+
+caption_slots are expressed in a frame CAPTION_FRAME_WIDTH pixels wide (the width the frontend
+lays the memes out at) and are scaled to the actual image.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from app import assets
+
+logger = logging.getLogger(__name__)
+
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+RENDER_CACHE_BYTES = int(os.getenv("RENDER_CACHE_BYTES", str(32 << 20)))
+RENDER_MAX_WIDTH = int(os.getenv("RENDER_MAX_WIDTH", "960"))
+RENDER_QUALITY = int(os.getenv("RENDER_QUALITY", "75"))
+CAPTION_FRAME_WIDTH = int(os.getenv("CAPTION_FRAME_WIDTH", "600"))
+
+_pool = None
+# (meme id, captions hash) -> encoded image
+_cache = OrderedDict()
+_cache_bytes = 0
+# (meme id, captions hash) -> future of a render in progress
+_rendering = {}
+
+def available() -> bool:
+    return assets.Image is not None
+
+def captions_hash(captions: list) -> str:
+    return hashlib.blake2b(json.dumps(captions, ensure_ascii=False).encode(), digest_size=8).hexdigest()
+
+def _wrap(draw, text: str, font, width: float):
+    lines, line = [], ""
+    for word in text.split():
+        candidate = f"{line} {word}".strip()
+        if line and draw.textlength(candidate, font=font) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    if line:
+        lines.append(line)
+    return lines
+
+def _fit(draw, text: str, width: float, height: float):
+    """Largest default-font size at which the wrapped text fits the slot"""
+    from PIL import ImageFont
+
+    size = max(10, int(height))
+    while True:
+        font = ImageFont.load_default(size=size)
+        lines = _wrap(draw, text, font, width)
+        line_height = size * 1.15
+        if size <= 10 or (len(lines) * line_height <= height
+                          and all(draw.textlength(line, font=font) <= width for line in lines)):
+            return font, lines, line_height
+        size = int(size * 0.9)
+
+def render_composite(source: str, slots: list, captions: list) -> bytes:
+    """Draw the captions over the meme image; runs in a worker process"""
+    from PIL import Image, ImageDraw
+
+    with Image.open(source) as image:
+        image = image.convert("RGB")
+        image.thumbnail((RENDER_MAX_WIDTH, RENDER_MAX_WIDTH * 4))
+        scale = image.width / CAPTION_FRAME_WIDTH
+        draw = ImageDraw.Draw(image)
+        for slot, caption in zip(slots, captions):
+            x, y = slot["x"] * scale, slot["y"] * scale
+            width, height = slot["width"] * scale, slot["height"] * scale
+            font, lines, line_height = _fit(draw, str(caption), width, height)
+            top = y + (height - len(lines) * line_height) / 2
+            for i, line in enumerate(lines):
+                left = x + (width - draw.textlength(line, font=font)) / 2
+                draw.text(
+                    (left, top + i * line_height), line, font=font,
+                    fill="white", stroke_width=max(1, int(font.size / 12)), stroke_fill="black",
+                )
+        out = io.BytesIO()
+        image.save(out, "WEBP", quality=RENDER_QUALITY)
+        return out.getvalue()
+
+def _remember(key, data: bytes):
+    global _cache_bytes
+    _cache[key] = data
+    _cache_bytes += len(data)
+    while _cache_bytes > RENDER_CACHE_BYTES and len(_cache) > 1:
+        _, evicted = _cache.popitem(last=False)
+        _cache_bytes -= len(evicted)
+
+async def composite(meme: dict, captions: list):
+    """(cache key, WebP bytes) of the captioned meme, or None if its image isn't available"""
+    global _pool
+    key = (meme["id"], captions_hash(captions))
+    data = _cache.get(key)
+    if data is not None:
+        _cache.move_to_end(key)
+        return key, data
+
+    if key not in _rendering:
+        source = assets.source_path(meme)
+        if source is None:
+            return None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+        loop = asyncio.get_running_loop()
+        _rendering[key] = loop.run_in_executor(_pool, render_composite, source, meme["caption_slots"], captions)
+    future = _rendering[key]
+    try:
+        data = await asyncio.shield(future)
+    finally:
+        if future.done() and _rendering.get(key) is future:
+            del _rendering[key]
+    if key not in _cache:
+        _remember(key, data)
+    return key, data
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def get_render_stats():
+    return {"cached": len(_cache), "cached_bytes": _cache_bytes, "rendering": len(_rendering)}
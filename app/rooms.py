@@ -0,0 +1,210 @@
+"""
+Room creation without a DB round trip on the request path.
+
+Room codes are 8 digit numbers. The 90M possible codes are numbered in a secret order (a keyed
+Feistel permutation, ROOM_CODE_SECRET, by default derived from SESSION_SECRET; it must stay the
+same for the lifetime of the database). A worker reserves blocks of BLOCK_SIZE consecutive
+numbers ahead of time (one row per block in room_code_blocks, so two workers never share a
+block) and hands out their codes in that order: codes of one block are scattered over the whole
+code space, so one room code tells nothing about the others. On shutdown a worker releases its
+blocks with the position it got to, and the next reservation picks them up from there.
+
+The room row itself is inserted by a write-behind task in small batches; routes that need the
+row to exist (joining, starting a game) wait for it with persisted().
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import random
+from collections import deque
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from app.db import SessionLocal
+from app.models import Room, RoomCodeBlock
+from app.session import session_secret
+
+logger = logging.getLogger(__name__)
+
+CODE_MIN = 10_000_000
+CODE_COUNT = 90_000_000    # codes 10000000 - 99999999
+BLOCK_SIZE = 1000
+BLOCK_COUNT = CODE_COUNT // BLOCK_SIZE
+LOW_WATERMARK = 200        # reserve the next block when fewer codes than this are left
+FLUSH_INTERVAL = 0.05      # seconds to gather a batch of room inserts
+
+_HALF_BITS = 14            # the permutation works on 28 bits, numbers past CODE_COUNT walk again
+_HALF_MASK = (1 << _HALF_BITS) - 1
+_ROUNDS = 4
+_key = hashlib.sha256(f"room-codes:{os.getenv('ROOM_CODE_SECRET') or session_secret}".encode()).digest()
+
+_blocks = deque()          # [block, codes left in order] per reserved block, oldest first
+_available = 0             # codes left in all reserved blocks
+_refill = None             # running block reservation task
+_pending = {}              # room_id -> {"row": dict, "done": future}
+_wake = None               # created by room_writer_task on the running loop
+_urgent = False
+
+def _round(i: int, half: int) -> int:
+    digest = hashlib.blake2b(bytes((i,)) + half.to_bytes(2, "big"), key=_key, digest_size=2).digest()
+    return int.from_bytes(digest, "big") & _HALF_MASK
+
+def code_at(number: int) -> int:
+    """The room code numbered number (0 <= number < CODE_COUNT) in the secret order"""
+    while True:
+        left, right = number >> _HALF_BITS, number & _HALF_MASK
+        for i in range(_ROUNDS):
+            left, right = right, left ^ _round(i, right)
+        number = (left << _HALF_BITS) | right
+        # Cycle walking keeps it a permutation of 0 .. CODE_COUNT - 1
+        if number < CODE_COUNT:
+            return CODE_MIN + number
+
+def _block_codes(block: int, position: int) -> deque:
+    return deque(code_at(block * BLOCK_SIZE + n) for n in range(position, BLOCK_SIZE))
+
+def _reserve_block():
+    """Claim a block released by a stopped worker, or a new one; returns (block, codes)"""
+    with SessionLocal() as db:
+        for _ in range(5):
+            released = db.execute(
+                select(RoomCodeBlock.block, RoomCodeBlock.position)
+                .where(RoomCodeBlock.position.is_not(None))
+                .limit(1)
+            ).first()
+            if released is None:
+                break
+            claimed = db.execute(
+                update(RoomCodeBlock)
+                .where(RoomCodeBlock.block == released.block, RoomCodeBlock.position == released.position)
+                .values(position=None)
+            )
+            db.commit()
+            if claimed.rowcount == 1:
+                logger.info(f"[ROOMS] Resumed room code block {released.block} at {released.position}")
+                return released.block, _block_codes(released.block, released.position)
+        for _ in range(20):
+            block = random.randrange(BLOCK_COUNT)
+            db.add(RoomCodeBlock(block=block))
+            try:
+                db.commit()
+            except IntegrityError:
+                # Block already taken by another worker or an earlier run
+                db.rollback()
+                continue
+            logger.info(f"[ROOMS] Reserved room code block {block}")
+            return block, _block_codes(block, 0)
+    raise RuntimeError("Could not reserve a room code block")
+
+async def _refill_codes():
+    global _refill, _available
+    try:
+        block, codes = await asyncio.to_thread(_reserve_block)
+        _blocks.append([block, codes])
+        _available += len(codes)
+    finally:
+        _refill = None
+
+def _start_refill():
+    global _refill
+    if _refill is None:
+        _refill = asyncio.create_task(_refill_codes())
+    return _refill
+
+async def allocate_code() -> int:
+    """A fresh room code; only touches the DB when the reserved codes ran out"""
+    global _available
+    while not _available:
+        await asyncio.shield(_start_refill())
+    while not _blocks[0][1]:
+        # Used up, its row stays reserved
+        _blocks.popleft()
+    code = _blocks[0][1].popleft()
+    _available -= 1
+    if _available < LOW_WATERMARK:
+        _start_refill()
+    return code
+
+def _release_blocks(held):
+    with SessionLocal() as db:
+        for block, position in held:
+            db.execute(update(RoomCodeBlock).where(RoomCodeBlock.block == block).values(position=position))
+        db.commit()
+
+async def release_codes():
+    """Give the reserved blocks back with the position reached, for the next worker (on shutdown)"""
+    global _available
+    if _refill is not None:
+        # A block being reserved right now would be lost otherwise
+        try:
+            await _refill
+        except Exception:
+            pass
+    held = [(block, BLOCK_SIZE - len(codes)) for block, codes in _blocks if codes]
+    _blocks.clear()
+    _available = 0
+    if held:
+        await asyncio.to_thread(_release_blocks, held)
+        logger.info(f"[ROOMS] Released {len(held)} room code blocks")
+
+def create_room_later(room_id: int, creator: str):
+    """Queue the room row for the write-behind task"""
+    _pending[room_id] = {
+        "row": {"id": room_id, "status": "waiting", "creator": creator},
+        "done": asyncio.get_running_loop().create_future(),
+    }
+    _notify()
+
+async def persisted(room_id: int):
+    """Wait until a room created by create_room_later is in the database (no-op otherwise)"""
+    global _urgent
+    entry = _pending.get(room_id)
+    if entry:
+        _urgent = True
+        _notify()
+        await asyncio.shield(entry["done"])
+
+def _notify():
+    if _wake is not None:
+        _wake.set()
+
+def _insert_rooms(rows):
+    with SessionLocal() as db:
+        db.execute(insert(Room), rows)
+        db.commit()
+
+async def flush_rooms():
+    """Insert every queued room in one batch"""
+    batch = [(room_id, entry) for room_id, entry in _pending.items() if not entry.get("writing")]
+    if not batch:
+        return
+    for _, entry in batch:
+        entry["writing"] = True
+    try:
+        await asyncio.to_thread(_insert_rooms, [entry["row"] for _, entry in batch])
+    except Exception as e:
+        logger.error(f"[ROOMS] Failed to insert {len(batch)} rooms: {e}")
+        for room_id, entry in batch:
+            del _pending[room_id]
+            entry["done"].set_exception(e)
+            # Logged above; persisted() still raises it, but most of these are never awaited
+            entry["done"].exception()
+        return
+    for room_id, entry in batch:
+        del _pending[room_id]
+        entry["done"].set_result(True)
+
+async def room_writer_task():
+    global _urgent, _wake, _refill
+    _wake = asyncio.Event()
+    _refill = None
+    if _pending:
+        _wake.set()
+    while True:
+        await _wake.wait()
+        _wake.clear()
+        if not _urgent:
+            # Let a few more creations pile up into the same insert
+            await asyncio.sleep(FLUSH_INTERVAL)
+        _urgent = False
+        await asyncio.shield(flush_rooms())
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from app.assets import asset_file, CACHE_CONTROL, CLIENT_HINTS
+
+router = APIRouter()
+
+@router.get("/memes/{name}")
+def meme_asset(name: str):
+    """
+    Content-hashed meme image; FileResponse handles Range requests and zero-copy pathsend.
+    The variant is in the name, so the response doesn't vary with the request headers.
+    """
+    entry = asset_file(name)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Asset not found")
+    path, stat_result, media_type = entry
+    return FileResponse(
+        path,
+        media_type=media_type,
+        stat_result=stat_result,
+        # Asks for the client hints the next /meme/templates request picks variants with
+        headers={"Cache-Control": CACHE_CONTROL, "Accept-CH": ", ".join(CLIENT_HINTS)},
+        content_disposition_type="inline",
+    )
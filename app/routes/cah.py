@@ -1,7 +1,13 @@
-from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi import APIRouter, HTTPException, Depends, Header, Cookie
 from app.db import get_db
-from app.models import Player, Room
+from app.models import Player
 from app.game.websockets import manager
+from app.game import actor, clock
+from app.admission import check_capacity
+from app.rooms import persisted
+from app.session import is_creator, verify_token
+from app.game.search import index_for, DEFAULT_PAGE_SIZE
+from app.game import decks
 from app.game.cah import (
     games, 
     start_cah_game, 
@@ -13,7 +19,7 @@ from app.game.cah import (
     QUESTION_POOL
 )
 from pydantic import BaseModel
-from typing import List
+from typing import List, Union
 
 router = APIRouter()
 
@@ -23,21 +29,40 @@ class CardsSubmission(BaseModel):
 class VoteSubmission(BaseModel):
     voted_for: str
 
+class DeckUpload(BaseModel):
+    cards: List[str] = []
+    questions: List[Union[str, dict]] = []
+
+class RoomDecks(BaseModel):
+    deck_ids: List[str] = []
+    include_default: bool = True
+
 @router.post("/start_game/{room_id}")
-async def start_game(room_id: int, x_client_id: str = Header(None), db=Depends(get_db)):
+async def start_game(
+    room_id: int,
+    x_client_id: str = Header(None),
+    x_room_token: str = Header(None),
+    room_token: str = Cookie(None),
+    db=Depends(get_db)
+):
     """Start a new Cards Against Humanity game"""
-    room = db.query(Room).filter(Room.id == room_id).first()
-    if not room or room.creator != x_client_id:
+    if not is_creator(x_room_token or room_token, room_id, x_client_id):
         raise HTTPException(status_code=403, detail="Not allowed")
+    await persisted(room_id)
+    check_capacity("rooms", "timers")
     
     players = db.query(Player).filter(Player.room_id == room_id).all()
     if len(players) < 2:
         raise HTTPException(status_code=400, detail="Need at least 2 players to start")
     
     usernames = [p.username for p in players]
+    roster = {p.user_id: p.username for p in players}
     print(f"[START_CAH_GAME] Room {room_id}: Starting game with {len(players)} players")
     
-    start_cah_game(room_id, usernames, room.creator)
+    deck_ids = decks.room_decks.get(room_id)
+    # Decks unloaded while the room was hibernated
+    await decks.load_decks(db, deck_ids)
+    await actor.run(room_id, start_cah_game, room_id, usernames, x_client_id, roster, deck_ids)
     
     game = games[room_id]
     
@@ -50,7 +75,7 @@ async def start_game(room_id: int, x_client_id: str = Header(None), db=Depends(g
         "card_czar": game["card_czar"],
         "scores": game["scores"],
         "round": game["round"],
-        "remaining": game["duration"]
+        **clock.timing(game),
     }
     
     print(f"[START_CAH_GAME] Broadcasting to room {room_id}")
@@ -76,7 +101,7 @@ async def submit_cards(
     db=Depends(get_db)
 ):
     """Submit cards for the current question"""
-    result = await submit_cards_logic(room_id, x_client_id, submission.cards, db)
+    result = await actor.run(room_id, submit_cards_logic, room_id, x_client_id, submission.cards, db)
     if "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
     return result
@@ -89,19 +114,24 @@ async def submit_vote(
     db=Depends(get_db)
 ):
     """Card Czar votes for the winning submission"""
-    result = await submit_vote_logic(room_id, x_client_id, vote.voted_for, db)
+    result = await actor.run(room_id, submit_vote_logic, room_id, x_client_id, vote.voted_for, db)
     if "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
     return result
 
 @router.post("/next_round/{room_id}")
-async def next_round(room_id: int, x_client_id: str = Header(None), db=Depends(get_db)):
+async def next_round(
+    room_id: int,
+    x_client_id: str = Header(None),
+    x_room_token: str = Header(None),
+    room_token: str = Cookie(None),
+    db=Depends(get_db)
+):
     """Start the next round"""
-    room = db.query(Room).filter(Room.id == room_id).first()
-    if not room or room.creator != x_client_id:
+    if not is_creator(x_room_token or room_token, room_id, x_client_id):
         raise HTTPException(status_code=403, detail="Not allowed")
     
-    result = await next_round_logic(room_id, db)
+    result = await actor.run(room_id, next_round_logic, room_id, db)
     if "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
     return result
@@ -115,3 +145,73 @@ def get_cards():
 def get_questions():
     """Get all available questions (for preview/admin)"""
     return QUESTION_POOL
+
+@router.get("/cards/search")
+def search_cards(q: str = "", cursor: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    """Accent-insensitive card search, paginated with next_cursor"""
+    return index_for("cah_cards", CARD_POOL).search(q, cursor=cursor, limit=limit)
+
+@router.get("/questions/search")
+def search_questions(q: str = "", blanks: int = None, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    """Accent-insensitive question search, optionally only questions with `blanks` blanks"""
+    index = index_for("cah_questions", QUESTION_POOL, text=lambda question: question["text"])
+    where = (lambda question: question["blanks"] == blanks) if blanks is not None else None
+    return index.search(q, where=where, cursor=cursor, limit=limit)
+
+@router.post("/decks")
+def upload_deck(
+    deck: DeckUpload,
+    x_client_id: str = Header(None),
+    x_room_token: str = Header(None),
+    room_token: str = Cookie(None),
+    db=Depends(get_db)
+):
+    """
+    Store a custom deck (room creators only); identical decks get the same id and are stored once.
+    The deck is only written to the database here, it is loaded when a room selects it.
+    """
+    token = x_room_token or room_token
+    capability = verify_token(token)
+    if not capability or not is_creator(token, capability["room_id"], x_client_id):
+        raise HTTPException(status_code=403, detail="Not allowed")
+    try:
+        deck_id, created, content = decks.store_deck(db, deck.cards, deck.questions)
+    except (ValueError, TypeError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "deck_id": deck_id,
+        "created": created,
+        "cards": len(content["cards"]),
+        "questions": len(content["questions"]),
+    }
+
+@router.get("/decks/{deck_id}")
+def get_deck(deck_id: str, db=Depends(get_db)):
+    deck = decks.read_deck(db, deck_id)
+    if deck is None:
+        raise HTTPException(status_code=404, detail="Deck not found")
+    return {"deck_id": deck_id, "cards": deck["cards"], "questions": deck["questions"]}
+
+@router.post("/room_decks/{room_id}")
+async def set_room_decks(
+    room_id: int,
+    choice: RoomDecks,
+    x_client_id: str = Header(None),
+    x_room_token: str = Header(None),
+    room_token: str = Cookie(None),
+    db=Depends(get_db)
+):
+    """Choose the decks the room's next CAH game is played with (creator only)"""
+    if not is_creator(x_room_token or room_token, room_id, x_client_id):
+        raise HTTPException(status_code=403, detail="Not allowed")
+    if len(choice.deck_ids) > decks.MAX_ROOM_DECKS:
+        raise HTTPException(status_code=400, detail=f"At most {decks.MAX_ROOM_DECKS} decks per room")
+    # Loads the decks into memory now, so start_game doesn't hit the database for them
+    missing = await decks.load_decks(db, choice.deck_ids)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Deck {missing[0]} not found")
+    deck_ids = ([decks.DEFAULT_DECK] if choice.include_default else []) + choice.deck_ids
+    if not deck_ids:
+        raise HTTPException(status_code=400, detail="Choose at least one deck")
+    decks.room_decks[room_id] = deck_ids
+    return {"room_id": room_id, "deck_ids": deck_ids}
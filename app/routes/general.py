@@ -2,14 +2,18 @@ from fastapi import APIRouter, Depends, Cookie, Header, Query
 from sqlalchemy.orm import Session
 from app.db import get_db
 from app.models import Room, Player
-from app.session import signer
+from app.session import signer, verify_token, ROLE_CREATOR
+from app.admission import current_load, load_score, LIMITS
+from app.rooms import persisted
 import traceback
 
 router = APIRouter()
 
 @router.get("/room_messages")
-def get_messages(
+async def get_messages(
     room_session: str = Cookie(None),
+    room_token: str = Cookie(None),
+    x_room_token: str = Header(None),
     x_client_id: str = Header(None),
     x_room_id: str = Header(None),
     room_id_q: str = Query(None, alias="room_id"),
@@ -17,6 +21,19 @@ def get_messages(
 ):
     try:
         room_id = None
+        capability = verify_token(x_room_token or room_token)
+        if capability and capability["client_id"] == x_client_id:
+            # The capability token carries both the room and the creator role, no Room lookup
+            room_id = capability["room_id"]
+            await persisted(room_id)
+            players = db.query(Player).filter(Player.room_id == room_id).all()
+            return {
+                "room_id": str(room_id),
+                "messages": [f"Welcome to room {room_id}!"],
+                "is_creator": capability["role"] == ROLE_CREATOR,
+                "player_map": {str(p.user_id): p.username for p in players},
+                "players": [p.username for p in players],
+            }
         if room_session:
             print(f"[DEBUG] Attempting to unsign room_session cookie: {room_session}")
             room_id = signer.unsign(room_session).decode()
@@ -29,6 +46,7 @@ def get_messages(
         else:
             print("[DEBUG] No room identifier provided (cookie/header/query)")
             return {"error": "Missing room identifier"}
+        await persisted(int(room_id))
         room = db.query(Room).filter(Room.id == int(room_id)).first()
         players = db.query(Player).filter(Player.room_id == room_id).all()
         player_map = {str(p.user_id): p.username for p in players}
@@ -53,9 +71,10 @@ def get_messages(
         return {"error": "Invalid or missing session"}
 
 @router.get("/room_players/{room_id}")
-def get_room_players(room_id: int, x_client_id: str = Header(None), db: Session = Depends(get_db)):
+async def get_room_players(room_id: int, x_client_id: str = Header(None), db: Session = Depends(get_db)):
     """Get the list of players in a room"""
     try:
+        await persisted(room_id)
         room = db.query(Room).filter(Room.id == room_id).first()
         if not room:
             return {"error": "Room not found"}
@@ -73,3 +92,13 @@ def get_room_players(room_id: int, x_client_id: str = Header(None), db: Session
     except Exception as e:
         print(f"[ERROR] Exception in /room_players: {e}")
         return {"error": "Failed to fetch players"}
+
+@router.get("/load")
+def get_load():
+    """Load score for a front proxy or autoscaler (0 = idle, >= 1 = refusing new work)"""
+    load = current_load()
+    return {
+        "score": round(load_score(load), 3),
+        "load": load,
+        "limits": LIMITS,
+    }
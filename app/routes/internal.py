@@ -0,0 +1,105 @@
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+from typing import List, Optional
+from app.game import state, event_log, spectators, decks, actor
+from app import sharding, render, history, profiling, watchdog
+from app.game.ratelimit import get_ratelimit_stats
+from app.tasks.heartbeat import get_heartbeat_stats
+from app.tasks.hibernation import get_hibernation_stats
+import hmac
+import os
+
+router = APIRouter()
+
+class WorkerSet(BaseModel):
+    workers: List[str]
+
+class ProfilingSettings(BaseModel):
+    rate: float
+    interval_ms: Optional[float] = None
+
+def check_internal_token(x_internal_token: str):
+    """Worker-to-worker calls must carry the shared INTERNAL_TOKEN"""
+    token = os.getenv("INTERNAL_TOKEN")
+    if not token or not x_internal_token or not hmac.compare_digest(token, x_internal_token):
+        raise HTTPException(status_code=403, detail="Not allowed")
+
+@router.post("/rooms/{room_id}/import")
+async def import_room(room_id: int, snapshot: dict, x_internal_token: str = Header(None)):
+    """Receive a room handed off by another worker"""
+    check_internal_token(x_internal_token)
+    # On the loop, through the room's actor: the timers start with the games
+    await actor.run(room_id, state.import_room, room_id, snapshot)
+    # We may receive the room before our own worker set is updated
+    sharding.pin_room(room_id)
+    return {"status": "imported", "room_id": room_id}
+
+@router.post("/workers")
+async def set_workers(worker_set: WorkerSet, x_internal_token: str = Header(None)):
+    """Update the worker set and hand off rooms this worker no longer owns"""
+    check_internal_token(x_internal_token)
+    return await sharding.set_workers(worker_set.workers, x_internal_token)
+
+@router.get("/rooms/{room_id}/owner")
+def room_owner(room_id: int):
+    return {"room_id": room_id, "owner": sharding.owner_of(room_id), "local": sharding.owns(room_id)}
+
+@router.get("/rooms/{room_id}/events")
+def room_events(room_id: int, limit: int = 100, from_file: bool = False, x_internal_token: str = Header(None)):
+    """Audit trail: the newest sequenced events of a room"""
+    check_internal_token(x_internal_token)
+    if from_file:
+        return {"room_id": room_id, "events": event_log.read_file(room_id)[-limit:]}
+    return {"room_id": room_id, "last_seq": event_log.last_seq(room_id), "events": event_log.recent(room_id, limit)}
+
+@router.get("/stats")
+def stats(x_internal_token: str = Header(None)):
+    """Counters for monitoring this worker"""
+    check_internal_token(x_internal_token)
+    return {
+        "heartbeat": get_heartbeat_stats(),
+        "ws_input": get_ratelimit_stats(),
+        "event_log": event_log.get_event_log_stats(),
+        "spectators": spectators.get_spectator_stats(),
+        "render": render.get_render_stats(),
+        "decks": decks.get_deck_stats(),
+        "history": history.get_history_stats(),
+        "hibernation": get_hibernation_stats(),
+        "watchdog": watchdog.get_watchdog_stats(),
+    }
+
+@router.get("/stalls")
+def stalls(limit: int = 20, x_internal_token: str = Header(None)):
+    """Recent event-loop stalls with the stack captured while the loop was blocked"""
+    check_internal_token(x_internal_token)
+    return {**watchdog.get_watchdog_stats(), "recent": watchdog.recent_stalls(limit)}
+
+@router.post("/profiling")
+async def start_profiling(settings: ProfilingSettings, x_internal_token: str = Header(None)):
+    """Profile a fraction (rate) of requests and WS messages; rate 0 stops profiling"""
+    check_internal_token(x_internal_token)
+    interval = settings.interval_ms / 1000 if settings.interval_ms else None
+    profiling.start(settings.rate, interval)
+    return profiling.get_profile_summary()
+
+@router.get("/profiling")
+def profiling_summary(x_internal_token: str = Header(None)):
+    """Calls, wall time and event-loop time per handler"""
+    check_internal_token(x_internal_token)
+    return profiling.get_profile_summary()
+
+@router.get("/profiling/folded")
+def profiling_folded(x_internal_token: str = Header(None)):
+    """Collected stacks in folded format, for flamegraph.pl or speedscope"""
+    check_internal_token(x_internal_token)
+    return PlainTextResponse(
+        profiling.folded(),
+        headers={"Content-Disposition": 'attachment; filename="profile.folded"'},
+    )
+
+@router.delete("/profiling")
+def reset_profiling(x_internal_token: str = Header(None)):
+    check_internal_token(x_internal_token)
+    profiling.reset()
+    return {"status": "reset"}
@@ -0,0 +1,51 @@
+from fastapi import APIRouter, Depends, HTTPException
+from datetime import date, datetime, timezone
+from app.db import get_db
+from app import history
+from app.game.meme import MEME_POOL
+
+router = APIRouter()
+
+GAMES = ("cah", "meme")
+MAX_LIMIT = 100
+
+_memes_by_id = {meme["id"]: meme for meme in MEME_POOL}
+
+def _check_game(game: str):
+    if game not in GAMES:
+        raise HTTPException(status_code=400, detail=f"game must be one of {', '.join(GAMES)}")
+
+@router.get("/players")
+def top_players(game: str = "cah", week: date = None, limit: int = 20, db=Depends(get_db)):
+    """Top players of a week (current week by default), read from the precomputed weekly stats"""
+    _check_game(game)
+    week = history.week_of(datetime.combine(week, datetime.min.time(), timezone.utc) if week else datetime.now(timezone.utc))
+    rows = history.top_players(db, game, week, max(1, min(limit, MAX_LIMIT)))
+    return {
+        "game": game,
+        "week": week.isoformat(),
+        "players": [
+            {
+                "player_id": row.player_id,
+                "username": row.username,
+                "points": row.points,
+                "round_wins": row.round_wins,
+                "games_played": row.games_played,
+                "games_won": row.games_won,
+            }
+            for row in rows
+        ],
+    }
+
+@router.get("/entries")
+def top_entries(game: str = "cah", limit: int = 20, db=Depends(get_db)):
+    """Cards (CAH) or memes that won the most rounds"""
+    _check_game(game)
+    rows = history.top_entries(db, game, max(1, min(limit, MAX_LIMIT)))
+    entries = []
+    for row in rows:
+        entry = {"entry": row.entry, "wins": row.wins, "plays": row.plays}
+        if game == "meme":
+            entry["meme"] = _memes_by_id.get(row.entry)
+        entries.append(entry)
+    return {"game": game, "entries": entries}
@@ -1,10 +1,17 @@
 from fastapi import APIRouter, HTTPException
 from app.schemas import CaptionRequest
-from fastapi import APIRouter, Depends, Request, Header, HTTPException
+from fastapi import APIRouter, Depends, Request, Header, Cookie, HTTPException, Response
 from app.db import get_db
 from app.schemas import VoteRequest
-from app.models import Player, Room
+from app.models import Player
 from app.game.websockets import manager
+from app.game import actor, clock
+from app.admission import check_capacity
+from app.rooms import persisted
+from app.session import is_creator
+from app.assets import device_class_for, image_urls, variant_headers
+from app import render
+from app.game.search import index_for, DEFAULT_PAGE_SIZE
 
 from app.game.meme import MEME_POOL  # import it
 
@@ -15,22 +22,30 @@ from app.game.meme import games, start_meme_game, get_game_status_logic
 router = APIRouter()
 
 @router.post("/start_game/{room_id}")
-async def start_game(room_id: int, x_client_id: str = Header(None), db=Depends(get_db)):
-    room = db.query(Room).filter(Room.id == room_id).first()
-    if not room or room.creator != x_client_id:
+async def start_game(
+    room_id: int,
+    x_client_id: str = Header(None),
+    x_room_token: str = Header(None),
+    room_token: str = Cookie(None),
+    db=Depends(get_db)
+):
+    if not is_creator(x_room_token or room_token, room_id, x_client_id):
         raise HTTPException(status_code=403, detail="Not allowed")
+    await persisted(room_id)
+    check_capacity("rooms", "timers")
     
     players = db.query(Player).filter(Player.room_id == room_id).all()
     usernames = [p.username for p in players]
     print(f"[START_GAME] Room {room_id}: Starting game with {len(players)} players")
-    start_meme_game(room_id, usernames, room.creator)
+    roster = {p.user_id: p.username for p in players}
+    await actor.run(room_id, start_meme_game, room_id, usernames, x_client_id, roster)
     
     broadcast_data = {
         "type": "game_update",
         "status": "captioning",
         "players": usernames,
         "current_meme": games[room_id]["current_meme"],
-        "remaining": games[room_id]["duration"]
+        **clock.timing(games[room_id]),
     }
     print(f"[START_GAME] Broadcasting to room {room_id}: {broadcast_data}")
     print(f"[START_GAME] Active connections dict keys: {list(manager.active_connections.keys())}")
@@ -45,9 +60,44 @@ async def start_game(room_id: int, x_client_id: str = Header(None), db=Depends(g
 
 
 @router.get("/templates")
-def get_meme_templates():
-    print("MEME_POOL", MEME_POOL)
-    return MEME_POOL
+def get_meme_templates(request: Request, response: Response, device: str = None):
+    """Meme templates, with the image variant that fits the client's device class"""
+    response.headers.update(variant_headers())
+    device_class = device_class_for(request, device)
+    webp = "image/webp" in request.headers.get("accept", "")
+    templates = []
+    for meme in MEME_POOL:
+        urls = image_urls(meme["id"], device_class, webp)
+        templates.append({**meme, **urls} if urls else meme)
+    return templates
+
+@router.get("/templates/search")
+def search_meme_templates(q: str = "", cursor: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    """Search meme templates by id / file name, paginated with next_cursor"""
+    index = index_for("memes", MEME_POOL, text=lambda meme: f"{meme['id']} {meme['filename']}")
+    return index.search(q, cursor=cursor, limit=limit)
+
+@router.get("/render/{room_id}")
+async def render_submission(room_id: int, player_id: str):
+    """A submission with its captions drawn in, as one WebP image (optional, for low-end devices)"""
+    game = games.get(room_id)
+    if not game or game["phase"] not in ("voting", "results"):
+        raise HTTPException(status_code=404, detail="No submissions to show")
+    submission = game["submissions"].get(player_id)
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    if not render.available():
+        raise HTTPException(status_code=503, detail="Rendering not available")
+
+    result = await render.composite(submission["meme"], submission["captions"])
+    if result is None:
+        raise HTTPException(status_code=503, detail="Meme image not available")
+    (meme_id, digest), data = result
+    return Response(
+        content=data,
+        media_type="image/webp",
+        headers={"Cache-Control": "private, max-age=300", "ETag": f'"{meme_id}.{digest}"'},
+    )
 
 # REST fallback: get current game status (used when WebSocket isn't connected yet)
 @router.get("/game_status")
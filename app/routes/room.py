@@ -3,30 +3,48 @@ from app.schemas import JoinRoomRequest
 from app.db import get_db
 from app.models import Room, Player
 from sqlalchemy.orm import Session
-from app.session import signer
+from app.session import signer, issue_token, ROLE_CREATOR, ROLE_PLAYER
 import asyncio
 from app.game.websockets import manager
+from app.game import actor, meme, cah
+from app.admission import check_capacity
+from app.rooms import allocate_code, create_room_later, persisted
+from app.sharding import owns
 
 router = APIRouter()
 
-@router.post("/create_room")
-def create_room(response: Response, db: Session = Depends(get_db), x_client_id: str = Header(None)):
-    if not x_client_id:
-        return {"error": "x-client-id header is required"}
-    
-    room = Room(status="waiting", creator=x_client_id)
-    db.add(room)
-    db.commit()
-    db.refresh(room)
+def set_session_cookies(response: Response, room_id: int, token: str):
     response.set_cookie(
         key="room_session",
-        value=signer.sign(str(room.id)).decode(),
+        value=signer.sign(str(room_id)).decode(),
         httponly=True, samesite="none", secure=True
     )
-    return {"room_id": room.id}
+    # Capability token, also returned in the body for clients that send it as x-room-token
+    response.set_cookie(
+        key="room_token",
+        value=token,
+        httponly=True, samesite="none", secure=True
+    )
+
+@router.post("/create_room")
+async def create_room(response: Response, x_client_id: str = Header(None)):
+    if not x_client_id:
+        return {"error": "x-client-id header is required"}
+    check_capacity("rooms")
+    
+    # Random code from a pre-reserved block; the row is inserted by the write-behind task
+    room_id = await allocate_code()
+    create_room_later(room_id, x_client_id)
+    if not owns(room_id):
+        # The owning worker can't see our pending insert, so the row must exist before we answer
+        await persisted(room_id)
+    token = issue_token(room_id, x_client_id, ROLE_CREATOR)
+    set_session_cookies(response, room_id, token)
+    return {"room_id": room_id, "token": token}
 
 @router.post("/join_room_with_username/{room_id}")
-def join_room_with_username(room_id: int, data: JoinRoomRequest, response: Response, db: Session = Depends(get_db)):
+async def join_room_with_username(room_id: int, data: JoinRoomRequest, response: Response, db: Session = Depends(get_db)):
+    await persisted(room_id)
     player = db.query(Player).filter_by(user_id=data.client_id, room_id=room_id).first()
     if player:
         player.username = data.username
@@ -35,6 +53,13 @@ def join_room_with_username(room_id: int, data: JoinRoomRequest, response: Respo
         db.add(player)
     db.commit()
 
+    # Keep running games' rosters in sync so they resolve names without the database
+    if room_id in meme.games or room_id in cah.games:
+        def sync_rosters():
+            meme.update_roster(room_id, data.client_id, data.username)
+            cah.update_roster(room_id, data.client_id, data.username)
+        await actor.run(room_id, sync_rosters)
+
     # Fetch updated player list
     all_players = db.query(Player).filter(Player.room_id == room_id).all()
     player_list = [p.username for p in all_players]
@@ -57,15 +82,15 @@ def join_room_with_username(room_id: int, data: JoinRoomRequest, response: Respo
     except Exception as e:
         print(f"[WARNING] Could not schedule broadcast: {e}")
 
-    response.set_cookie(
-        key="room_session",
-        value=signer.sign(str(room_id)).decode(),
-        httponly=True, samesite="none", secure=True
-    )
+    room = db.query(Room).filter(Room.id == room_id).first()
+    role = ROLE_CREATOR if room and room.creator == data.client_id else ROLE_PLAYER
+    token = issue_token(room_id, data.client_id, role)
+    set_session_cookies(response, room_id, token)
 
     return {
         "message": f"User '{data.username}' joined room {room_id}",
         "room_id": room_id,
         "players": player_list,
-        "player_map": player_map
+        "player_map": player_map,
+        "token": token
     }
@@ -1,21 +1,43 @@
-from fastapi import APIRouter, Depends, Request, Header, HTTPException
+from fastapi import APIRouter, Depends, Request, Header, Cookie, HTTPException
 from app.db import get_db
 from app.schemas import VoteRequest
-from app.models import Player, Room
-from app.game.voting import games, start_voting_game
-
-import time
-from datetime import datetime, timezone
+from app.models import Player
+from app.game.voting import games, start_voting_game, submit_vote_logic, QUESTION_POOL
+from app.game.websockets import manager
+from app.game import actor, clock
+from app.admission import check_capacity
+from app.rooms import persisted
+from app.session import is_creator
+from app.game.search import index_for, DEFAULT_PAGE_SIZE
 
 router = APIRouter()
 
 @router.post("/start_game/{room_id}")
-async def start_game(room_id: int, x_client_id: str = Header(None), db=Depends(get_db)):
-    room = db.query(Room).filter(Room.id == room_id).first()
-    if not room or room.creator != x_client_id:
+async def start_game(
+    room_id: int,
+    x_client_id: str = Header(None),
+    x_room_token: str = Header(None),
+    room_token: str = Cookie(None),
+    db=Depends(get_db)
+):
+    if not is_creator(x_room_token or room_token, room_id, x_client_id):
         raise HTTPException(status_code=403, detail="Not allowed")
+    await persisted(room_id)
+    check_capacity("rooms", "timers")
     players = db.query(Player).filter(Player.room_id == room_id).all()
-    start_voting_game(room_id, [p.username for p in players])
+    usernames = [p.username for p in players]
+    await actor.run(room_id, start_voting_game, room_id, usernames, x_client_id)
+
+    game = games[room_id]
+    await manager.broadcast(room_id, {
+        "type": "game_update",
+        "status": "voting",
+        "question": game["question"],
+        "players": usernames,
+        "votes_count": 0,
+        "voters": [],
+        **clock.timing(game),
+    })
     return {"status": "game started"}
 
 @router.get("/game_status/{room_id}")
@@ -24,14 +46,26 @@ def game_status(room_id: int, request: Request, db=Depends(get_db)):
     return game_status_logic(room_id, request, db)
 
 @router.post("/next_question/{room_id}")
-def next_question(room_id: int, request: Request, db=Depends(get_db)):
+async def next_question(
+    room_id: int,
+    x_client_id: str = Header(None),
+    x_room_token: str = Header(None),
+    room_token: str = Cookie(None),
+    db=Depends(get_db)
+):
     from app.game.voting import next_question_logic
-    return next_question_logic(room_id, request, db)
+    if not is_creator(x_room_token or room_token, room_id, x_client_id):
+        raise HTTPException(status_code=403, detail="Not allowed")
+    return await actor.run(room_id, next_question_logic, room_id, db)
 
 @router.post("/vote/{room_id}")
-def vote(room_id: int, vote: VoteRequest):
-    game = games.get(room_id)
-    if not game or game["finished"]:
-        raise HTTPException(status_code=400, detail="Voting is not active")
-    game["votes"][vote.voter_id] = vote.vote_for
+async def vote(room_id: int, vote: VoteRequest, db=Depends(get_db)):
+    result = await actor.run(room_id, submit_vote_logic, room_id, vote.voter_id, vote.vote_for, db)
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
     return {"message": "Vote registered"}
+
+@router.get("/questions/search")
+def search_questions(q: str = "", cursor: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    """Accent-insensitive search over the voting questions, paginated with next_cursor"""
+    return index_for("voting_questions", QUESTION_POOL).search(q, cursor=cursor, limit=limit)
@@ -1,61 +1,68 @@
 # app/routes/ws.py
 
 import json
-import asyncio
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from app.admission import check_capacity, RETRY_AFTER_SECONDS
 from app.game.websockets import manager
+from app.tasks.heartbeat import record_pong
+from app.sharding import redirect_websocket
+from app.tasks import hibernation
 from app.db import get_db
-from app.models import Player, Room
-from app.game.meme import games, get_game_status_logic, next_meme_logic, MEME_POOL
-from app.game import cah
+from app.models import Player
+from app.session import is_creator
+from app.game.meme import get_game_status_logic, next_meme_logic, submit_caption_logic, submit_vote_logic
+from app.game import actor, cah, voting, spectators, clock
+from app.game.resume import send_initial_state
+from app.game.game_timer import finish_round
+from app.game.utils import touch_player
+from app.game.ratelimit import client_bucket, receive_message
 
 router = APIRouter()
 
+# Spectator socket closed because the room has no game running on this worker
+SPECTATE_NO_GAME_CODE = 4404
+
 @router.websocket("/ws/{room_id}")
 async def websocket_endpoint(websocket: WebSocket, room_id: int):
     client_id = websocket.query_params.get("client_id")
+    token = websocket.query_params.get("token") or websocket.cookies.get("room_token")
+    if await redirect_websocket(websocket, room_id):
+        return
+    hibernation.touch(room_id)
     print(f"[WS] Client {client_id} connecting to room {room_id}")
-    await manager.connect(room_id, websocket)
+    if not await manager.connect(room_id, websocket, catch_up=True):
+        return
     print(f"[WS] Client {client_id} connected. Active connections: {len(manager.active_connections.get(room_id, []))}")
 
-    # Keepalive task to prevent Heroku timeout (55s)
-    async def send_keepalive():
-        try:
-            while True:
-                await asyncio.sleep(20)  # Send ping every 20 seconds
-                try:
-                    await websocket.send_json({"type": "ping"})
-                    print(f"[MEME_WS] Sent keepalive ping to {client_id}")
-                except Exception as e:
-                    print(f"[MEME_WS] Keepalive failed for {client_id}: {e}")
-                    break
-        except asyncio.CancelledError:
-            pass
-
-    keepalive_task = asyncio.create_task(send_keepalive())
+    limiter = client_bucket()
 
     try:
         db = next(get_db())
 
-        # Proactively push current game status on connect to reduce race conditions on Heroku
+        # Proactively push current game status on connect to reduce race conditions on Heroku,
+        # or just the missed broadcasts when the client resumes
         try:
-            status = await get_game_status_logic(room_id, client_id, db)
-            await websocket.send_json({"type": "game_update", **status})
-            print(f"[MEME_WS] Sent initial status to client {client_id}: {status.get('status', 'unknown')}")
+            sent = await send_initial_state(websocket, room_id, client_id, lambda: get_game_status_logic(room_id, client_id, db))
+            print(f"[MEME_WS] Sent initial state to client {client_id}: {sent}")
         except Exception as e:
             # Don't fail the connection if status fetch hiccups
             print(f"[MEME_WS] Failed to fetch initial status for client {client_id}: {e}")
             await websocket.send_json({"type": "game_update", "status": "no_game"})
 
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            message = await receive_message(websocket, room_id, limiter)
 
             msg_type = message.get("type")
 
             # --- 0. Ping/Pong for keepalive ---
             if msg_type == "pong":
                 # Client responded to ping, connection is alive
+                record_pong(websocket)
+                continue
+
+            if msg_type == "time_sync":
+                # Clients count phases down locally against the server clock
+                await websocket.send_json(clock.sync_reply(message))
                 continue
 
             # --- 1. Game status sync ---
@@ -66,38 +73,9 @@ async def websocket_endpoint(websocket: WebSocket, room_id: int):
             # --- 2. Caption submission ---
             elif msg_type == "submit_caption":
                 captions = message.get("caption")
-                game = games.get(room_id)
-
-                if not game or game["phase"] != "captioning":
-                    await websocket.send_json({ "error": "Not in captioning phase" })
-                    continue
-
-                if not captions or len(captions) != len(game["current_meme"]["caption_slots"]):
-                    await websocket.send_json({ "error": "Invalid caption count" })
-                    continue
-
-                # Ensure 'captions' and 'submissions' dicts are initialized
-                if "captions" not in game:
-                    game["captions"] = {}
-
-                if "submissions" not in game:
-                    game["submissions"] = {}
-
-                game["captions"][client_id] = captions
-
-                if client_id not in game["submissions"]:
-                    game["submissions"][client_id] = {
-                        "meme": game["current_meme"],
-                        "captions": captions,
-                    }
-                else:
-                    game["submissions"][client_id]["captions"] = captions
-
-                status = await get_game_status_logic(room_id, client_id, db)
-                await manager.broadcast(room_id, {
-                    "type": "game_update",
-                    **status
-                })
+                result = await actor.run(room_id, submit_caption_logic, room_id, client_id, captions, db)
+                if "error" in result:
+                    await websocket.send_json({ "error": result["error"] })
 
 
             # --- 3. Voting submission ---
@@ -109,59 +87,38 @@ async def websocket_endpoint(websocket: WebSocket, room_id: int):
                     points = 0  # fallback
                     
                 print(f"Received vote from {client_id} for {vote_for} with points: {points} (type: {type(points)})")
-                game = games.get(room_id)
-
-                if not game or game["phase"] != "voting":
-                    await websocket.send_json({"error": "Voting is not active"})
-                    continue
-
-                # Check if already voted FIRST
-                if client_id in game["votes"]:
-                    await websocket.send_json({"error": "You already voted"})
-                    continue
-
-                if client_id == vote_for:
-                    await websocket.send_json({"error": "You can't vote for yourself!"})
-                    continue
-
-                # Register the vote
-                game["votes"][client_id] = vote_for
-
-                # Apply points
-                game.setdefault("player_points", {})
-                game["player_points"][vote_for] = game["player_points"].get(vote_for, 0) + points
-
-                status = await get_game_status_logic(room_id, client_id, db)
-                await manager.broadcast(room_id, {
-                    "type": "game_update",
-                    **status
-                })
+                result = await actor.run(room_id, submit_vote_logic, room_id, client_id, vote_for, points, db)
+                if "error" in result:
+                    await websocket.send_json({"error": result["error"]})
 
 
             # --- 4. Next meme (if game master triggers it) ---
             elif msg_type == "next_meme":
-                room = db.query(Room).filter(Room.id == room_id).first()
-                if not room or room.creator != client_id:
+                if not is_creator(token, room_id, client_id):
                     await websocket.send_json({ "error": "Only creator can trigger next meme" })
                     continue
 
-                result = next_meme_logic(room_id, client_id, db)
+                async def next_meme():
+                    result = next_meme_logic(room_id, client_id, db)
 
-                if result["status"] == "next_meme":
-                    print("[WS] Next meme triggered. Broadcasting...")
-                    status = await get_game_status_logic(room_id, client_id, db)
-                    await manager.broadcast(room_id, {
-                        "type": "game_update",
-                        **status
-                    })
+                    if result["status"] == "next_meme":
+                        print("[WS] Next meme triggered. Broadcasting...")
+                        status = await get_game_status_logic(room_id, client_id, db)
+                        await manager.broadcast(room_id, {
+                            "type": "game_update",
+                            **status
+                        })
+
+                    elif result["status"] == "game_over":
+                        print("[WS] No more memes. Game over.")
+                        await manager.broadcast(room_id, {
+                            "type": "game_over"
+                        })
+                    return result
 
-                elif result["status"] == "game_over":
-                    print("[WS] No more memes. Game over.")
-                    await manager.broadcast(room_id, {
-                        "type": "game_over"
-                    })
+                result = await actor.run(room_id, next_meme)
 
-                elif result["status"] == "cannot_advance":
+                if result["status"] == "cannot_advance":
                     await websocket.send_json({ "error": "Can't proceed yet." })
 
                 elif result["status"] == "unauthorized":
@@ -174,11 +131,9 @@ async def websocket_endpoint(websocket: WebSocket, room_id: int):
 
     except WebSocketDisconnect:
         print(f"[WS] Client {client_id} disconnected from room {room_id}")
-        keepalive_task.cancel()
         manager.disconnect(room_id, websocket)
     except Exception as e:
         print(f"[WS] Error for client {client_id} in room {room_id}: {e}")
-        keepalive_task.cancel()
         manager.disconnect(room_id, websocket)
 
 
@@ -186,46 +141,41 @@ async def websocket_endpoint(websocket: WebSocket, room_id: int):
 async def cah_websocket_endpoint(websocket: WebSocket, room_id: int):
     """WebSocket endpoint for Cards Against Humanity game"""
     client_id = websocket.query_params.get("client_id")
+    token = websocket.query_params.get("token") or websocket.cookies.get("room_token")
+    if await redirect_websocket(websocket, room_id):
+        return
+    hibernation.touch(room_id)
     print(f"[CAH_WS] Client {client_id} connecting to CAH room {room_id}")
-    await manager.connect(room_id, websocket)
+    if not await manager.connect(room_id, websocket, catch_up=True):
+        return
     print(f"[CAH_WS] Client {client_id} connected. Active connections: {len(manager.active_connections.get(room_id, []))}")
 
-    # Keepalive task to prevent Heroku timeout
-    async def send_keepalive():
-        try:
-            while True:
-                await asyncio.sleep(20)  # Send ping every 20 seconds
-                try:
-                    await websocket.send_json({"type": "ping"})
-                    print(f"[CAH_WS] Sent keepalive ping to {client_id}")
-                except Exception as e:
-                    print(f"[CAH_WS] Keepalive failed for {client_id}: {e}")
-                    break
-        except asyncio.CancelledError:
-            pass
-
-    keepalive_task = asyncio.create_task(send_keepalive())
+    limiter = client_bucket()
 
     try:
         db = next(get_db())
 
-        # Proactively push current status on connect to avoid race conditions on Heroku
+        # Proactively push current status on connect to avoid race conditions on Heroku,
+        # or just the missed broadcasts when the client resumes
         try:
-            status = await cah.get_game_status_logic(room_id, client_id, db)
-            await websocket.send_json({"type": "game_update", **status})
-            print(f"[CAH_WS] Sent initial status to client {client_id}: {status.get('status', 'unknown')}")
+            sent = await send_initial_state(websocket, room_id, client_id, lambda: cah.get_game_status_logic(room_id, client_id, db))
+            print(f"[CAH_WS] Sent initial state to client {client_id}: {sent}")
         except Exception as e:
             # Don't fail the connection if status fetch hiccups
             print(f"[CAH_WS] Failed to fetch initial status for client {client_id}: {e}")
             await websocket.send_json({"type": "game_update", "status": "no_game"})
 
         while True:
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            message = await receive_message(websocket, room_id, limiter)
             msg_type = message.get("type")
 
             # --- 0. Ping/Pong for keepalive ---
             if msg_type == "pong":
+                record_pong(websocket)
+                continue
+
+            if msg_type == "time_sync":
+                await websocket.send_json(clock.sync_reply(message))
                 continue
 
             # --- 1. Game status sync ---
@@ -236,7 +186,7 @@ async def cah_websocket_endpoint(websocket: WebSocket, room_id: int):
             # --- 2. Submit cards ---
             elif msg_type == "submit_cards":
                 selected_cards = message.get("cards", [])
-                result = await cah.submit_cards_logic(room_id, client_id, selected_cards, db)
+                result = await actor.run(room_id, cah.submit_cards_logic, room_id, client_id, selected_cards, db)
                 
                 if "error" in result:
                     await websocket.send_json({"error": result["error"]})
@@ -246,66 +196,31 @@ async def cah_websocket_endpoint(websocket: WebSocket, room_id: int):
             # --- 3. Submit vote (Card Czar only) ---
             elif msg_type == "submit_vote":
                 voted_for = message.get("voted_for")
-                result = await cah.submit_vote_logic(room_id, client_id, voted_for, db)
-                
+
+                async def vote_and_finish():
+                    result = await cah.submit_vote_logic(room_id, client_id, voted_for, db)
+                    if "error" not in result:
+                        # Immediately transition to results
+                        game = cah.games.get(room_id)
+                        if game:
+                            await finish_round(room_id, game)
+                    return result
+
+                result = await actor.run(room_id, vote_and_finish)
                 if "error" in result:
                     await websocket.send_json({"error": result["error"]})
-                else:
-                    # Immediately transition to results
-                    game = cah.games.get(room_id)
-                    if game:
-                        game["phase"] = "results"
-                        
-                        # Count votes and award points
-                        vote_counts = {}
-                        for voted_player in game["votes"].values():
-                            vote_counts[voted_player] = vote_counts.get(voted_player, 0) + 1
-                        
-                        # Find winner
-                        round_winner = None
-                        if vote_counts:
-                            max_votes = max(vote_counts.values())
-                            winners = [p for p, v in vote_counts.items() if v == max_votes]
-                            if len(winners) == 1:
-                                game["scores"][winners[0]] += 1
-                                round_winner = winners[0]
-                        
-                        # Broadcast results
-                        await manager.broadcast(room_id, {
-                            "type": "game_update",
-                            "status": "results",
-                            "round_winner": round_winner,
-                            "scores": game["scores"],
-                            "vote_counts": vote_counts,
-                            "submissions": [
-                                {
-                                    "player": player_name,
-                                    "cards": cards,
-                                    "votes": vote_counts.get(player_name, 0)
-                                }
-                                for player_name, cards in game["submissions"].items()
-                                if player_name != game["card_czar"]
-                            ]
-                        })
 
             # --- 4. Next round ---
             elif msg_type == "next_round":
-                room = db.query(Room).filter(Room.id == room_id).first()
-                if not room or room.creator != client_id:
+                if not is_creator(token, room_id, client_id):
                     await websocket.send_json({"error": "Only creator can start next round"})
                     continue
 
-                result = await cah.next_round_logic(room_id, db)
+                result = await actor.run(room_id, cah.next_round_logic, room_id, db)
                 
                 if "error" in result:
                     await websocket.send_json({"error": result["error"]})
-                elif result.get("game_over"):
-                    await manager.broadcast(room_id, {
-                        "type": "game_over",
-                        "winners": result["winners"],
-                        "final_scores": cah.games[room_id]["scores"]
-                    })
-                # Otherwise, next_round_logic already broadcasted the new round
+                # Otherwise, next_round_logic already broadcasted the new round or the game over
 
             # --- Unknown message ---
             else:
@@ -313,10 +228,119 @@ async def cah_websocket_endpoint(websocket: WebSocket, room_id: int):
 
     except WebSocketDisconnect:
         print(f"[CAH_WS] Client {client_id} disconnected from CAH room {room_id}")
-        keepalive_task.cancel()
         manager.disconnect(room_id, websocket)
     except Exception as e:
         print(f"[CAH_WS] Error for client {client_id} in CAH room {room_id}: {e}")
-        keepalive_task.cancel()
         manager.disconnect(room_id, websocket)
 
+
+@router.websocket("/ws/voting/{room_id}")
+async def voting_websocket_endpoint(websocket: WebSocket, room_id: int):
+    """WebSocket endpoint for the "most likely to" voting game"""
+    client_id = websocket.query_params.get("client_id")
+    token = websocket.query_params.get("token") or websocket.cookies.get("room_token")
+    if await redirect_websocket(websocket, room_id):
+        return
+    hibernation.touch(room_id)
+    print(f"[VOTING_WS] Client {client_id} connecting to voting room {room_id}")
+    if not await manager.connect(room_id, websocket, catch_up=True):
+        return
+
+    limiter = client_bucket()
+
+    try:
+        db = next(get_db())
+
+        async def snapshot():
+            touch_player(db, room_id, client_id)
+            return voting.get_status(room_id, client_id)
+
+        # Push current status (or the missed broadcasts) on connect; afterwards the server pushes every phase change
+        await send_initial_state(websocket, room_id, client_id, snapshot)
+
+        while True:
+            message = await receive_message(websocket, room_id, limiter)
+            msg_type = message.get("type")
+
+            # --- 0. Ping/Pong for keepalive ---
+            if msg_type == "pong":
+                record_pong(websocket)
+                touch_player(db, room_id, client_id)
+                continue
+
+            if msg_type == "time_sync":
+                await websocket.send_json(clock.sync_reply(message))
+                continue
+
+            # --- 1. Game status sync ---
+            if msg_type == "get_status":
+                await websocket.send_json({"type": "game_update", **voting.get_status(room_id, client_id)})
+
+            # --- 2. Submit vote ---
+            elif msg_type == "submit_vote":
+                result = await actor.run(room_id, voting.submit_vote_logic, room_id, client_id, message.get("vote_for"), db)
+                if "error" in result:
+                    await websocket.send_json({"error": result["error"]})
+
+            # --- 3. Next question ---
+            elif msg_type == "next_question":
+                if not is_creator(token, room_id, client_id):
+                    await websocket.send_json({"error": "Only creator can start next question"})
+                    continue
+
+                result = await actor.run(room_id, voting.next_question_logic, room_id, db)
+                if result["status"] == "cannot_advance":
+                    await websocket.send_json({"error": "Can't proceed yet."})
+                # Otherwise next_question_logic already broadcasted the new question or game over
+
+            # --- Unknown message ---
+            else:
+                await websocket.send_json({"error": "Unknown message type"})
+
+    except WebSocketDisconnect:
+        print(f"[VOTING_WS] Client {client_id} disconnected from voting room {room_id}")
+        manager.disconnect(room_id, websocket)
+    except Exception as e:
+        print(f"[VOTING_WS] Error for client {client_id} in voting room {room_id}: {e}")
+        manager.disconnect(room_id, websocket)
+
+
+@router.websocket("/ws/spectate/{room_id}")
+async def spectator_websocket_endpoint(websocket: WebSocket, room_id: int):
+    """Read-only view of a room's games; spectators need no Player row and only answer pings"""
+    if await redirect_websocket(websocket, room_id):
+        return
+    hibernation.touch(room_id)
+    try:
+        # Spectators count against MAX_CONNECTIONS like players
+        check_capacity("connections")
+    except HTTPException:
+        await websocket.accept()
+        await websocket.close(code=1013, reason=f"retry-after={RETRY_AFTER_SECONDS}")
+        return
+    await websocket.accept()
+    if not spectators.watchable(room_id):
+        await websocket.close(code=SPECTATE_NO_GAME_CODE, reason="no-game")
+        return
+    if not await spectators.join(room_id, websocket):
+        await websocket.close(code=1013, reason="spectators-full")
+        return
+
+    try:
+        while True:
+            # Spectators only answer the heartbeat's pings, anything else is ignored
+            data = await websocket.receive_text()
+            if len(data) > 100:
+                continue
+            try:
+                message = json.loads(data)
+            except ValueError:
+                continue
+            if isinstance(message, dict) and message.get("type") == "pong":
+                record_pong(websocket)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"[SPECTATOR_WS] Error in room {room_id}: {e}")
+    finally:
+        spectators.leave(room_id, websocket)
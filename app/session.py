@@ -1,4 +1,4 @@
-from itsdangerous import Signer
+from itsdangerous import Signer, BadSignature
 import os
 from dotenv import load_dotenv
 
@@ -9,3 +9,49 @@ session_secret = os.getenv("SESSION_SECRET")
 if session_secret is None:
 	raise ValueError("SESSION_SECRET environment variable is not set")
 signer = Signer(session_secret)  # use env var in production
+
+# Capability tokens: "<room_id>:<role>:<client_id>" signed with the session secret.
+# Any worker can check them without a database lookup.
+ROLE_CREATOR = "creator"
+ROLE_PLAYER = "player"
+_token_signer = Signer(session_secret, salt="room-capability")
+
+def issue_token(room_id: int, client_id: str, role: str) -> str:
+    return _token_signer.sign(f"{room_id}:{role}:{client_id}").decode()
+
+def verify_token(token: str):
+    """Return {"room_id", "client_id", "role"} for a valid token, None otherwise"""
+    if not token:
+        return None
+    try:
+        room_id, role, client_id = _token_signer.unsign(token).decode().split(":", 2)
+        return {"room_id": int(room_id), "client_id": client_id, "role": role}
+    except (BadSignature, ValueError):
+        return None
+
+def is_creator(token: str, room_id: int, client_id: str) -> bool:
+    """True if the token grants client_id the creator role in the room"""
+    capability = verify_token(token)
+    return (
+        capability is not None
+        and capability["room_id"] == room_id
+        and capability["role"] == ROLE_CREATOR
+        and capability["client_id"] == client_id
+    )
+
+# Resume tokens let a reconnecting WebSocket client skip the full status rebuild, see app/game/resume.py
+_resume_signer = Signer(session_secret, salt="ws-resume")
+
+def issue_resume_token(room_id: int, client_id: str, epoch: str) -> str:
+    return _resume_signer.sign(f"{room_id}:{client_id}:{epoch}").decode()
+
+def verify_resume_token(token: str, room_id: int, client_id: str):
+    """Event log epoch the token was issued in, or None if it isn't valid for this client"""
+    if not token:
+        return None
+    try:
+        value = _resume_signer.unsign(token).decode()
+    except BadSignature:
+        return None
+    bound_to, _, epoch = value.rpartition(":")
+    return epoch if bound_to == f"{room_id}:{client_id}" else None
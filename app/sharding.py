@@ -0,0 +1,187 @@
+"""
+Room-affinity sharding.
+Every room is pinned to one worker by consistent hashing of its room_id, so the games dicts,
+timers and ConnectionManager of a room only ever live in one process. Requests that land on the
+wrong worker are redirected (HTTP 307) or told where to reconnect (WebSocket close 4307).
+
+Configuration:
+    WORKER_URLS  comma separated public base URLs of every worker (empty = single worker)
+    WORKER_URL   base URL of this worker, must be one of WORKER_URLS
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import re
+import urllib.request
+from fastapi.responses import RedirectResponse
+from dotenv import load_dotenv
+from itsdangerous import BadSignature
+from app.session import signer, verify_token
+from app.game import state, actor
+from app.game.websockets import manager
+from app.tasks import hibernation
+
+if not os.getenv("DATABASE_URL"):
+    load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+VIRTUAL_NODES = 64
+WS_REDIRECT_CODE = 4307
+
+# Paths ending in /{room_id}, e.g. /cah/submit_cards/12 or /join_room_with_username/12
+_ROOM_PATH_RE = re.compile(r"/(\d+)/?$")
+
+class HashRing:
+    def __init__(self, workers: list[str]):
+        self.workers = list(workers)
+        self._ring = sorted(
+            (_hash(f"{worker}#{i}"), worker)
+            for worker in self.workers
+            for i in range(VIRTUAL_NODES)
+        )
+        self._keys = [h for h, _ in self._ring]
+
+    def owner(self, room_id: int):
+        if not self._ring:
+            return None
+        index = bisect.bisect(self._keys, _hash(str(room_id))) % len(self._ring)
+        return self._ring[index][1]
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+def _parse_workers(value):
+    return [url.strip().rstrip("/") for url in (value or "").split(",") if url.strip()]
+
+self_url = (os.getenv("WORKER_URL") or "").rstrip("/")
+ring = HashRing(_parse_workers(os.getenv("WORKER_URLS")))
+
+# Rooms served here regardless of the ring: imported before our ring update, or failed handoffs
+_pinned_rooms = set()
+
+def owner_of(room_id: int):
+    """Base URL of the worker owning the room (None when running a single worker)"""
+    return ring.owner(room_id)
+
+def owns(room_id: int) -> bool:
+    if room_id in _pinned_rooms:
+        return True
+    owner = owner_of(room_id)
+    return owner is None or owner == self_url
+
+def pin_room(room_id: int):
+    """Serve the room from this worker even if the ring points elsewhere"""
+    _pinned_rooms.add(room_id)
+
+def room_id_from_request(request):
+    """Best-effort extraction of the room id an HTTP request targets"""
+    match = _ROOM_PATH_RE.search(request.url.path)
+    if match:
+        return int(match.group(1))
+    for value in (request.query_params.get("room_id"), request.headers.get("x-room-id")):
+        if value and value.isdigit():
+            return int(value)
+    capability = verify_token(request.headers.get("x-room-token") or request.cookies.get("room_token"))
+    if capability:
+        return capability["room_id"]
+    room_session = request.cookies.get("room_session")
+    if room_session:
+        try:
+            return int(signer.unsign(room_session).decode())
+        except (BadSignature, ValueError):
+            pass
+    return None
+
+async def room_affinity_middleware(request, call_next):
+    """Redirect HTTP requests for a room owned by another worker"""
+    room_id = room_id_from_request(request)
+    if room_id is None:
+        return await call_next(request)
+    if owns(room_id):
+        hibernation.touch(room_id)
+        return await call_next(request)
+    target = owner_of(room_id) + request.url.path
+    if request.url.query:
+        target += "?" + request.url.query
+    # 307 keeps the method and body of POST requests
+    return RedirectResponse(target, status_code=307)
+
+async def redirect_websocket(websocket, room_id: int) -> bool:
+    """Close the socket with the owner's URL if the room lives elsewhere. Returns True if redirected."""
+    if owns(room_id):
+        return False
+    owner = owner_of(room_id)
+    await websocket.accept()
+    # Reason carries the ws base URL the client should reconnect to
+    await websocket.close(code=WS_REDIRECT_CODE, reason=re.sub(r"^http", "ws", owner))
+    return True
+
+def _post_json(url: str, payload: dict, token: str):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json", "x-internal-token": token},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.status
+
+async def _hand_off(room_id: int, owner: str, token: str):
+    """Move a room to its new owner; runs inside the room's actor, so nothing changes it meanwhile"""
+    from app.tasks import checkpoint
+
+    # The new owner writes the room's checkpoint as soon as it has imported it
+    await checkpoint.hold(room_id)
+    try:
+        hibernation.wake(room_id)
+        snapshot = state.export_room(room_id)
+        if snapshot:
+            await asyncio.to_thread(_post_json, f"{owner}/internal/rooms/{room_id}/import", snapshot, token)
+    except BaseException:
+        checkpoint.release(room_id, moved=False)
+        raise
+    state.drop_room(room_id)
+    checkpoint.release(room_id, moved=True)
+
+async def set_workers(workers: list[str], token: str):
+    """
+    Switch to a new worker set and hand off every local room whose owner changed.
+    A room stays pinned to this worker until its new owner has imported it; rooms that fail to
+    transfer stay pinned and keep being served from here.
+    """
+    global ring
+    new_ring = HashRing([url.rstrip("/") for url in workers])
+    leaving = {}
+    for room_id in sorted(state.local_room_ids() | hibernation.hibernated_room_ids()):
+        owner = new_ring.owner(room_id)
+        if owner is None or owner == self_url:
+            _pinned_rooms.discard(room_id)
+        else:
+            leaving[room_id] = owner
+            _pinned_rooms.add(room_id)
+    ring = new_ring
+
+    moved, failed = [], []
+    for room_id, owner in leaving.items():
+        try:
+            await actor.run(room_id, _hand_off, room_id, owner, token)
+        except Exception as e:
+            logger.error(f"[SHARDING] Handoff of room {room_id} to {owner} failed: {e}")
+            failed.append(room_id)
+            continue
+        _pinned_rooms.discard(room_id)
+        # Tell connected clients where the room lives now
+        for websocket in list(manager.active_connections.get(room_id, [])):
+            manager.disconnect(room_id, websocket)
+            try:
+                await websocket.close(code=WS_REDIRECT_CODE, reason=re.sub(r"^http", "ws", owner))
+            except Exception:
+                pass
+        moved.append(room_id)
+
+    logger.info(f"[SHARDING] Worker set updated: moved {len(moved)} rooms, {len(failed)} failed")
+    return {"moved": moved, "failed": failed}
@@ -0,0 +1,226 @@
+"""
+Virtual-clock simulation of game rooms, for timer and phase-logic benchmarks.
+The real CAH logic, timers and actors run on an event loop whose clock jumps straight to the next
+scheduled timer whenever every task is waiting, so hours of play cost only the CPU time of the
+work itself, and a run is deterministic for a given seed. Bots stand in for the players: they
+submit after a random think time (some miss the deadline), the czar votes (or lets the timer
+close the vote) and the creator starts the next round once the results are in.
+
+    python -m app.sim --rooms 2000 --rounds 10 --seed 1
+
+Reports the CPU time per phase transition, the timer ticks it took, how late deadline-driven
+transitions fired and a digest of the scores after every round, which only changes when the game
+logic does. Exits with status 1 when a transition fired later than --max-lateness.
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import random
+import selectors
+import sys
+import time
+
+# The simulation never touches the database, but the game modules import app.db
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app import history
+from app.game import actor, cah, clock, game_timer, state
+from app.game.websockets import manager
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """Polls real I/O without blocking; when nothing is ready, moves the loop's clock to the next timer"""
+    loop = None
+
+    def select(self, timeout=None):
+        if timeout is None:
+            # No timer pending: only real I/O (a worker thread finishing) can wake the loop
+            return super().select(None)
+        events = super().select(0)
+        if not events and timeout > 0:
+            self.loop.advance(timeout)
+        return events
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        self._now = 0.0
+        self.jumps = 0
+        selector = _VirtualSelector()
+        super().__init__(selector)
+        selector.loop = self
+
+    def time(self):
+        return self._now
+
+    def advance(self, seconds: float):
+        self._now += seconds
+        self.jumps += 1
+
+class _Feed:
+    """Stands in for a room's sockets: wakes the room's bots on every broadcast"""
+    def __init__(self):
+        self.changed = asyncio.Event()
+        self.messages = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.messages += 1
+        self.changed.set()
+
+    async def until(self, done):
+        while not done():
+            self.changed.clear()
+            await self.changed.wait()
+
+class _Stats:
+    def __init__(self):
+        self.rounds = 0
+        self.games = 0
+        self.transitions = 0
+        self.ticks = 0
+        self.lateness = []
+        self.digest = hashlib.blake2b(digest_size=8)
+
+def _instrument(stats: _Stats):
+    """Wrap the CAH timer tick to count ticks and measure how late deadline-driven transitions fire"""
+    tick = game_timer._tick
+
+    async def measured_tick(room_id: int, games_dict: dict):
+        stats.ticks += 1
+        game = games_dict.get(room_id)
+        if not game:
+            return await tick(room_id, games_dict)
+        before = (game["phase"], game["round"])
+        deadline = game["start_time"] + game["duration"]
+        due = clock.now() >= deadline
+        await tick(room_id, games_dict)
+        if due and (game["phase"], game["round"]) != before:
+            stats.lateness.append(clock.now() - deadline)
+
+    game_timer._tick = measured_tick
+    return tick
+
+async def _submit(room_id: int, client_id: str, name: str, game: dict, rng: random.Random):
+    await asyncio.sleep(rng.uniform(3, 75))
+    cards = game["player_hands"][name][:game["current_question"]["blanks"]]
+    await actor.run(room_id, cah.submit_cards_logic, room_id, client_id, cards, None)
+
+async def _vote(room_id: int, client_id: str, game: dict, rng: random.Random):
+    await asyncio.sleep(rng.uniform(2, 40))
+    if not game["submission_order"]:
+        return
+
+    async def vote_and_finish():
+        # Same as the CAH socket's submit_vote
+        result = await cah.submit_vote_logic(room_id, client_id, rng.choice(game["submission_order"]), None)
+        if "error" not in result:
+            await game_timer.finish_round(room_id, game)
+
+    await actor.run(room_id, vote_and_finish)
+
+async def _play_room(room_id: int, players: int, rounds: int, rng: random.Random, stats: _Stats):
+    roster = {f"{room_id}-{i}": f"player{i}" for i in range(players)}
+    client_of = {name: client_id for client_id, name in roster.items()}
+    creator = next(iter(roster))
+    feed = _Feed()
+    await manager.connect(room_id, feed)
+    await actor.run(room_id, cah.start_cah_game, room_id, list(roster.values()), creator, roster)
+
+    played = 0
+    while played < rounds:
+        game = cah.games[room_id]
+        phase = game["phase"]
+        if phase == "playing":
+            bots = [
+                asyncio.create_task(_submit(room_id, client_of[name], name, game, rng))
+                for name in game["players"] if name != game["card_czar"]
+            ]
+        elif phase == "voting":
+            bots = [asyncio.create_task(_vote(room_id, client_of[game["card_czar"]], game, rng))]
+        else:
+            played += 1
+            stats.rounds += 1
+            stats.digest.update(json.dumps([room_id, game["scores"]], sort_keys=True).encode())
+            # The creator reads the results, then starts the next round
+            await asyncio.sleep(rng.uniform(1, 5))
+            result = await actor.run(room_id, cah.next_round_logic, room_id, None)
+            stats.transitions += 1
+            if result.get("game_over"):
+                stats.games += 1
+                await actor.run(room_id, cah.start_cah_game, room_id, list(roster.values()), creator, roster)
+            continue
+        await feed.until(lambda: game["phase"] != phase)
+        stats.transitions += 1
+        for bot in bots:
+            bot.cancel()
+
+    manager.disconnect(room_id, feed)
+    await actor.run(room_id, state.drop_room, room_id)
+
+async def _run(rooms: int, players: int, rounds: int, seed: int, stats: _Stats):
+    await asyncio.gather(*(
+        _play_room(room_id, players, rounds, random.Random(seed * 1_000_003 + room_id), stats)
+        for room_id in range(1, rooms + 1)
+    ))
+    # Let idle actors time out so nothing is left pending
+    await asyncio.sleep(actor.ACTOR_IDLE_TIMEOUT + 1)
+
+def simulate(rooms: int = 1000, players: int = 6, rounds: int = 10, seed: int = 1) -> dict:
+    """Play rooms x rounds CAH rounds on a virtual clock and return the measurements"""
+    stats = _Stats()
+    loop = VirtualClockLoop()
+    random.seed(seed)
+    clock.set_source(loop.time)
+    tick = _instrument(stats)
+    try:
+        # Broadcasts print a line each
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            wall, cpu = time.perf_counter(), time.process_time()
+            loop.run_until_complete(_run(rooms, players, rounds, seed, stats))
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    finally:
+        game_timer._tick = tick
+        clock.set_source(None)
+        loop.close()
+        history._rounds.clear()
+        history._results.clear()
+
+    lateness = sorted(stats.lateness) or [0.0]
+    return {
+        "rooms": rooms,
+        "rounds": stats.rounds,
+        "games": stats.games,
+        "transitions": stats.transitions,
+        "timer_ticks": stats.ticks,
+        "virtual_seconds": round(loop.time(), 1),
+        "wall_seconds": round(wall, 2),
+        "cpu_us_per_transition": round(cpu / max(1, stats.transitions) * 1e6, 1),
+        "clock_jumps": loop.jumps,
+        "late_p50": round(lateness[len(lateness) // 2], 3),
+        "late_p99": round(lateness[int(len(lateness) * 0.99)], 3),
+        "late_max": round(lateness[-1], 3),
+        "digest": stats.digest.hexdigest(),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-lateness", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    result = simulate(args.rooms, args.players, args.rounds, args.seed)
+    print(json.dumps(result, indent=2))
+    if result["late_max"] > args.max_lateness:
+        print(f"Transitions fired up to {result['late_max']}s late (limit {args.max_lateness}s)", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
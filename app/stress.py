@@ -0,0 +1,133 @@
+"""
+Stress test of CAH scoring under concurrency: a point must never be awarded twice.
+In every round the czar votes, then fires --racers submit_vote + finish_round commands (as the CAH
+socket does) while as many extra timer ticks race them with the voting deadline already passed,
+next to the room's own timer. The room's actor applies them one at a time, so whoever gets there
+first closes the round and each round awards exactly one point.
+
+    python -m app.stress --rooms 200 --racers 20 --rounds 3 --seed 1
+
+Runs on the virtual clock of app.sim. Exits with status 1 if any round awarded other than one point.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+
+# Sets up the environment for the game modules as well
+from app.sim import VirtualClockLoop
+from app import history
+from app.game import actor, cah, clock, game_timer, state
+
+async def _until(done):
+    while not done():
+        await asyncio.sleep(0.05)
+
+async def _vote_and_finish(room_id: int, czar_id: str, voted_for: str, rng: random.Random):
+    await asyncio.sleep(rng.uniform(0, 0.01))
+
+    async def vote_and_finish():
+        # Same as the CAH socket's submit_vote
+        result = await cah.submit_vote_logic(room_id, czar_id, voted_for, None)
+        if "error" not in result:
+            await game_timer.finish_round(room_id, cah.games[room_id])
+
+    await actor.run(room_id, vote_and_finish)
+
+async def _timer_tick(room_id: int, rng: random.Random):
+    await asyncio.sleep(rng.uniform(0, 0.01))
+    await actor.run(room_id, game_timer._tick, room_id, cah.games)
+
+def _expire(game: dict):
+    game["start_time"] = clock.now() - game["duration"] - 1
+
+async def _play_room(room_id: int, players: int, rounds: int, racers: int, rng: random.Random, awarded: list):
+    roster = {f"{room_id}-{i}": f"player{i}" for i in range(players)}
+    client_of = {name: client_id for client_id, name in roster.items()}
+    creator = next(iter(roster))
+    await actor.run(room_id, cah.start_cah_game, room_id, list(roster.values()), creator, roster)
+
+    for _ in range(rounds):
+        game = cah.games[room_id]
+        for name in game["players"]:
+            if name != game["card_czar"]:
+                cards = game["player_hands"][name][:game["current_question"]["blanks"]]
+                await actor.run(room_id, cah.submit_cards_logic, room_id, client_of[name], cards, None)
+        # Everybody submitted: the room's timer opens the vote
+        await _until(lambda: game["phase"] == "voting")
+
+        before = sum(game["scores"].values())
+        czar_id = client_of[game["card_czar"]]
+        await actor.run(room_id, cah.submit_vote_logic, room_id, czar_id, rng.choice(game["submission_order"]), None)
+        await actor.run(room_id, _expire, game)
+        clock.notify(room_id)
+        contenders = [_vote_and_finish(room_id, czar_id, rng.choice(game["submission_order"]), rng) for _ in range(racers)]
+        contenders += [_timer_tick(room_id, rng) for _ in range(racers)]
+        rng.shuffle(contenders)
+        await asyncio.gather(*contenders)
+        await _until(lambda: game["phase"] == "results")
+        awarded.append(sum(game["scores"].values()) - before)
+
+        result = await actor.run(room_id, cah.next_round_logic, room_id, None)
+        if result.get("game_over"):
+            await actor.run(room_id, cah.start_cah_game, room_id, list(roster.values()), creator, roster)
+
+    await actor.run(room_id, state.drop_room, room_id)
+
+async def _run(rooms: int, players: int, rounds: int, racers: int, seed: int, awarded: list):
+    await asyncio.gather(*(
+        _play_room(room_id, players, rounds, racers, random.Random(seed * 1_000_003 + room_id), awarded)
+        for room_id in range(1, rooms + 1)
+    ))
+    # Let idle actors time out so nothing is left pending
+    await asyncio.sleep(actor.ACTOR_IDLE_TIMEOUT + 1)
+
+def stress(rooms: int = 200, players: int = 6, rounds: int = 3, racers: int = 20, seed: int = 1) -> dict:
+    """Race votes and timer ticks in rooms x rounds CAH rounds and count the points awarded"""
+    awarded = []
+    loop = VirtualClockLoop()
+    random.seed(seed)
+    clock.set_source(loop.time)
+    try:
+        # Broadcasts print a line each
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            wall = time.perf_counter()
+            loop.run_until_complete(_run(rooms, players, rounds, racers, seed, awarded))
+            wall = time.perf_counter() - wall
+    finally:
+        clock.set_source(None)
+        loop.close()
+        history._rounds.clear()
+        history._results.clear()
+
+    return {
+        "rooms": rooms,
+        "rounds": len(awarded),
+        "racers_per_round": racers * 2,
+        "points_awarded": sum(awarded),
+        "rounds_not_one_point": sum(1 for points in awarded if points != 1),
+        "wall_seconds": round(wall, 2),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--racers", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    result = stress(args.rooms, args.players, args.rounds, args.racers, args.seed)
+    print(json.dumps(result, indent=2))
+    if result["rounds_not_one_point"] or result["rounds"] != args.rooms * args.rounds:
+        print(f"{result['rounds_not_one_point']} rounds did not award exactly one point", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+Periodic checkpoints of live game state, restored on startup.
+Only rooms whose encoded state changed since the last pass are written, so a quiet server
+does almost no work. Snapshots store game start times as wall-clock timestamps (see clock), so
+the phase deadlines stored in a checkpoint stay absolute and timers resume exactly where they were.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import zlib
+from datetime import datetime, timezone
+from sqlalchemy import delete, insert, select
+from app.db import SessionLocal
+from app.models import GameCheckpoint, Room
+from app.game import state
+from app import sharding
+from app.tasks import hibernation
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", "5"))
+CHECKPOINT_CHUNK = 200
+
+# room_id -> digest of the last blob written by this worker
+_written = {}
+# Rooms being handed off to another worker, whose checkpoint rows this worker must leave alone
+_handing_off = set()
+# Held while a pass writes, so a handoff never starts in the middle of one
+_write_lock = asyncio.Lock()
+
+def _digest(dump: bytes) -> bytes:
+    return hashlib.blake2b(dump, digest_size=16).digest()
+
+async def _dump_rooms():
+    """
+    Serialize every local room. Each room is dumped synchronously so it can't mutate halfway,
+    and we yield to the event loop between chunks to keep large servers responsive.
+    """
+    dumps = {}
+    for i, room_id in enumerate(list(state.local_room_ids())):
+        snapshot = state.export_room(room_id, copy_state=False)
+        if snapshot:
+            dumps[room_id] = state.dump_snapshot(snapshot)
+        if i % CHECKPOINT_CHUNK == CHECKPOINT_CHUNK - 1:
+            await asyncio.sleep(0)
+    return dumps
+
+def _compress_changed(dumps, hibernated):
+    """Hash and compress off the event loop, keeping only rooms that changed"""
+    changed = {}
+    for room_id, dump in dumps.items():
+        digest = _digest(dump)
+        if _written.get(room_id) != digest:
+            changed[room_id] = (state.compress_dump(dump), digest)
+    # Hibernated rooms keep their last checkpoint
+    removed = [room_id for room_id in _written if room_id not in dumps and room_id not in hibernated]
+    return changed, removed
+
+def _write(changed, removed):
+    now = datetime.now(timezone.utc)
+    stale = list(changed) + removed
+    with SessionLocal() as db:
+        # Replace changed rows in bulk instead of one merge (SELECT + write) per room
+        for i in range(0, len(stale), 500):
+            db.execute(delete(GameCheckpoint).where(GameCheckpoint.room_id.in_(stale[i:i + 500])))
+        # Rooms deleted meanwhile would fail the whole batch on the rooms foreign key
+        existing = set()
+        ids = list(changed)
+        for i in range(0, len(ids), 500):
+            existing.update(db.scalars(select(Room.id).where(Room.id.in_(ids[i:i + 500]))))
+        changed = {room_id: entry for room_id, entry in changed.items() if room_id in existing}
+        if changed:
+            db.execute(insert(GameCheckpoint), [
+                {"room_id": room_id, "data": blob, "updated_at": now}
+                for room_id, (blob, _) in changed.items()
+            ])
+        db.commit()
+    for room_id, (_, digest) in changed.items():
+        _written[room_id] = digest
+    for room_id in removed:
+        _written.pop(room_id, None)
+
+async def hold(room_id: int):
+    """A handoff of the room starts: wait for a write in progress, then stop writing its row"""
+    async with _write_lock:
+        _handing_off.add(room_id)
+
+def release(room_id: int, moved: bool):
+    """The handoff is over; if the room moved, its row now belongs to the new owner"""
+    _handing_off.discard(room_id)
+    if moved:
+        _written.pop(room_id, None)
+
+async def checkpoint_games():
+    """Write one incremental checkpoint"""
+    dumps = await _dump_rooms()
+    changed, removed = await asyncio.to_thread(_compress_changed, dumps, hibernation.hibernated_room_ids())
+    async with _write_lock:
+        # Rooms handed off since they were dumped
+        local = state.local_room_ids()
+        changed = {room_id: entry for room_id, entry in changed.items() if room_id in local and room_id not in _handing_off}
+        removed = [room_id for room_id in removed if room_id in _written and room_id not in _handing_off]
+        if changed or removed:
+            await asyncio.to_thread(_write, changed, removed)
+            logger.info(f"[CHECKPOINT] Wrote {len(changed)} rooms, removed {len(removed)}")
+
+async def checkpoint_task():
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL)
+        try:
+            await checkpoint_games()
+        except Exception as e:
+            logger.error(f"[CHECKPOINT] Checkpoint failed: {e}", exc_info=True)
+
+def restore_games():
+    """Load every checkpoint owned by this worker and re-arm its timers (call from lifespan)"""
+    started = time.perf_counter()
+    restored = 0
+    with SessionLocal() as db:
+        for checkpoint in db.query(GameCheckpoint).yield_per(500):
+            if not sharding.owns(checkpoint.room_id):
+                continue
+            try:
+                dump = zlib.decompress(checkpoint.data)
+                state.import_room(checkpoint.room_id, json.loads(dump))
+            except Exception as e:
+                logger.error(f"[CHECKPOINT] Could not restore room {checkpoint.room_id}: {e}")
+                continue
+            _written[checkpoint.room_id] = _digest(dump)
+            restored += 1
+    logger.info(f"[CHECKPOINT] Restored {restored} rooms in {time.perf_counter() - started:.2f}s")
+    return restored
@@ -2,6 +2,8 @@ import asyncio
 from datetime import datetime, timezone, timedelta
 from app.db import SessionLocal
 from app.models import Room
+from app.game import actor, state, decks
+from app.tasks import hibernation
 from sqlalchemy.orm import joinedload
 import pytz
 
@@ -21,7 +23,19 @@ async def cleanup_empty_rooms_task():
             now = datetime.now(timezone.utc)
             timeout = now - timedelta(minutes=120)
             rooms = db.query(Room).options(joinedload(Room.players)).all()
+            deleted = []
             for room in rooms:
                 if not any(p.last_seen and to_utc_aware(p.last_seen) > timeout for p in room.players):
                     db.delete(room)
+                    deleted.append(room.id)
             db.commit()
+        local = state.local_room_ids()
+        for room_id in deleted:
+            hibernation.discard(room_id)
+            if room_id in local:
+                # Games of a deleted room would otherwise be checkpointed against a missing row
+                await actor.run(room_id, state.drop_room, room_id)
+            else:
+                state.drop_room(room_id)
+        # Rooms asleep keep the decks they selected
+        decks.evict_unused(hibernation.selected_decks())
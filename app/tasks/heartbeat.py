@@ -0,0 +1,105 @@
+"""
+Centralized WebSocket heartbeat.
+A single background task walks every connection registered in the ConnectionManager, and
+every spectator socket, in batches, instead of running one keepalive task per socket.
+Sockets still catching up on the initial state are skipped until they are done.
+
+Protocol-level ping/pong frames are handled by uvicorn (see --ws-ping-interval in the
+Procfile); ASGI gives the application no way to send those frames itself, so this task
+uses application-level {"type": "ping"} messages, which also keep Heroku's 55s idle
+timeout at bay and let us measure round-trip times from the client's "pong" reply.
+"""
+import asyncio
+import time
+import logging
+import os
+from app.game.websockets import manager
+from app.game import spectators
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", "20"))
+HEARTBEAT_BATCH_SIZE = int(os.getenv("HEARTBEAT_BATCH_SIZE", "200"))
+HEARTBEAT_MAX_MISSED = int(os.getenv("HEARTBEAT_MAX_MISSED", "3"))
+
+# Per-socket heartbeat state: {websocket: {"room_id", "spectator", "seq", "sent_at", "missed", "rtt"}}
+_heartbeats = {}
+
+def record_pong(websocket):
+    """Mark the outstanding ping of a socket as answered and update its round-trip time"""
+    state = _heartbeats.get(websocket)
+    if not state or state["sent_at"] is None:
+        return
+    state["rtt"] = time.monotonic() - state["sent_at"]
+    state["sent_at"] = None
+    state["missed"] = 0
+
+async def _ping(room_id: int, websocket, spectator: bool):
+    state = _heartbeats.setdefault(websocket, {
+        "room_id": room_id,
+        "spectator": spectator,
+        "seq": 0,
+        "sent_at": None,
+        "missed": 0,
+        "rtt": None,
+    })
+
+    # Previous ping still unanswered
+    if state["sent_at"] is not None:
+        state["missed"] += 1
+        if state["missed"] >= HEARTBEAT_MAX_MISSED:
+            logger.info(f"[HEARTBEAT] Room {room_id}: closing connection after {state['missed']} missed pongs")
+            await _drop(room_id, websocket, spectator)
+            return
+    else:
+        state["sent_at"] = time.monotonic()
+
+    state["seq"] += 1
+    try:
+        await websocket.send_json({"type": "ping", "seq": state["seq"]})
+    except Exception as e:
+        logger.info(f"[HEARTBEAT] Room {room_id}: ping failed ({e}), dropping connection")
+        await _drop(room_id, websocket, spectator)
+
+async def _drop(room_id: int, websocket, spectator: bool):
+    _heartbeats.pop(websocket, None)
+    if spectator:
+        spectators.leave(room_id, websocket)
+    else:
+        manager.disconnect(room_id, websocket)
+    try:
+        await websocket.close(code=1001)
+    except Exception:
+        pass
+
+async def heartbeat_task():
+    while True:
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        connections = [
+            (room_id, websocket, False)
+            for room_id, sockets in list(manager.active_connections.items())
+            for websocket in list(sockets)
+        ]
+        connections += [(room_id, websocket, True) for room_id, websocket in spectators.connections()]
+
+        # Forget sockets that disconnected since the last sweep
+        live = {websocket for _, websocket, _ in connections}
+        for websocket in list(_heartbeats):
+            if websocket not in live:
+                del _heartbeats[websocket]
+
+        # A ping must not overtake the initial state of a socket that is still catching up
+        connections = [c for c in connections if c[1] not in manager._catching_up]
+        for i in range(0, len(connections), HEARTBEAT_BATCH_SIZE):
+            batch = connections[i:i + HEARTBEAT_BATCH_SIZE]
+            await asyncio.gather(*(_ping(room_id, websocket, spectator) for room_id, websocket, spectator in batch))
+
+def get_heartbeat_stats():
+    """Connection count, missed pongs and round-trip times (for debugging)"""
+    rtts = [s["rtt"] for s in _heartbeats.values() if s["rtt"] is not None]
+    return {
+        "connections": len(_heartbeats),
+        "awaiting_pong": sum(1 for s in _heartbeats.values() if s["sent_at"] is not None),
+        "rtt_avg_ms": round(1000 * sum(rtts) / len(rtts), 1) if rtts else None,
+        "rtt_max_ms": round(1000 * max(rtts), 1) if rtts else None,
+    }
@@ -0,0 +1,112 @@
+"""
+Hibernation of idle rooms.
+A room nobody has been connected to for HIBERNATE_AFTER seconds is serialized into a compressed
+blob (the checkpoint format) and its games, timers, event log and actor are released, so resident
+memory follows the rooms in use rather than the rooms used in the last two hours. Time is paused
+while a room sleeps: on wake-up every phase deadline is pushed back by the time spent asleep.
+Rooms wake on the first HTTP request or WebSocket connection that targets them.
+"""
+import asyncio
+import json
+import logging
+import os
+import zlib
+from app.game import state, actor, decks, spectators, clock
+from app.game.websockets import manager
+
+logger = logging.getLogger(__name__)
+
+HIBERNATE_AFTER = float(os.getenv("HIBERNATE_AFTER", "120"))
+HIBERNATE_CHECK_INTERVAL = float(os.getenv("HIBERNATE_CHECK_INTERVAL", "15"))
+
+# room_id -> clock.now() of the last request, connection or connected sweep
+_last_active = {}
+# room_id -> {"blob": compressed snapshot, "at": clock.now() when it went to sleep, "decks": ...}
+_hibernated = {}
+
+def touch(room_id: int):
+    """Mark the room as in use, waking it up if it sleeps"""
+    _last_active[room_id] = clock.now()
+    if room_id in _hibernated:
+        wake(room_id)
+
+def is_hibernated(room_id: int) -> bool:
+    return room_id in _hibernated
+
+def hibernated_room_ids():
+    return set(_hibernated)
+
+def selected_decks() -> set:
+    """Deck ids selected by hibernated rooms"""
+    return {deck_id for entry in _hibernated.values() for deck_id in entry["decks"] or ()}
+
+def hibernate(room_id: int) -> bool:
+    """Serialize the room and release its live state; runs inside the room's actor"""
+    if manager.active_connections.get(room_id) or spectators.watching(room_id):
+        return False
+    if clock.now() - _last_active.get(room_id, 0) < HIBERNATE_AFTER:
+        # Touched while this command was queued
+        return False
+    snapshot = state.export_room(room_id, copy_state=False)
+    if not snapshot:
+        return False
+    _hibernated[room_id] = {
+        "blob": state.compress_dump(state.dump_snapshot(snapshot)),
+        "at": clock.now(),
+        "decks": decks.room_decks.get(room_id),
+    }
+    state.drop_room(room_id)
+    return True
+
+def wake(room_id: int) -> bool:
+    """Restore a hibernated room with its timers resumed where they were paused"""
+    entry = _hibernated.pop(room_id, None)
+    if entry is None:
+        return False
+    snapshot = json.loads(zlib.decompress(entry["blob"]))
+    asleep = clock.now() - entry["at"]
+    for game in snapshot.values():
+        if "start_time" in game:
+            game["start_time"] += asleep
+    state.import_room(room_id, snapshot)
+    if entry["decks"] is not None:
+        decks.room_decks[room_id] = entry["decks"]
+    logger.info(f"[HIBERNATE] Room {room_id} woke up after {asleep:.0f}s")
+    return True
+
+def discard(room_id: int):
+    """Forget a room for good (deleted by the cleanup task)"""
+    _hibernated.pop(room_id, None)
+    _last_active.pop(room_id, None)
+
+async def hibernate_idle_rooms():
+    now = clock.now()
+    slept = 0
+    for room_id in list(state.local_room_ids()):
+        if manager.active_connections.get(room_id):
+            _last_active[room_id] = now
+            continue
+        # Rooms seen for the first time (e.g. restored from a checkpoint) get a full grace period
+        if now - _last_active.setdefault(room_id, now) < HIBERNATE_AFTER:
+            continue
+        if await actor.run(room_id, hibernate, room_id):
+            slept += 1
+    live = state.local_room_ids()
+    for room_id in [r for r in _last_active if r not in _hibernated and r not in live]:
+        del _last_active[room_id]
+    if slept:
+        logger.info(f"[HIBERNATE] {slept} idle rooms hibernated, {len(_hibernated)} asleep")
+
+async def hibernation_task():
+    while True:
+        await asyncio.sleep(HIBERNATE_CHECK_INTERVAL)
+        try:
+            await hibernate_idle_rooms()
+        except Exception as e:
+            logger.error(f"[HIBERNATE] Sweep failed: {e}", exc_info=True)
+
+def get_hibernation_stats():
+    return {
+        "rooms": len(_hibernated),
+        "bytes": sum(len(entry["blob"]) for entry in _hibernated.values()),
+    }
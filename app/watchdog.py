@@ -0,0 +1,153 @@
+"""
+Event-loop stall watchdog.
+A thread posts a heartbeat callback to the event loop every few milliseconds. When one hasn't
+run after WATCHDOG_THRESHOLD_MS, the loop is blocked (a synchronous database call, a CPU-heavy
+helper) and every room on the worker is frozen with it: the thread captures the loop thread's
+stack right then, and once the heartbeat finally runs the stall is recorded with its duration,
+the handler it happened in and the line of our code that was blocking.
+
+Configuration:
+    WATCHDOG_THRESHOLD_MS   stalls shorter than this are ignored; 0 turns the watchdog off
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from app import profiling
+
+logger = logging.getLogger(__name__)
+
+WATCHDOG_THRESHOLD = float(os.getenv("WATCHDOG_THRESHOLD_MS", "100")) / 1000
+WATCHDOG_MAX_RECORDS = 100
+
+# Modules whose frames wrap every handler, so they don't identify one
+_WRAPPERS = ("app.main", "app.sharding", "app.profiling", "app.game.actor")
+
+_loop = None
+_loop_thread = None
+_stop = None
+_lock = threading.Lock()
+# monotonic time the outstanding heartbeat was posted, None when none is outstanding
+_posted = None
+# Stall detected but not over yet
+_current = None
+# Newest stalls last
+_stalls = deque(maxlen=WATCHDOG_MAX_RECORDS)
+# handler -> {"stalls", "total", "max"}
+_by_handler = {}
+stats = {"stalls": 0, "stalled": 0.0, "max": 0.0}
+
+def _capture(posted: float):
+    """What the loop thread is running right now"""
+    frame = sys._current_frames().get(_loop_thread)
+    task = asyncio.current_task(_loop)
+    frames = []
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "?")
+        if not module.startswith("asyncio."):
+            frames.append((module, frame.f_code.co_qualname, frame.f_lineno))
+        frame = frame.f_back
+    frames.reverse()
+
+    ours = [f for f in frames if f[0].startswith("app.") and not f[0].startswith(_WRAPPERS)]
+    if ours:
+        handler = f"{ours[0][0]}:{ours[0][1]}"
+        blocking_at = "{}:{}:{}".format(*ours[-1])
+    else:
+        handler = task.get_coro().__qualname__ if task is not None else "(loop callback)"
+        blocking_at = "{}:{}:{}".format(*frames[-1]) if frames else None
+    return {
+        "posted": posted,
+        "at": time.time(),
+        "handler": handler,
+        "blocking_at": blocking_at,
+        "task": task.get_name() if task is not None else None,
+        "profile_label": profiling.label_of(task) if task is not None else None,
+        "stack": ["{}:{}:{}".format(*f) for f in frames],
+    }
+
+def _beat(posted: float):
+    """Runs on the loop: the heartbeat got through, closing the stall it was stuck behind, if any"""
+    global _posted, _current
+    lag = time.monotonic() - posted
+    with _lock:
+        _posted = None
+        stall, _current = _current, None
+    if stall is None or stall["posted"] != posted:
+        return
+    del stall["posted"]
+    stall["duration_ms"] = round(lag * 1000, 1)
+    _stalls.append(stall)
+    stats["stalls"] += 1
+    stats["stalled"] += lag
+    stats["max"] = max(stats["max"], lag)
+    handler = _by_handler.setdefault(stall["handler"], {"stalls": 0, "total": 0.0, "max": 0.0})
+    handler["stalls"] += 1
+    handler["total"] += lag
+    handler["max"] = max(handler["max"], lag)
+    logger.warning(
+        f"[WATCHDOG] Event loop blocked for {stall['duration_ms']} ms "
+        f"in {stall['handler']} at {stall['blocking_at']}"
+    )
+
+def _watch(stop: threading.Event, loop, interval: float):
+    global _posted, _current
+    while not stop.wait(interval):
+        now = time.monotonic()
+        with _lock:
+            posted = _posted
+            if posted is None:
+                _posted = now
+        if posted is None:
+            try:
+                loop.call_soon_threadsafe(_beat, now)
+            except RuntimeError:
+                # Loop closed
+                return
+        elif now - posted >= WATCHDOG_THRESHOLD and (_current is None or _current["posted"] != posted):
+            stall = _capture(posted)
+            with _lock:
+                # Only if the heartbeat is still stuck, otherwise the stall is already over
+                if _posted == posted:
+                    _current = stall
+
+def start():
+    """Start watching the running loop; call from the event loop"""
+    global _loop, _loop_thread, _stop
+    if not WATCHDOG_THRESHOLD or _stop is not None:
+        return
+    _loop = asyncio.get_running_loop()
+    _loop_thread = threading.get_ident()
+    _stop = threading.Event()
+    interval = min(WATCHDOG_THRESHOLD / 4, 0.05)
+    threading.Thread(target=_watch, args=(_stop, _loop, interval), name="loop-watchdog", daemon=True).start()
+    logger.info(f"[WATCHDOG] Watching the event loop for stalls over {WATCHDOG_THRESHOLD * 1000:.0f} ms")
+
+def stop():
+    global _stop
+    if _stop is not None:
+        _stop.set()
+        _stop = None
+
+def recent_stalls(limit: int = 20) -> list:
+    """Newest stalls first, with the captured stacks"""
+    return list(reversed(_stalls))[:limit]
+
+def get_watchdog_stats():
+    return {
+        "threshold_ms": WATCHDOG_THRESHOLD * 1000,
+        "stalls": stats["stalls"],
+        "stalled_ms": round(stats["stalled"] * 1000, 1),
+        "max_ms": round(stats["max"] * 1000, 1),
+        "by_handler": {
+            name: {
+                "stalls": h["stalls"],
+                "total_ms": round(h["total"] * 1000, 1),
+                "max_ms": round(h["max"] * 1000, 1),
+            }
+            for name, h in sorted(_by_handler.items(), key=lambda item: -item[1]["total"])
+        },
+    }